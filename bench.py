@@ -0,0 +1,275 @@
+"""Headless benchmarks for the editor's hot paths.
+
+    python bench.py -o results.json
+    python bench.py --compare baseline.json --threshold 0.15
+
+Runs without a display: SDL's offscreen video driver renders through EGL,
+so only an EGL library is needed (Mesa's llvmpipe is enough; on Debian
+and Ubuntu install libegl1). Set SDL_VIDEODRIVER=x11 to run against a
+real or Xvfb display instead. Each benchmark is repeated and the median
+is reported; with --compare the run fails if any median is slower than
+the baseline by more than the threshold. bench_baseline.json holds the
+numbers of the last recorded run.
+"""
+import ctypes.util
+import os
+import sys
+
+# Must be set before Kivy is imported
+os.environ.setdefault('SDL_VIDEODRIVER', 'offscreen')
+os.environ.setdefault('KIVY_NO_ARGS', '1')
+os.environ.setdefault('KIVY_NO_CONSOLELOG', '1')
+
+
+def _display_problem():
+    """Why no GL window can be opened with the chosen video driver, or None.
+
+    SDL exits the process without a useful message when it can't create
+    a GL context, so the likely causes are checked before Kivy loads.
+    """
+    driver = os.environ['SDL_VIDEODRIVER']
+    if driver == 'dummy':
+        return "the dummy SDL video driver has no GL context; use SDL_VIDEODRIVER=offscreen"
+    if driver == 'offscreen' and ctypes.util.find_library('EGL') is None:
+        return "the offscreen SDL video driver needs an EGL library (e.g. libegl1)"
+    if driver == 'x11' and not os.environ.get('DISPLAY'):
+        return "SDL_VIDEODRIVER=x11 but DISPLAY is not set; start Xvfb or use offscreen"
+    return None
+
+
+if __name__ == '__main__' and _display_problem():
+    sys.exit(f"bench.py: cannot open a window: {_display_problem()}")
+
+from kivy.config import Config
+
+# Deliver scanner results as fast as possible instead of once per frame
+Config.set('graphics', 'maxfps', '0')
+
+import argparse
+import json
+import platform
+import shutil
+import statistics
+import tempfile
+import time
+
+from kivy.clock import Clock
+from kivy.core.window import Window
+from kivy.uix.widget import Widget
+
+from document import Document
+from editor import EditorInput
+from file_tree import NodeTable
+from large_file import MappedFile
+from scanner import DirectoryScanner
+from settings import Settings
+from stats import DocumentStats
+from theme import Theme
+
+BENCHMARKS = {}
+
+
+def benchmark(name):
+    def register(function):
+        BENCHMARKS[name] = function
+        return function
+    return register
+
+
+class Workspace:
+    """Temporary files shared by the benchmarks, created on first use."""
+
+    def __init__(self):
+        self.root = tempfile.mkdtemp(prefix='cassata-bench-')
+        self._trees = {}
+        self._large_file = None
+
+    def tree(self, entries, per_directory=100):
+        path = self._trees.get(entries)
+        if path is None:
+            path = self._trees[entries] = os.path.join(self.root, f"tree-{entries}")
+            for directory in range(entries // per_directory):
+                directory_path = os.path.join(path, f"dir{directory // 10}", f"sub{directory}")
+                os.makedirs(directory_path)
+                for index in range(per_directory - 1):
+                    open(os.path.join(directory_path, f"file{index}.py"), 'w').close()
+        return path
+
+    def large_file(self, size=64 * 1024 * 1024):
+        if self._large_file is None:
+            self._large_file = os.path.join(self.root, 'large.log')
+            line = b'2024-01-01 12:00:00 INFO worker-3 request handled in 12 ms status=200\n'
+            with open(self._large_file, 'wb') as target:
+                block = line * (1024 * 1024 // len(line))
+                for _ in range(size // len(block)):
+                    target.write(block)
+        return self._large_file
+
+    def cleanup(self):
+        shutil.rmtree(self.root, ignore_errors=True)
+
+
+@benchmark('keystroke_replay')
+def keystroke_replay(workspace):
+    editor = EditorInput(text='def main():\n    pass\n' * 2000)
+    editor.cursor = (0, 1000)
+    text = 'result = compute(value) + 1\n'
+    start = time.perf_counter()
+    for _ in range(20):
+        for char in text:
+            editor.insert_text(char)
+    return time.perf_counter() - start
+
+
+@benchmark('character_count')
+def character_count(workspace):
+    document = Document('lorem ipsum dolor sit amet\n' * 20000)
+    stats = DocumentStats(document)
+    start = time.perf_counter()
+    offset = len(document) // 2
+    for index in range(5000):
+        document.insert(offset + index, 'x ' if index % 2 else '\n')
+    stats.summary()
+    return time.perf_counter() - start
+
+
+@benchmark('config_reload')
+def config_reload(workspace):
+    path = os.path.join(workspace.root, 'bench.conf')
+    settings = Settings(path)
+    settings.load()
+    start = time.perf_counter()
+    for index in range(200):
+        with open(path, 'w') as target:
+            target.write(f"[Settings]\nbackground_color = #{index % 256:02x}2040\n")
+        # As the watcher does: the mtime may not have moved
+        settings.load(force=True)
+    return time.perf_counter() - start
+
+
+@benchmark('theme_apply')
+def theme_apply(workspace):
+    theme = Theme()
+    widgets = [Widget() for _ in range(5)]
+    for index, widget in enumerate(widgets):
+        theme.add_rect(f"rect{index}", widget)
+    colors = [f"#{value:06x}" for value in range(0, 0xffffff, 0x111111)]
+    start = time.perf_counter()
+    for _ in range(200):
+        for color in colors:
+            theme.apply(color)
+    return time.perf_counter() - start
+
+
+def _scan_tree(root):
+    table = NodeTable(root)
+    done = []
+
+    def on_batch(batch):
+        for path, entries, mtime, inode in batch:
+            index = table.find(path)
+            if index != -1 and entries is not None:
+                table.set_children(index, entries)
+            done.append(path)
+
+    scanner = DirectoryScanner(on_batch)
+    directories = sum(1 for _ in os.walk(root))
+    start = time.perf_counter()
+    scanner.scan(root, max_depth=64)
+    while len(done) < directories:
+        Clock.tick()
+    return time.perf_counter() - start
+
+
+@benchmark('explorer_scan_10k')
+def explorer_scan_10k(workspace):
+    return _scan_tree(workspace.tree(10000))
+
+
+@benchmark('explorer_scan_100k')
+def explorer_scan_100k(workspace):
+    return _scan_tree(workspace.tree(100000))
+
+
+@benchmark('large_file_open')
+def large_file_open(workspace):
+    path = workspace.large_file()
+    start = time.perf_counter()
+    mapped = MappedFile(path)
+    # First screen, then wait for the full line index
+    for line in range(60):
+        mapped.get_line(line)
+    while not mapped.indexed:
+        time.sleep(0.001)
+    mapped.get_line(mapped.line_count() // 2)
+    elapsed = time.perf_counter() - start
+    mapped.close()
+    return elapsed
+
+
+def run(names, repeat):
+    workspace = Workspace()
+    results = {}
+    try:
+        for name in names:
+            runs = [BENCHMARKS[name](workspace) for _ in range(repeat)]
+            results[name] = {'median': statistics.median(runs), 'min': min(runs), 'runs': runs}
+            print(f"{name:24} median {results[name]['median'] * 1000:9.2f} ms"
+                  f"  min {results[name]['min'] * 1000:9.2f} ms")
+    finally:
+        workspace.cleanup()
+    return results
+
+
+def compare(results, baseline, threshold):
+    """Print the change per benchmark; return the names that regressed."""
+    regressions = []
+    for name, result in results.items():
+        previous = baseline.get('results', {}).get(name)
+        if previous is None:
+            continue
+        change = result['median'] / previous['median'] - 1
+        marker = ''
+        if change > threshold:
+            regressions.append(name)
+            marker = '  REGRESSION'
+        print(f"{name:24} {change * 100:+7.1f}%{marker}")
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Headless editor benchmarks')
+    parser.add_argument('names', nargs='*', help='benchmarks to run (default: all)')
+    parser.add_argument('-o', '--output', help='write results as JSON to this file')
+    parser.add_argument('-r', '--repeat', type=int, default=5)
+    parser.add_argument('--compare', help='baseline JSON to compare against')
+    parser.add_argument('--threshold', type=float, default=0.10,
+                        help='allowed slowdown before failing, e.g. 0.10 for 10%%')
+    args = parser.parse_args(argv)
+    if Window is None:
+        parser.exit(2, "bench.py: Kivy could not create a window\n")
+
+    names = args.names or list(BENCHMARKS)
+    unknown = [name for name in names if name not in BENCHMARKS]
+    if unknown:
+        parser.error(f"unknown benchmarks: {', '.join(unknown)}")
+    results = run(names, args.repeat)
+
+    if args.output:
+        with open(args.output, 'w') as target:
+            json.dump({
+                'meta': {'python': sys.version.split()[0], 'platform': platform.platform(),
+                         'time': time.strftime('%Y-%m-%dT%H:%M:%S')},
+                'results': results,
+            }, target, indent=2)
+    if args.compare:
+        with open(args.compare) as source:
+            regressions = compare(results, json.load(source), args.threshold)
+        if regressions:
+            print(f"Regressed beyond {args.threshold:.0%}: {', '.join(regressions)}")
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,74 @@
+"""Planning edits at several carets at once.
+
+Carets are `(start, end)` document ranges, empty for a plain caret. An
+edit function maps a range to one `(offset, length, text)` replacement,
+or None to leave it alone.
+"""
+
+
+def merge_ranges(ranges):
+    """Sort ranges and merge the ones that overlap or touch."""
+    merged = []
+    for start, end in sorted(ranges):
+        if merged and start <= merged[-1][1]:
+            if end > merged[-1][1]:
+                merged[-1] = (merged[-1][0], end)
+        else:
+            merged.append((start, end))
+    return merged
+
+
+def plan_edits(ranges, edit_for):
+    """Edits for merged `ranges` and the caret offsets after them.
+
+    The edits are ordered last to first, so each offset is still valid
+    when it is applied in order, e.g. by `Document.apply`.
+    """
+    edits = []
+    positions = []
+    shift = 0
+    for start, end in ranges:
+        edit = edit_for(start, end)
+        if edit is None:
+            positions.append(start + shift)
+            continue
+        offset, length, text = edit
+        edits.append(edit)
+        positions.append(offset + shift + len(text))
+        shift += len(text) - length
+    edits.reverse()
+    return edits, positions
+
+
+def edit_span(edits):
+    """The `(start, end)` range edited text ends up in, after all `edits`."""
+    start = end = None
+    for offset, length, text in edits:
+        if end is None:
+            start, end = offset, offset + len(text)
+            continue
+        if end >= offset + length:
+            end += len(text) - length
+        elif end > offset:
+            end = offset + len(text)
+        start = min(start, offset)
+        end = max(end, offset + len(text))
+    return start, end
+
+
+def insert_edit(text):
+    return lambda start, end: (start, end - start, text)
+
+
+def backspace_edit(start, end):
+    if start != end:
+        return start, end - start, ''
+    return (start - 1, 1, '') if start else None
+
+
+def delete_edit(length):
+    def edit(start, end):
+        if start != end:
+            return start, end - start, ''
+        return (start, 1, '') if start < length else None
+    return edit
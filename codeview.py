@@ -0,0 +1,173 @@
+from kivy.clock import Clock
+from kivy.graphics import Color, Rectangle
+from kivy.properties import ColorProperty, NumericProperty, StringProperty
+from kivy.uix.behaviors import FocusBehavior
+from kivy.uix.label import Label
+from kivy.uix.widget import Widget
+
+SCROLLBAR_WIDTH = 10
+SCROLL_LINES = 3
+
+
+class CodeView(FocusBehavior, Widget):
+    """Read-only text view that only renders the lines on screen.
+
+    `source` is anything with `line_count()` and `get_line(i)` (a
+    `Document` or a `MappedFile`). Only the visible lines plus
+    `margin_lines` on either side are fetched and kept decoded, and one
+    Label per visible row is reused while scrolling, so the cost of a frame
+    does not depend on the size of the file.
+    """
+    first_line = NumericProperty(0)
+    line_height = NumericProperty(20)
+    margin_lines = NumericProperty(20)
+    padding = NumericProperty(6)
+    font_size = NumericProperty(14)
+    font_name = StringProperty('RobotoMono-Regular')
+    foreground_color = ColorProperty([1, 1, 1, 1])
+    background_color = ColorProperty([0.12, 0.12, 0.12, 1])
+
+    def __init__(self, source, **kwargs):
+        super().__init__(**kwargs)
+        self.source = source
+        self._rows = []
+        # line number -> decoded text for the viewport and its margin
+        self._lines = {}
+        self._scroll_grab = False
+        self._refresh_trigger = Clock.create_trigger(self._refresh, 0)
+
+        with self.canvas.before:
+            self._background_color = Color(*self.background_color)
+            self._background = Rectangle()
+        with self.canvas.after:
+            Color(1, 1, 1, 0.25)
+            self._scroll_thumb = Rectangle()
+
+        self.bind(pos=self._refresh_trigger, size=self._refresh_trigger,
+                  first_line=self._refresh_trigger, line_height=self._refresh_trigger,
+                  background_color=self._update_background)
+        if hasattr(source, 'bind'):
+            source.bind(self.on_source_changed)
+        self._refresh_trigger()
+
+    def _update_background(self, instance, value):
+        self._background_color.rgba = value
+
+    def on_source_changed(self, *args):
+        """Drop decoded lines after the source changed or grew."""
+        self._lines.clear()
+        self._refresh_trigger()
+
+    def visible_lines(self):
+        return int(self.height // self.line_height) + 1
+
+    def scroll_to_line(self, line):
+        """Scroll so `line` (0-based) is near the top of the view."""
+        self.first_line = self._clamp(line - 3)
+
+    def _clamp(self, line):
+        last = max(0, self.source.line_count() - self.visible_lines() + 1)
+        return max(0, min(int(line), last))
+
+    def get_line(self, line):
+        text = self._lines.get(line)
+        if text is None:
+            text = self._lines[line] = self.source.get_line(line).expandtabs(4)
+        return text
+
+    def _refresh(self, dt=None):
+        count = self.source.line_count()
+        first = self._clamp(self.first_line)
+        if first != self.first_line:
+            self.first_line = first
+        visible = self.visible_lines()
+
+        # Keep exactly one recycled Label per visible row
+        while len(self._rows) < visible:
+            row = Label(font_name=self.font_name, font_size=self.font_size,
+                        color=self.foreground_color, size_hint=(None, None))
+            self._rows.append(row)
+            self.add_widget(row)
+        while len(self._rows) > visible:
+            self.remove_widget(self._rows.pop())
+
+        # Forget lines that scrolled well out of view, then decode the
+        # viewport and its margin
+        low = max(0, first - self.margin_lines)
+        high = min(count, first + visible + self.margin_lines)
+        for line in [line for line in self._lines if not low <= line < high]:
+            del self._lines[line]
+        for line in range(low, high):
+            self.get_line(line)
+
+        # Rough column limit so very long lines never get rasterized whole
+        columns = int(self.width / (self.font_size * 0.5)) + 1
+        top = self.top
+        for index, row in enumerate(self._rows):
+            line = first + index
+            row.text = self._lines[line][:columns] if line < count else ''
+            row.texture_update()
+            row.size = row.texture_size
+            row.pos = (self.x + self.padding,
+                       top - (index + 1) * self.line_height
+                       + (self.line_height - row.height) / 2)
+
+        self._background.pos = self.pos
+        self._background.size = self.size
+        self._update_scroll_thumb(first, count, visible)
+
+    def _update_scroll_thumb(self, first, count, visible):
+        if count <= visible:
+            self._scroll_thumb.size = (0, 0)
+            return
+        height = max(20, self.height * visible / count)
+        fraction = first / max(1, count - visible)
+        self._scroll_thumb.pos = (self.right - SCROLLBAR_WIDTH,
+                                  self.top - height - (self.height - height) * fraction)
+        self._scroll_thumb.size = (SCROLLBAR_WIDTH, height)
+
+    def _scroll_to_touch(self, touch):
+        # The scrollbar maps straight onto line numbers through the index
+        fraction = (self.top - touch.y) / max(1, self.height)
+        self.first_line = self._clamp(fraction * self.source.line_count())
+
+    def on_touch_down(self, touch):
+        if not self.collide_point(*touch.pos):
+            return super().on_touch_down(touch)
+        if 'button' in touch.profile and touch.button in ('scrollup', 'scrolldown'):
+            step = SCROLL_LINES if touch.button == 'scrollup' else -SCROLL_LINES
+            self.first_line = self._clamp(self.first_line + step)
+            return True
+        if touch.x >= self.right - SCROLLBAR_WIDTH:
+            touch.grab(self)
+            self._scroll_grab = True
+            self._scroll_to_touch(touch)
+            return True
+        return super().on_touch_down(touch)
+
+    def on_touch_move(self, touch):
+        if touch.grab_current is self and self._scroll_grab:
+            self._scroll_to_touch(touch)
+            return True
+        return super().on_touch_move(touch)
+
+    def on_touch_up(self, touch):
+        if touch.grab_current is self:
+            touch.ungrab(self)
+            self._scroll_grab = False
+            return True
+        return super().on_touch_up(touch)
+
+    def keyboard_on_key_down(self, window, keycode, text, modifiers):
+        key = keycode[1]
+        page = self.visible_lines() - 1
+        steps = {'up': -1, 'down': 1, 'pageup': -page, 'pagedown': page}
+        if key in steps:
+            self.first_line = self._clamp(self.first_line + steps[key])
+        elif key == 'home':
+            self.first_line = 0
+        elif key == 'end':
+            self.first_line = self._clamp(self.source.line_count())
+        else:
+            return super().keyboard_on_key_down(window, keycode, text, modifiers)
+        return True
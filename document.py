@@ -0,0 +1,395 @@
+import io
+import random
+from array import array
+from bisect import bisect_left
+from collections import namedtuple
+from contextlib import contextmanager
+
+# A single change to a document: `removed` was taken out at `offset` and
+# `inserted` was put in its place.
+Delta = namedtuple('Delta', 'offset removed inserted')
+
+ORIGINAL = 0
+ADDED = 1
+
+
+class _Piece:
+    """A run of text in one of the piece table buffers (also a treap node)."""
+    __slots__ = ('buf', 'start', 'length', 'newlines',
+                 'left', 'right', 'priority', 'size', 'lines')
+
+    def __init__(self, buf, start, length, newlines, priority=None):
+        self.buf = buf
+        self.start = start
+        self.length = length
+        self.newlines = newlines
+        self.left = None
+        self.right = None
+        self.priority = random.random() if priority is None else priority
+        self.size = length
+        self.lines = newlines
+
+
+def _update(node):
+    # Recompute the subtree totals from the children
+    size = node.length
+    lines = node.newlines
+    if node.left is not None:
+        size += node.left.size
+        lines += node.left.lines
+    if node.right is not None:
+        size += node.right.size
+        lines += node.right.lines
+    node.size = size
+    node.lines = lines
+
+
+def _merge(a, b):
+    if a is None:
+        return b
+    if b is None:
+        return a
+    if a.priority > b.priority:
+        a.right = _merge(a.right, b)
+        _update(a)
+        return a
+    b.left = _merge(a, b.left)
+    _update(b)
+    return b
+
+
+class PieceTable:
+    """Piece table storage kept in a treap ordered by document offset.
+
+    The original text is never copied; inserted text is appended to an
+    add buffer and referenced by pieces.  Insert, delete and offset/line
+    lookups are O(log n) in the number of pieces.
+    """
+
+    def __init__(self, text=''):
+        self._original = text
+        self._added = io.StringIO()
+        self._added_len = 0
+        # Newline positions per buffer so piece splits never rescan text
+        self._newlines = (
+            array('q', [i for i, ch in enumerate(text) if ch == '\n']),
+            array('q'),
+        )
+        self._root = None
+        if text:
+            self._root = _Piece(ORIGINAL, 0, len(text), len(self._newlines[ORIGINAL]))
+        # The piece that continuous typing keeps extending
+        self._append_piece = None
+        self._append_offset = -1
+
+    def __len__(self):
+        return self._root.size if self._root is not None else 0
+
+    def line_count(self):
+        return (self._root.lines if self._root is not None else 0) + 1
+
+    def _count_newlines(self, buf, start, length):
+        positions = self._newlines[buf]
+        return bisect_left(positions, start + length) - bisect_left(positions, start)
+
+    def _read(self, buf, start, length):
+        if buf == ORIGINAL:
+            return self._original[start:start + length]
+        self._added.seek(start)
+        return self._added.read(length)
+
+    def _split(self, node, offset):
+        """Split the subtree so the left part holds the first `offset` chars."""
+        if node is None:
+            return None, None
+        left_size = node.left.size if node.left is not None else 0
+        if offset <= left_size:
+            left, right = self._split(node.left, offset)
+            node.left = right
+            _update(node)
+            return left, node
+        offset -= left_size
+        if offset >= node.length:
+            left, right = self._split(node.right, offset - node.length)
+            node.right = left
+            _update(node)
+            return node, right
+        # The split point falls inside this piece, cut it in two
+        head_newlines = self._count_newlines(node.buf, node.start, offset)
+        tail = _Piece(node.buf, node.start + offset, node.length - offset,
+                      node.newlines - head_newlines, node.priority)
+        tail.right = node.right
+        node.right = None
+        node.length = offset
+        node.newlines = head_newlines
+        _update(tail)
+        _update(node)
+        return node, tail
+
+    def insert(self, offset, text):
+        """Insert `text` at `offset`."""
+        if not text:
+            return
+        offset = max(0, min(offset, len(self)))
+        start = self._added_len
+        self._added.seek(start)
+        self._added.write(text)
+        self._added_len += len(text)
+        positions = self._newlines[ADDED]
+        newlines = 0
+        index = text.find('\n')
+        while index != -1:
+            positions.append(start + index)
+            newlines += 1
+            index = text.find('\n', index + 1)
+
+        if offset == self._append_offset:
+            self._extend_append_piece(offset, len(text), newlines)
+        else:
+            piece = _Piece(ADDED, start, len(text), newlines)
+            left, right = self._split(self._root, offset)
+            self._root = _merge(_merge(left, piece), right)
+            self._append_piece = piece
+        self._append_offset = offset + len(text)
+
+    def _extend_append_piece(self, offset, length, newlines):
+        # Typing at the end of the last inserted piece: grow it in place and
+        # fix up the totals on the path down instead of adding a new piece
+        node = self._root
+        while True:
+            node.size += length
+            node.lines += newlines
+            left_size = node.left.size if node.left is not None else 0
+            if offset <= left_size:
+                node = node.left
+            elif offset <= left_size + node.length:
+                break
+            else:
+                offset -= left_size + node.length
+                node = node.right
+        node.length += length
+        node.newlines += newlines
+
+    def delete(self, offset, length):
+        """Remove `length` chars at `offset` and return the removed text."""
+        offset = max(0, min(offset, len(self)))
+        length = max(0, min(length, len(self) - offset))
+        if not length:
+            return ''
+        left, rest = self._split(self._root, offset)
+        middle, right = self._split(rest, length)
+        removed = []
+        self._collect(middle, 0, length, removed)
+        self._root = _merge(left, right)
+        self._append_piece = None
+        self._append_offset = -1
+        return ''.join(removed)
+
+    def _collect(self, node, start, end, out):
+        # Append the text in [start, end) of this subtree to `out`
+        if node is None or start >= end:
+            return
+        left_size = node.left.size if node.left is not None else 0
+        if start < left_size:
+            self._collect(node.left, start, min(end, left_size), out)
+        piece_start = max(start - left_size, 0)
+        piece_end = min(end - left_size, node.length)
+        if piece_start < piece_end:
+            out.append(self._read(node.buf, node.start + piece_start,
+                                  piece_end - piece_start))
+        right_base = left_size + node.length
+        if end > right_base:
+            self._collect(node.right, max(start - right_base, 0), end - right_base, out)
+
+    def get_text(self, start=0, end=None):
+        size = len(self)
+        end = size if end is None else min(end, size)
+        start = max(0, start)
+        out = []
+        self._collect(self._root, start, end, out)
+        return ''.join(out)
+
+    def line_start(self, line):
+        """Return the offset of the first char of `line` (0-based)."""
+        if line <= 0 or self._root is None:
+            return 0
+        if line > self._root.lines:
+            return len(self)
+        # Find the piece holding the line-th newline
+        node = self._root
+        base = 0
+        while True:
+            left_lines = node.left.lines if node.left is not None else 0
+            left_size = node.left.size if node.left is not None else 0
+            if line <= left_lines:
+                node = node.left
+            elif line <= left_lines + node.newlines:
+                line -= left_lines
+                base += left_size
+                positions = self._newlines[node.buf]
+                index = bisect_left(positions, node.start) + line - 1
+                return base + positions[index] - node.start + 1
+            else:
+                line -= left_lines + node.newlines
+                base += left_size + node.length
+                node = node.right
+
+    def line_of_offset(self, offset):
+        """Return the 0-based line containing `offset`."""
+        offset = max(0, min(offset, len(self)))
+        node = self._root
+        line = 0
+        while node is not None:
+            left_size = node.left.size if node.left is not None else 0
+            if offset < left_size:
+                node = node.left
+                continue
+            if node.left is not None:
+                line += node.left.lines
+            offset -= left_size
+            if offset <= node.length:
+                return line + self._count_newlines(node.buf, node.start, offset)
+            line += node.newlines
+            offset -= node.length
+            node = node.right
+        return line
+
+
+class Document:
+    """Editable text document backed by a piece table.
+
+    Listeners registered with `bind` are called with a `Delta` after each
+    change, so they never have to look at the full text. Listeners
+    registered with `bind_changes` are called once per change with its
+    list of deltas: one for a plain edit, all of them for a `transaction`.
+    """
+
+    def __init__(self, text='', path=None):
+        self.path = path
+        self.version = 0
+        self.saved_version = 0
+        self._table = PieceTable(text)
+        self._listeners = []
+        self._change_listeners = []
+        self._depth = 0
+        self._batch = []
+
+    def __len__(self):
+        return len(self._table)
+
+    @property
+    def modified(self):
+        return self.version != self.saved_version
+
+    def mark_saved(self):
+        self.saved_version = self.version
+
+    def bind(self, callback):
+        self._listeners.append(callback)
+
+    def unbind(self, callback):
+        if callback in self._listeners:
+            self._listeners.remove(callback)
+
+    def bind_changes(self, callback):
+        self._change_listeners.append(callback)
+
+    def unbind_changes(self, callback):
+        if callback in self._change_listeners:
+            self._change_listeners.remove(callback)
+
+    def _emit(self, delta):
+        self.version += 1
+        for callback in list(self._listeners):
+            callback(delta)
+        if self._depth:
+            self._batch.append(delta)
+        elif self._change_listeners:
+            self._dispatch_changes([delta])
+
+    def _dispatch_changes(self, deltas):
+        for callback in list(self._change_listeners):
+            callback(deltas)
+
+    @contextmanager
+    def transaction(self):
+        """Group the edits made in the block into one change.
+
+        `bind` listeners still see each delta as it is made, since they
+        may read the text around it; `bind_changes` listeners are called
+        once, when the outermost transaction ends.
+        """
+        self._depth += 1
+        try:
+            yield self
+        finally:
+            self._depth -= 1
+            if not self._depth and self._batch:
+                deltas = self._batch
+                self._batch = []
+                self._dispatch_changes(deltas)
+
+    def apply(self, edits):
+        """Apply `(offset, length, text)` replacements in order, as one change.
+
+        Each offset is in the text left by the edits before it.
+        """
+        with self.transaction():
+            return [self.replace(offset, length, text) for offset, length, text in edits]
+
+    def line_count(self):
+        return self._table.line_count()
+
+    def line_start(self, line):
+        return self._table.line_start(line)
+
+    def line_of_offset(self, offset):
+        return self._table.line_of_offset(offset)
+
+    def get_text(self, start=0, end=None):
+        return self._table.get_text(start, end)
+
+    def get_line(self, line):
+        """Return the text of `line` without its trailing newline."""
+        start = self._table.line_start(line)
+        if line + 1 < self._table.line_count():
+            end = self._table.line_start(line + 1) - 1
+        else:
+            end = len(self._table)
+        return self._table.get_text(start, end)
+
+    def insert(self, offset, text):
+        if not text:
+            return None
+        offset = max(0, min(offset, len(self._table)))
+        self._table.insert(offset, text)
+        delta = Delta(offset, '', text)
+        self._emit(delta)
+        return delta
+
+    def delete(self, offset, length):
+        removed = self._table.delete(offset, length)
+        if not removed:
+            return None
+        delta = Delta(max(0, offset), removed, '')
+        self._emit(delta)
+        return delta
+
+    def replace(self, offset, length, text):
+        """Replace `length` chars at `offset` with `text` as one change."""
+        offset = max(0, min(offset, len(self._table)))
+        removed = self._table.delete(offset, length)
+        self._table.insert(offset, text)
+        if not removed and not text:
+            return None
+        delta = Delta(offset, removed, text)
+        self._emit(delta)
+        return delta
+
+    def set_text(self, text):
+        """Replace the whole contents, e.g. after loading a file."""
+        removed = self._table.get_text()
+        self._table = PieceTable(text)
+        delta = Delta(0, removed, text)
+        self._emit(delta)
+        return delta
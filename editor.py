@@ -0,0 +1,857 @@
+import re
+import time
+from collections import OrderedDict
+from functools import partial
+
+from kivy.clock import Clock
+from kivy.core.text.markup import MarkupLabel
+from kivy.graphics import Color, Rectangle
+from kivy.properties import AliasProperty, NumericProperty
+from kivy.uix.textinput import FL_IS_LINEBREAK, TextInput
+
+from carets import backspace_edit, delete_edit, edit_span, insert_edit, merge_ranges, plan_edits
+from document import Document
+from highlight import Highlighter, lexer_for, to_markup
+from line_layout import LazyLine, layout_cache
+from undo import DEFAULT_BUDGET, UndoHistory
+from watcher import get_watcher
+
+# Highlighted line textures kept for lines scrolling back into view
+CACHED_TEXTURES = 512
+# When the whole text is laid out with wrapping, only the logical lines
+# this close to the view or the cursor are wrapped right away; the rest
+# get rows estimated from an average character width, replaced by exact
+# ones over the next frames in steps of REWRAP_BUDGET seconds
+WRAP_MARGIN = 50
+REWRAP_BUDGET = 0.004
+
+_identifier_re = re.compile(r'\w+')
+
+
+class EditorInput(TextInput):
+    """TextInput whose contents live in a piece-table `Document`.
+
+    Every edit TextInput makes is mirrored into the document as a small
+    delta. `text` is read from the document (cached per version) and is no
+    longer dispatched on every keystroke; bind to `document` for changes.
+
+    Rows get a texture and a rectangle only when first drawn, and text is
+    measured and wrapped through the shared `layout_cache`. Laying out the
+    whole text with wrapping wraps only the lines near the view and the
+    cursor; the others start with estimated rows that are replaced in the
+    background, or as soon as they scroll into view.
+    """
+    # Bumped whenever the rows on screen are redrawn, e.g. for a gutter
+    layout_version = NumericProperty(0)
+
+    def __init__(self, document=None, **kwargs):
+        self._text_cache = (-1, '')
+        self._layout_key = None
+        self._row_height = 0
+        # Logical lines wrapped exactly by the next full layout
+        self._exact_lines = None
+        self._wrap_estimated = False
+        self._rewrap_event = None
+        # Row the background re-wrap continues from, and the layout it is for
+        self._rewrap_row = 0
+        self._rewrap_key = None
+        # Bumped when estimated rows are replaced, which no edit reports
+        self._wrap_generation = 0
+        # Extra carets as [anchor, offset], next to TextInput's own cursor
+        self.carets = []
+        self._column = None
+        self.document = document if document is not None else Document()
+        self.highlighter = None
+        self.highlighting_paused = False
+        self._highlight_textures = OrderedDict()
+        self.undo_budget = DEFAULT_BUDGET
+        self.history = UndoHistory(self.document, self.undo_budget)
+        super().__init__(**kwargs)
+        if document is not None and 'text' not in kwargs:
+            self._refresh_text(self.document.get_text())
+        # The initial text is not an undo step
+        self.history.clear()
+        self._initial_history = self.history
+
+    def open_file(self, path):
+        """Load a file into the document and follow changes made on disk."""
+        watcher = get_watcher()
+        if self.document.path:
+            watcher.unwatch(self.document.path, self.on_file_changed)
+        self.document.path = path
+        self.set_lexer(lexer_for(path))
+        self._load_file(path)
+        watcher.watch(path, self.on_file_changed)
+
+    def set_document(self, document, cursor=(0, 0), scroll=(0, 0), history=None):
+        """Show another document in this widget, e.g. when switching tabs.
+
+        Pass the `history` kept from when the document was last shown to
+        keep its undo steps. The history of the document shown before is
+        left attached to it for the caller to keep; only the one created
+        with the widget is detached.
+        """
+        watcher = get_watcher()
+        if self.document.path:
+            watcher.unwatch(self.document.path, self.on_file_changed)
+        self.document = document
+        self._text_cache = (-1, '')
+        self.clear_carets()
+        self.set_lexer(lexer_for(document.path) if document.path else None)
+        self._refresh_text(document.get_text())
+        if self._initial_history is not None:
+            # Nothing keeps the history made for the initial document; left
+            # attached it would record that document's edits a second time
+            self._initial_history.detach()
+            self._initial_history = None
+        self.history = history if history is not None else UndoHistory(document, self.undo_budget)
+        self.cursor = cursor
+        self.scroll_x, self.scroll_y = scroll
+        if document.path:
+            watcher.watch(document.path, self.on_file_changed)
+
+    def view_state(self):
+        """Cursor and scroll position, to restore with `set_document`."""
+        return self.cursor, (self.scroll_x, self.scroll_y)
+
+    def _load_file(self, path):
+        try:
+            with open(path, encoding='utf-8', errors='surrogateescape') as source:
+                text = source.read()
+        except OSError as error:
+            print(f"Cannot open {path}: {error}")
+            return
+        self.clear_carets()
+        self.text = text
+        self.document.mark_saved()
+        self.history.clear()
+        self.history.mark_saved()
+
+    def on_file_changed(self, path):
+        # Reload silently unless that would throw away unsaved edits
+        if self.document.modified:
+            print(f"{path} changed on disk, keeping unsaved edits")
+        else:
+            self._load_file(path)
+
+    def set_lexer(self, lexer):
+        """Highlight the document with `lexer`, or show plain text for None."""
+        if self.highlighter is not None:
+            self.highlighter.detach()
+            self.highlighter = None
+        self._highlight_textures.clear()
+        if lexer is not None:
+            self.highlighter = Highlighter(self.document, lexer)
+            # Highlighting works on whole document lines
+            self.do_wrap = False
+        self._trigger_update_graphics()
+
+    def pause_highlighting(self, paused):
+        """Draw plain text while paused; the highlighter keeps tracking edits."""
+        self.highlighting_paused = paused
+        self._trigger_update_graphics()
+
+    def font_key(self):
+        """The options text widths depend on, to key the layout cache."""
+        return (self.font_name, self.font_size, self.font_context, self.font_family,
+                self.text_language, self.base_direction, self.tab_width)
+
+    def measure_text(self, text):
+        return layout_cache.text_width(self.font_key(), text, self._measure)
+
+    def _measure(self, text):
+        self._get_line_options()
+        return self._label_cached.get_extents(text.replace('\t', ' ' * self.tab_width))[0]
+
+    def _get_text_width(self, text, tab_width, _label_cached):
+        if self.password or tab_width != self.tab_width:
+            return super()._get_text_width(text, tab_width, _label_cached)
+        return self.measure_text(text)
+
+    def _wrap_context(self):
+        padding = self.padding
+        width = self.width - padding[0] - padding[2]
+        font_key = self.font_key()
+        measure = partial(layout_cache.text_width, font_key, measure=self._measure)
+        return font_key, width, measure
+
+    def _split_smart(self, text):
+        if not self.multiline or not self.do_wrap or self.password:
+            return super()._split_smart(text)
+        # Wrap per logical line, so only lines whose text changed since
+        # the last layout at this width are measured and broken again
+        font_key, width, measure = self._wrap_context()
+        wrap = layout_cache.wrap
+        cached_wrap = layout_cache.cached_wrap
+        tokenize = self._tokenize
+        exact = self._exact_lines
+        text_lines = text.split('\n')
+        chars = 1
+        if exact is not None:
+            # Average character width, from the first line with any text
+            sample = next((line[:200] for line in text_lines if line.strip()), 'x')
+            chars = max(1, int(width * len(sample) // max(1, measure(sample))))
+        lines = []
+        flags = []
+        for index, line in enumerate(text_lines):
+            if exact is None or index in exact:
+                rows, row_flags = wrap(font_key, width, line, measure, tokenize)
+            else:
+                wrapped = cached_wrap(font_key, width, line)
+                if wrapped is not None:
+                    rows, row_flags = wrapped
+                else:
+                    # Same text, rows of about the right width; nothing measured
+                    rows = [line[start:start + chars]
+                            for start in range(0, len(line), chars)] or ['']
+                    row_flags = [0] * len(rows)
+                    self._wrap_estimated = True
+            lines.extend(rows)
+            if index:
+                flags.append(row_flags[0] | FL_IS_LINEBREAK)
+                flags.extend(row_flags[1:])
+            else:
+                flags.extend(row_flags)
+        return lines, flags
+
+    def _refresh_text(self, text, *largs):
+        self._get_line_options()
+        self._row_height = self._label_cached.get_extents('_')[1]
+        if len(largs) > 1 or not (self.multiline and self.do_wrap) or self.password:
+            super()._refresh_text(text, *largs)
+            return True
+
+        # Lay out the whole text, as TextInput does, but wrap exactly only
+        # around the line at the top of the view and the cursor's line
+        dy = self.line_height + self.line_spacing
+        flags = self._lines_flags
+        top_row = min(int(self.scroll_y // dy) if dy > 0 else 0, max(0, len(flags) - 1))
+        top_start = top_row
+        while top_start and not flags[top_start] & FL_IS_LINEBREAK:
+            top_start -= 1
+        top_line = flags[:top_start + 1].count(FL_IS_LINEBREAK)
+        cursor = self.cursor_index()
+        cursor_line = self.document.line_of_offset(min(cursor, len(self.document)))
+        visible = int(self.height // dy) + 1 if dy > 0 else 1
+        self._exact_lines = set()
+        for line in (top_line, cursor_line):
+            self._exact_lines.update(range(line - WRAP_MARGIN, line + visible + WRAP_MARGIN))
+        self._wrap_estimated = False
+        try:
+            lines, self._lines_flags = self._split_smart(text)
+        finally:
+            self._exact_lines = None
+        # Rectangles are made in `_draw_line`, for the rows actually drawn
+        self._lines_labels = [self._create_line_label(line) for line in lines]
+        self._lines_rects = [None] * len(lines)
+        self._lines[:] = lines
+        self._wrap_generation += 1
+        self.line_height = max(self._lines_labels[0].height, self._row_height)
+
+        # Keep the line at the top of the view in place
+        start = self._line_start_row(top_line)
+        if start != top_start and dy > 0:
+            self.scroll_y = max(0, self.scroll_y + (start - top_start) * dy)
+
+        row = self.cursor_row
+        self.cursor = self.get_cursor_from_index(cursor)
+        if self.cursor_row != row:
+            self.scroll_x = 0
+        self._trigger_update_graphics()
+        if self._wrap_estimated:
+            self._start_rewrap()
+        return True
+
+    def _line_start_row(self, line):
+        # Row where logical `line` starts: its line break flag
+        flags = self._lines_flags
+        row = 0
+        try:
+            for _ in range(line):
+                row = flags.index(FL_IS_LINEBREAK, row + 1)
+        except ValueError:
+            pass
+        return row
+
+    def _start_rewrap(self):
+        self._rewrap_row = 0
+        self._rewrap_key = self._layout_key
+        if self._rewrap_event is None:
+            self._rewrap_event = Clock.schedule_interval(self._rewrap_step, 0)
+
+    def _rewrap_step(self, dt):
+        """Replace estimated rows with exact ones for one frame's budget."""
+        if self._rewrap_key != self._layout_key:
+            self._rewrap_row = 0
+            self._rewrap_key = self._layout_key
+        self._rewrap_row = self._rewrap(self._rewrap_row, len(self._lines),
+                                        time.perf_counter() + REWRAP_BUDGET)
+        if self._rewrap_row >= len(self._lines):
+            self._rewrap_event.cancel()
+            self._rewrap_event = None
+
+    def _rewrap(self, row, stop, deadline=None):
+        """Wrap the logical lines starting from `row` until one reaches
+        `stop` or the deadline passes, replacing the rows that were only
+        estimated in one splice. Returns the row after the last line."""
+        lines = self._lines
+        flags = self._lines_flags
+        if not lines:
+            return row
+        # Edits may have moved the rows since the last step
+        row = min(row, len(lines) - 1)
+        while row and not flags[row] & FL_IS_LINEBREAK:
+            row -= 1
+        font_key, width, measure = self._wrap_context()
+        wrap = layout_cache.wrap
+        tokenize = self._tokenize
+        # Rows from the first changed line on; unchanged lines in between
+        # keep their labels so their textures survive
+        first = None
+        new_rows = []
+        new_flags = []
+        new_labels = []
+        changed_end = 0
+        while row < stop and row < len(lines):
+            end = row + 1
+            while end < len(lines) and not flags[end] & FL_IS_LINEBREAK:
+                end += 1
+            old_rows = lines[row:end]
+            rows, row_flags = wrap(font_key, width, ''.join(old_rows), measure, tokenize)
+            if len(rows) != len(old_rows) or any(a != b for a, b in zip(rows, old_rows)):
+                if first is None:
+                    first = row
+                new_rows.extend(rows)
+                new_flags.append(flags[row])
+                new_flags.extend(row_flags[1:])
+                new_labels.extend(self._create_line_label(text) for text in rows)
+                changed_end = end
+                changed_length = len(new_rows)
+            elif first is not None:
+                new_rows.extend(old_rows)
+                new_flags.extend(flags[row:end])
+                new_labels.extend(self._lines_labels[row:end])
+            row = end
+            if deadline is not None and time.perf_counter() > deadline:
+                break
+        if first is None:
+            return row
+        del new_rows[changed_length:], new_flags[changed_length:], new_labels[changed_length:]
+        self._replace_rows(first, changed_end, new_rows, new_flags, new_labels)
+        return row + len(new_rows) - (changed_end - first)
+
+    def _replace_rows(self, start, end, rows, flags, labels):
+        """Swap rows `start:end` for rows holding the same text."""
+        delta = len(rows) - (end - start)
+        col, cursor_row = self._cursor
+        if cursor_row >= end:
+            cursor_row += delta
+        elif cursor_row >= start:
+            # Same text, so the cursor keeps its offset into the region
+            offset = col
+            old_flags = self._lines_flags
+            for row in range(start, cursor_row):
+                offset += len(self._lines[row]) + bool(old_flags[row + 1] & FL_IS_LINEBREAK)
+            for index, text in enumerate(rows):
+                if offset <= len(text) or index == len(rows) - 1:
+                    col, cursor_row = offset, start + index
+                    break
+                offset -= len(text) + bool(flags[index + 1] & FL_IS_LINEBREAK)
+        # Keep what is on screen in place when rows above it change
+        dy = self.line_height + self.line_spacing
+        if dy > 0 and end <= int(self.scroll_y // dy):
+            self.scroll_y = max(0, self.scroll_y + delta * dy)
+        self._insert_lines(start, end, len(rows), flags, rows, labels, [None] * len(rows))
+        self._wrap_generation += 1
+        if (col, cursor_row) != self._cursor:
+            self._cursor = (col, cursor_row)
+            self.property('cursor').dispatch(self)
+        self._trigger_update_graphics()
+
+    def _create_line_label(self, text, hint=False):
+        if hint or self.password:
+            return super()._create_line_label(text, hint)
+        return LazyLine(self, text, self._row_height)
+
+    def _current_layout_key(self):
+        wrap_width = None
+        if self.multiline and self.do_wrap:
+            wrap_width = self.width - self.padding[0] - self.padding[2]
+        return (self.font_key(), tuple(self.padding), self.password,
+                self.password_mask, wrap_width)
+
+    def _update_text_options(self, *largs):
+        # Measured widths stay valid in the layout cache; without wrapping
+        # a resize only changes which rows are visible
+        key = self._current_layout_key()
+        if key != self._layout_key:
+            self._layout_key = key
+            super()._update_text_options(*largs)
+        else:
+            self._trigger_update_graphics()
+
+    def on_size(self, instance, value):
+        self._update_text_options()
+        self._refresh_hint_text()
+        self.scroll_x = self.scroll_y = 0
+
+    def _update_graphics(self, *largs):
+        if self._rewrap_event is not None:
+            # Rows about to be drawn are wrapped exactly before they show
+            dy = self.line_height + self.line_spacing
+            if dy > 0:
+                first = int(self.scroll_y // dy)
+                self._rewrap(first, first + int(self.height // dy) + 2)
+        super()._update_graphics(*largs)
+        if self.carets:
+            self._draw_carets()
+        self.layout_version += 1
+
+    def _draw_line(self, value, line_num, texture, *args):
+        # Only lines that are actually drawn get a highlighted texture
+        highlighted = None
+        if (self.highlighter is not None and not self.highlighting_paused
+                and value and not self.do_wrap):
+            highlighted = self._highlighted_texture(line_num, value)
+        if highlighted is not None:
+            texture = highlighted
+        elif isinstance(texture, LazyLine):
+            # First time this row is on screen
+            texture = super()._create_line_label(texture.text)
+            self._lines_labels[line_num] = texture
+        # The rectangle list comes second to last
+        rects = args[-2]
+        if rects[line_num] is None:
+            rects[line_num] = Rectangle()
+        return super()._draw_line(value, line_num, texture, *args)
+
+    def _update_graphics_selection(self):
+        # Selected rows on screen need a rectangle even if not drawn yet
+        rects = self._lines_rects
+        dy = self.line_height + self.line_spacing
+        if self._selection and dy > 0:
+            first = max(0, int(self.scroll_y // dy))
+            for row in range(first, min(len(rects), first + int(self.height // dy) + 2)):
+                if rects[row] is None:
+                    rects[row] = Rectangle()
+        super()._update_graphics_selection()
+
+    def _highlighted_texture(self, line_num, value):
+        if line_num >= self.document.line_count():
+            return None
+        text, tokens = self.highlighter.line_tokens(line_num)
+        if text != value or not tokens:
+            return None
+        markup = to_markup(text, tokens, self.tab_width)
+        texture = self._highlight_textures.get(markup)
+        if texture is None:
+            label = MarkupLabel(text=markup, **self._get_line_options())
+            label.refresh()
+            texture = self._highlight_textures[markup] = label.texture
+            if len(self._highlight_textures) > CACHED_TEXTURES:
+                self._highlight_textures.popitem(last=False)
+        else:
+            self._highlight_textures.move_to_end(markup)
+        return texture
+
+    def _get_document_text(self):
+        version, text = self._text_cache
+        if version != self.document.version:
+            text = self.document.get_text()
+            self._text_cache = (self.document.version, text)
+        return text
+
+    def _set_document_text(self, text):
+        if isinstance(text, bytes):
+            text = text.decode('utf8')
+        if self.replace_crlf:
+            text = text.replace('\r\n', '\n')
+        if self._get_document_text() == text:
+            return False
+        self.document.set_text(text)
+        self._text_cache = (self.document.version, text)
+        self._refresh_text(text)
+        self.cursor = self.get_cursor_from_index(len(text))
+        return True
+
+    text = AliasProperty(_get_document_text, _set_document_text, bind=(), cache=False)
+
+    def get_cursor_from_index(self, index):
+        """Return the (col, row) of the cursor from a text index."""
+        # TextInput moves the cursor before it reports the edit, so the
+        # index is bounded by the line list here rather than the document
+        if index <= 0:
+            return 0, 0
+        flags = self._lines_flags
+        lines = self._lines
+        if not lines:
+            return 0, 0
+
+        i = 0
+        for row, line in enumerate(lines):
+            count = i + len(line)
+            if flags[row] & FL_IS_LINEBREAK:
+                count += 1
+                i += 1
+            if count >= index:
+                return index - i, row
+            i = count
+        return len(lines[-1]), len(lines) - 1
+
+    def select_text(self, start, end):
+        if end < start:
+            raise Exception('end must be superior to start')
+        length = len(self.document)
+        self._selection_from = max(0, min(start, length))
+        self._selection_to = max(0, min(end, length))
+        self._selection_finished = True
+        self._update_selection(True)
+        self._update_graphics_selection()
+
+    def select_all(self):
+        self.select_text(0, len(self.document))
+
+    def _auto_indent(self, substring):
+        # Only look at the current line instead of the whole text
+        index = self.cursor_index()
+        if index > 0:
+            document = self.document
+            line_start = document.line_start(document.line_of_offset(index))
+            line = document.get_text(line_start, index)
+            substring += self.re_indent.match(line).group()
+        return substring
+
+    def _refresh_text_from_property(self, *largs):
+        if len(largs) > 1:
+            # Partial refreshes carry their own lines, the full text is unused
+            self._refresh_text('', *largs)
+        else:
+            super()._refresh_text_from_property(*largs)
+
+    # TextInput reports every edit through its undo bookkeeping, which is
+    # the one place that knows exactly what was inserted or removed. Undo
+    # itself is kept by `history` from the document deltas, so TextInput's
+    # own undo lists are never filled.
+
+    def _set_unredo_insert(self, ci, sci, substring, from_undo):
+        self.document.insert(ci, substring)
+
+    def _set_unredo_bkspc(self, ol_index, new_index, substring, from_undo, mode):
+        self.document.delete(new_index, len(substring))
+
+    def _set_unredo_delsel(self, a, b, substring, from_undo):
+        self.document.delete(a, b - a)
+
+    def _shift_lines(self, direction, rows=None, old_cursor=None, from_undo=False):
+        super()._shift_lines(direction, rows, old_cursor, from_undo)
+        self._undo.clear()
+        # Moving lines rewrites TextInput's line list directly, resync from it
+        text = TextInput._get_text(self)
+        if text != self._get_document_text():
+            self.document.set_text(text)
+
+    def reset_undo(self):
+        super().reset_undo()
+        # TextInput calls this from its constructor, before `history` exists
+        history = getattr(self, 'history', None)
+        if history is not None:
+            history.clear()
+
+    def do_undo(self):
+        self.clear_carets()
+        self.history.undo(self._apply_history_edit)
+
+    def do_redo(self):
+        self.clear_carets()
+        self.history.redo(self._apply_history_edit)
+
+    def _apply_history_edit(self, edits):
+        if len(edits) > 1:
+            # A multi-cursor or bulk step, applied as one change again
+            self.apply_edits(edits)
+            offset, length, text = edits[-1]
+            self.cursor = self._cursor_of(offset + len(text))
+            return
+        offset, length, text = edits[0]
+        # Through TextInput so only the touched lines are laid out again
+        if length:
+            self._selection_from = offset
+            self._selection_to = offset + length
+            self._selection = True
+            self.delete_selection(from_undo=True)
+        self.cursor = self.get_cursor_from_index(offset)
+        if text:
+            self.insert_text(text, from_undo=True)
+
+    def jump_to_saved(self, point=None):
+        """Undo or redo straight to a saved point, the latest by default."""
+        history = self.history
+        if not history.saved_points:
+            return
+        point = history.saved_points[-1] if point is None else point
+        # Many steps at once: edit the document and lay out the text once
+        history.jump(point, self.document.apply)
+        self._refresh_text(self.document.get_text())
+        self.cursor = self.get_cursor_from_index(len(self.document))
+
+    def set_undo_budget(self, budget):
+        """Cap the undo history of this and later documents at `budget` bytes."""
+        self.undo_budget = budget
+        self.history.budget = budget
+
+    def apply_edits(self, edits):
+        """Apply `(offset, length, text)` replacements in order, as one change.
+
+        Only the lines between the first and the last edit are laid out
+        again, so the cost follows the edits, not the document size.
+        """
+        if not edits:
+            return
+        document = self.document
+        start, end = edit_span(edits)
+        if self.multiline and self.do_wrap:
+            # Wrapped rows do not map to lines, lay out everything
+            document.apply(edits)
+            self._refresh_text(document.get_text())
+            return
+        shift = sum(len(text) - length for offset, length, text in edits)
+        first = document.line_of_offset(start)
+        old_last = document.line_of_offset(end - shift)
+        document.apply(edits)
+        last = document.line_of_offset(end)
+        if last + 1 < document.line_count():
+            line_end = document.line_start(last + 1) - 1
+        else:
+            line_end = len(document)
+        lines = document.get_text(document.line_start(first), line_end).split('\n')
+        flags = [0] + [FL_IS_LINEBREAK] * (len(lines) - 1)
+        self._refresh_text_from_property('insert', first, old_last, lines, flags, len(lines))
+
+    def replace_in_selection(self, old, new):
+        """Replace `old` with `new` in the selection, or everywhere without one.
+
+        All replacements are one change and one undo step; returns their count.
+        """
+        if not old:
+            return 0
+        start, end = self._primary_range()
+        if start == end:
+            start, end = 0, len(self.document)
+        text = self.document.get_text(start, end)
+        edits = []
+        index = text.find(old)
+        while index >= 0:
+            edits.append((start + index, len(old), new))
+            index = text.find(old, index + len(old))
+        if edits:
+            self.clear_carets()
+            self.cancel_selection()
+            # Last to first, so the offsets found above stay valid
+            edits.reverse()
+            self.apply_edits(edits)
+            self.cursor = self._cursor_of(start)
+        return len(edits)
+
+    def word_at_cursor(self):
+        """The identifier the cursor is in or right after, '' if none."""
+        document = self.document
+        index = self.cursor_index()
+        line = document.line_of_offset(index)
+        column = index - document.line_start(line)
+        for match in _identifier_re.finditer(document.get_line(line)):
+            if match.start() <= column <= match.end():
+                return match.group()
+        return ''
+
+    # Multi-cursor editing: every caret, the primary one included, is a
+    # document range. Edits at all of them are planned together and made
+    # with `apply_edits`, so typing at many carets is one change.
+
+    def _cursor_of(self, offset):
+        if self.multiline and self.do_wrap:
+            return self.get_cursor_from_index(offset)
+        line = self.document.line_of_offset(offset)
+        return offset - self.document.line_start(line), line
+
+    def _primary_range(self):
+        if self._selection and self._selection_from != self._selection_to:
+            return tuple(sorted((self._selection_from, self._selection_to)))
+        index = self.cursor_index()
+        return index, index
+
+    def add_caret(self, offset, anchor=None):
+        length = len(self.document)
+        offset = max(0, min(offset, length))
+        anchor = offset if anchor is None else max(0, min(anchor, length))
+        self.carets.append([anchor, offset])
+        self._trigger_update_graphics()
+
+    def clear_carets(self):
+        self._column = None
+        if self.carets:
+            self.carets = []
+            self._trigger_update_graphics()
+
+    def add_caret_line(self, step):
+        """Add a caret on the line above (-1) or below (1) the outermost one."""
+        document = self.document
+        offsets = [self.cursor_index()] + [offset for anchor, offset in self.carets]
+        offset = min(offsets) if step < 0 else max(offsets)
+        line = document.line_of_offset(offset)
+        column = offset - document.line_start(line)
+        line += step
+        if 0 <= line < document.line_count():
+            self.add_caret(document.line_start(line) + min(column, len(document.get_line(line))))
+
+    def select_column(self, first_line, last_line, start_column, end_column, primary_line=None):
+        """Select columns `start_column` to `end_column` on a range of lines.
+
+        Each line gets its own caret, clipped to the line; the one on
+        `primary_line`, the last by default, is TextInput's selection.
+        """
+        document = self.document
+        primary_line = last_line if primary_line is None else primary_line
+        self.carets = []
+        for line in range(first_line, last_line + 1):
+            line_start = document.line_start(line)
+            length = len(document.get_line(line))
+            anchor = line_start + min(start_column, length)
+            offset = line_start + min(end_column, length)
+            if line != primary_line:
+                self.carets.append([anchor, offset])
+                continue
+            self.cursor = self._cursor_of(offset)
+            if anchor != offset:
+                self.select_text(min(anchor, offset), max(anchor, offset))
+            else:
+                self.cancel_selection()
+        self._trigger_update_graphics()
+
+    def extend_column(self, step):
+        """Grow the column selection by a line up (-1) or down (1)."""
+        document = self.document
+        if self._column is None:
+            start, end = self._primary_range()
+            line = document.line_of_offset(start)
+            line_start = document.line_start(line)
+            end_column = start_column = start - line_start
+            if document.line_of_offset(end) == line:
+                end_column = end - line_start
+            self._column = [line, line, start_column, end_column]
+        column = self._column
+        column[1] = max(0, min(column[1] + step, document.line_count() - 1))
+        anchor_line, line, start_column, end_column = column
+        self.select_column(min(anchor_line, line), max(anchor_line, line),
+                           start_column, end_column, primary_line=line)
+        self._column = column
+
+    def _edit_carets(self, edit_for):
+        primary_start = self._primary_range()[0]
+        ranges = merge_ranges([self._primary_range()]
+                              + [tuple(sorted(caret)) for caret in self.carets])
+        primary = next(index for index, (start, end) in enumerate(ranges)
+                       if start <= primary_start <= end)
+        edits, positions = plan_edits(ranges, edit_for)
+        self.cancel_selection()
+        self.apply_edits(edits)
+        position = positions[primary]
+        self.cursor = self._cursor_of(position)
+        self._column = None
+        self.carets = [[offset, offset] for offset in sorted(set(positions) - {position})]
+        self._trigger_update_graphics()
+
+    def move_carets(self, step):
+        length = len(self.document)
+        offsets = [self.cursor_index()] + [offset for anchor, offset in self.carets]
+        offsets = [max(0, min(offset + step, length)) for offset in offsets]
+        self.cancel_selection()
+        self.cursor = self._cursor_of(offsets[0])
+        self._column = None
+        self.carets = [[offset, offset] for offset in sorted(set(offsets[1:]) - {offsets[0]})]
+        self._trigger_update_graphics()
+
+    def insert_text(self, substring, from_undo=False):
+        if self.carets and not from_undo:
+            self._edit_carets(insert_edit(substring))
+        else:
+            super().insert_text(substring, from_undo)
+
+    def keyboard_on_textinput(self, window, text):
+        if self.carets:
+            # Replaces the selections at every caret in one change
+            self._edit_carets(insert_edit(text))
+        else:
+            super().keyboard_on_textinput(window, text)
+
+    def keyboard_on_key_down(self, window, keycode, text, modifiers):
+        # Alt+Up/Down adds a caret, with Shift it extends a column selection
+        key = keycode[1]
+        if 'alt' in modifiers and key in ('up', 'down') and self.multiline:
+            step = -1 if key == 'up' else 1
+            if 'shift' in modifiers:
+                self.extend_column(step)
+            else:
+                self.add_caret_line(step)
+            return True
+        if self.carets:
+            if key == 'escape':
+                self.clear_carets()
+                return True
+            if key == 'backspace':
+                self._edit_carets(backspace_edit)
+                return True
+            if key == 'delete':
+                self._edit_carets(delete_edit(len(self.document)))
+                return True
+            if key in ('enter', 'numpadenter'):
+                self._edit_carets(insert_edit('\n'))
+                return True
+            if key in ('left', 'right'):
+                self.move_carets(-1 if key == 'left' else 1)
+                return True
+            if key in ('up', 'down', 'home', 'end', 'pageup', 'pagedown'):
+                self.clear_carets()
+        return super().keyboard_on_key_down(window, keycode, text, modifiers)
+
+    def on_touch_down(self, touch):
+        if self.carets and self.collide_point(*touch.pos) and not touch.is_mouse_scrolling:
+            self.clear_carets()
+        return super().on_touch_down(touch)
+
+    def _draw_carets(self):
+        first, end = self._visible_lines_range
+        if first >= end:
+            return
+        lines = self._lines
+        line_height = self.line_height
+        dy = line_height + self.line_spacing
+        left = self.x + self.padding[0] - self.scroll_x
+        top = self.top - self.padding[1] + self.scroll_y
+
+        def x_of(row, column):
+            return left + self._get_text_width(lines[row][:column], self.tab_width,
+                                               self._label_cached)
+
+        carets = []
+        selections = []
+        for anchor, offset in self.carets:
+            col, row = self._cursor_of(offset)
+            if first <= row < end:
+                carets.append((col, row))
+            if anchor == offset:
+                continue
+            start_col, start_row = self._cursor_of(min(anchor, offset))
+            end_col, end_row = self._cursor_of(max(anchor, offset))
+            for sel_row in range(max(start_row, first), min(end_row + 1, end)):
+                x0 = x_of(sel_row, start_col if sel_row == start_row else 0)
+                x1 = x_of(sel_row, end_col if sel_row == end_row else len(lines[sel_row]))
+                selections.append((x0, top - sel_row * dy - line_height, x1 - x0))
+
+        canvas = self.canvas
+        canvas.add(Color(*self.selection_color))
+        for x, y, width in selections:
+            canvas.add(Rectangle(pos=(x, y), size=(width, line_height)))
+        canvas.add(Color(*self.cursor_color))
+        for col, row in carets:
+            canvas.add(Rectangle(pos=(x_of(row, col), top - row * dy - line_height),
+                                 size=(self.cursor_width, line_height)))
@@ -0,0 +1,402 @@
+"""Runs extensions in a worker process so they can never stall the UI.
+
+Each extension lives in a directory under `extensions/` with a manifest:
+
+    extensions/word_count/extension.json
+        {"name": "word_count", "main": "main.py",
+         "activation": ["onOpen:*.py", "onCommand:word_count.show"]}
+
+Manifests are read in the editor, but an extension's code is only
+imported in the worker process when one of its activation events fires
+(`onStartup`, `onOpen:<glob>` or `onCommand:<name>`). The main module may
+define `activate(api)`, `deactivate()`, `on_open(document)`,
+`on_change(document, deltas)`, `on_close(document)` and
+`on_command(name, args)`. Documents in the worker are `Document` mirrors
+kept up to date from batched deltas; the full text is only sent once,
+when a document is opened.
+"""
+import fnmatch
+import importlib.util
+import json
+import os
+import queue
+import threading
+import time
+import traceback
+from collections import deque, namedtuple
+from functools import partial
+
+from kivy.clock import Clock
+
+from document import Document
+from frame_stats import RingBuffer
+from workers import get_context
+
+EXTENSIONS_DIR = 'extensions'
+MANIFEST = 'extension.json'
+# Deltas are collected for this long before they are sent as one message
+BATCH_INTERVAL = 0.05
+# Latency samples kept per extension
+LATENCY_SAMPLES = 256
+# How long a stopped worker gets to deactivate before it is terminated
+STOP_TIMEOUT = 1.0
+
+Manifest = namedtuple('Manifest', 'name main activation')
+
+# Messages are plain tuples with a short tag first. Editor to worker:
+#   ('activate', name, main_path)
+#   ('open', doc_id, path, version, text)
+#   ('deltas', doc_id, version, [(offset, removed_length, inserted), ...], sent)
+#   ('close', doc_id)
+#   ('command', request_id, name, args, sent)
+#   ('stop',)
+# Worker to editor:
+#   ('activated', name) / ('error', name, text)
+#   ('message', name, text)
+#   ('result', request_id, value)
+#   ('timing', [(name, cpu_ms, latency_ms), ...])
+# `sent` is a time.monotonic() stamp; the clock is system wide, so the
+# worker can compare it with its own.
+
+
+def read_manifests(directory=EXTENSIONS_DIR):
+    manifests = []
+    try:
+        names = sorted(os.listdir(directory))
+    except OSError:
+        return manifests
+    for name in names:
+        path = os.path.join(directory, name, MANIFEST)
+        if not os.path.isfile(path):
+            continue
+        try:
+            with open(path) as source:
+                data = json.load(source)
+            manifests.append(Manifest(
+                data.get('name', name),
+                os.path.join(directory, name, data.get('main', 'main.py')),
+                tuple(data.get('activation', ())),
+            ))
+        except (OSError, ValueError) as error:
+            print(f"Cannot read extension manifest {path}: {error}")
+    return manifests
+
+
+def matches_event(manifest, event):
+    for pattern in manifest.activation:
+        kind, _, argument = pattern.partition(':')
+        if pattern == event:
+            return True
+        if kind == 'onOpen' and event.startswith('onOpen:'):
+            if fnmatch.fnmatch(os.path.basename(event[7:]), argument):
+                return True
+    return False
+
+
+class ExtensionApi:
+    """What an extension gets in `activate(api)`; lives in the worker."""
+
+    def __init__(self, name, connection):
+        self.name = name
+        self._connection = connection
+
+    def show_message(self, text):
+        self._connection.send(('message', self.name, text))
+
+
+def _worker_main(connection):
+    """Message loop of the worker process."""
+    extensions = {}
+    documents = {}
+    timings = []
+
+    def call(name, module, handler, *args, sent=None):
+        function = getattr(module, handler, None)
+        if function is None:
+            return None
+        cpu = time.thread_time()
+        try:
+            return function(*args)
+        except Exception:
+            connection.send(('error', name, traceback.format_exc()))
+            return None
+        finally:
+            cpu_ms = (time.thread_time() - cpu) * 1000
+            latency_ms = (time.monotonic() - sent) * 1000 if sent is not None else 0.0
+            timings.append((name, cpu_ms, latency_ms))
+
+    backlog = deque()
+    while True:
+        try:
+            if not backlog:
+                backlog.append(connection.recv())
+            # Take everything already queued so a slow extension catches up
+            # with one call instead of falling further behind
+            while connection.poll():
+                backlog.append(connection.recv())
+        except (EOFError, OSError):
+            break
+        message = backlog.popleft()
+        timings = []
+        tag = message[0]
+        if tag == 'stop':
+            break
+        elif tag == 'activate':
+            name, main_path = message[1], message[2]
+            try:
+                spec = importlib.util.spec_from_file_location(f"cassata_ext_{name}", main_path)
+                module = importlib.util.module_from_spec(spec)
+                spec.loader.exec_module(module)
+            except Exception:
+                connection.send(('error', name, traceback.format_exc()))
+                continue
+            extensions[name] = module
+            call(name, module, 'activate', ExtensionApi(name, connection))
+            # Catch up on documents opened before the extension was active
+            for document in documents.values():
+                call(name, module, 'on_open', document)
+            connection.send(('activated', name))
+        elif tag == 'open':
+            doc_id, path, version, text = message[1:]
+            document = documents[doc_id] = Document(text, path)
+            document.version = version
+            for name, module in extensions.items():
+                call(name, module, 'on_open', document)
+        elif tag == 'deltas':
+            doc_id, version, deltas, sent = message[1:]
+            while backlog and backlog[0][0] == 'deltas' and backlog[0][1] == doc_id:
+                version = backlog[0][2]
+                deltas = deltas + backlog.popleft()[3]
+            document = documents.get(doc_id)
+            if document is None:
+                continue
+            for offset, removed_length, inserted in deltas:
+                document.replace(offset, removed_length, inserted)
+            document.version = version
+            for name, module in extensions.items():
+                call(name, module, 'on_change', document, deltas, sent=sent)
+        elif tag == 'close':
+            document = documents.pop(message[1], None)
+            if document is not None:
+                for name, module in extensions.items():
+                    call(name, module, 'on_close', document)
+        elif tag == 'command':
+            request_id, command, args, sent = message[1:]
+            result = None
+            for name, module in extensions.items():
+                value = call(name, module, 'on_command', command, args, sent=sent)
+                if value is not None:
+                    result = value
+            connection.send(('result', request_id, result))
+        if timings:
+            connection.send(('timing', timings))
+
+    for name, module in extensions.items():
+        call(name, module, 'deactivate')
+
+
+class ExtensionStats:
+    """CPU time and message latency of one extension."""
+
+    def __init__(self):
+        self.cpu_ms = 0.0
+        self.messages = 0
+        self.latencies = RingBuffer(LATENCY_SAMPLES)
+
+    def summary(self):
+        p50, p95 = self.latencies.percentiles(50, 95)
+        return (f"cpu {self.cpu_ms:.1f} ms over {self.messages} messages, "
+                f"latency p50 {p50:.1f} p95 {p95:.1f} ms")
+
+
+class ExtensionHost:
+    """Editor side of the extension worker process.
+
+    Nothing is started until an activation event matches a manifest.
+    Sending happens on a thread and replies are handed to the main thread
+    through a Clock trigger, so the UI never waits on the worker: a slow
+    extension only makes its own replies late.
+    """
+
+    def __init__(self, directory=EXTENSIONS_DIR, batch_interval=BATCH_INTERVAL,
+                 on_message=None):
+        self.manifests = read_manifests(directory)
+        self.on_message = on_message
+        self.stats = {manifest.name: ExtensionStats() for manifest in self.manifests}
+        self.activated = set()
+        self._process = None
+        self._connection = None
+        self._outgoing = None
+        self._incoming = deque()
+        self._documents = {}
+        self._listeners = {}
+        self._pending = {}
+        self._requests = {}
+        self._next_id = 0
+        self._flush_trigger = Clock.create_trigger(self._flush, batch_interval)
+        self._deliver_trigger = Clock.create_trigger(self._deliver, 0)
+
+    @property
+    def running(self):
+        return self._process is not None
+
+    def _ensure_worker(self):
+        if self._process is not None:
+            return
+        context = get_context()
+        parent, child = context.Pipe()
+        self._process = context.Process(target=_worker_main, args=(child,), daemon=True)
+        self._process.start()
+        child.close()
+        self._connection = parent
+        self._outgoing = queue.Queue()
+        threading.Thread(target=self._send_loop, args=(parent, self._outgoing),
+                         daemon=True).start()
+        threading.Thread(target=self._read_loop, args=(parent,), daemon=True).start()
+        for doc_id, document in self._documents.items():
+            self._send(('open', doc_id, document.path, document.version, document.get_text()))
+
+    def _send(self, message):
+        if self._outgoing is not None:
+            self._outgoing.put(message)
+
+    def _send_loop(self, connection, outgoing):
+        while True:
+            message = outgoing.get()
+            try:
+                connection.send(message)
+            except (OSError, ValueError):
+                return
+            if message[0] == 'stop':
+                return
+
+    def _read_loop(self, connection):
+        while True:
+            try:
+                self._incoming.append(connection.recv())
+            except (EOFError, OSError):
+                self._incoming.append(('exited',))
+                self._deliver_trigger()
+                return
+            self._deliver_trigger()
+
+    def fire(self, event):
+        """Activate every extension waiting for `event`."""
+        for manifest in self.manifests:
+            if manifest.name not in self.activated and matches_event(manifest, event):
+                self._ensure_worker()
+                self.activated.add(manifest.name)
+                self._send(('activate', manifest.name, manifest.main))
+
+    def attach(self, document):
+        """Mirror `document` into the worker; only deltas cross after that."""
+        doc_id = id(document)
+        if doc_id in self._documents:
+            return
+        self._documents[doc_id] = document
+        # Delta listeners are not told which document changed
+        listener = self._listeners[doc_id] = partial(self._on_delta, doc_id)
+        document.bind(listener)
+        if self.running:
+            self._send(('open', doc_id, document.path, document.version, document.get_text()))
+        if document.path:
+            self.fire(f"onOpen:{document.path}")
+
+    def detach(self, document):
+        doc_id = id(document)
+        if doc_id not in self._documents:
+            return
+        document.unbind(self._listeners.pop(doc_id))
+        # Batched edits go out while the document is still known
+        self._flush(0)
+        del self._documents[doc_id]
+        self._send(('close', doc_id))
+
+    def execute(self, command, args=(), callback=None):
+        """Run `command` in the extensions; `callback(result)` gets the reply."""
+        self.fire(f"onCommand:{command}")
+        if not self.running:
+            return
+        request_id = self._next_id = self._next_id + 1
+        self._requests[request_id] = callback
+        self._send(('command', request_id, command, tuple(args), time.monotonic()))
+
+    def _on_delta(self, doc_id, delta):
+        if not self.running:
+            return
+        deltas = self._pending.setdefault(doc_id, [])
+        offset, removed, inserted = delta
+        if deltas and not removed and deltas[-1][1] == 0:
+            # Continuous typing: extend the previous insertion
+            last_offset, _, last_inserted = deltas[-1]
+            if last_offset + len(last_inserted) == offset:
+                deltas[-1] = (last_offset, 0, last_inserted + inserted)
+                self._flush_trigger()
+                return
+        deltas.append((offset, len(removed), inserted))
+        self._flush_trigger()
+
+    def _flush(self, dt):
+        sent = time.monotonic()
+        for doc_id, deltas in self._pending.items():
+            document = self._documents.get(doc_id)
+            if deltas and document is not None:
+                self._send(('deltas', doc_id, document.version, deltas, sent))
+        self._pending = {}
+
+    def _deliver(self, dt):
+        while self._incoming:
+            message = self._incoming.popleft()
+            tag = message[0]
+            if tag == 'timing':
+                for name, cpu_ms, latency_ms in message[1]:
+                    stats = self.stats.setdefault(name, ExtensionStats())
+                    stats.cpu_ms += cpu_ms
+                    stats.messages += 1
+                    if latency_ms:
+                        stats.latencies.append(latency_ms)
+            elif tag == 'result':
+                callback = self._requests.pop(message[1], None)
+                if callback is not None:
+                    callback(message[2])
+            elif tag == 'message':
+                if self.on_message is not None:
+                    self.on_message(message[1], message[2])
+                else:
+                    print(f"[{message[1]}] {message[2]}")
+            elif tag == 'error':
+                print(f"Extension {message[1]} failed:\n{message[2]}")
+            elif tag == 'exited':
+                self._on_exited()
+
+    def _on_exited(self):
+        if self._process is None:
+            return
+        print("Extension host exited; extensions activate again on their next event")
+        self._process = None
+        self._outgoing = None
+        self._connection = None
+        self.activated.clear()
+        self._pending = {}
+        self._requests.clear()
+
+    def summary(self):
+        return '\n'.join(f"{name}: {stats.summary()}" for name, stats in sorted(self.stats.items()))
+
+    def close(self):
+        for doc_id, document in self._documents.items():
+            document.unbind(self._listeners.pop(doc_id))
+        self._documents.clear()
+        if self._process is None:
+            return
+        process = self._process
+        self._send(('stop',))
+        self._process = None
+        # Waited for on a thread, deactivate() may take a while
+        threading.Thread(target=_reap, args=(process,), daemon=True).start()
+
+
+def _reap(process):
+    process.join(STOP_TIMEOUT)
+    if process.is_alive():
+        process.terminate()
@@ -0,0 +1,226 @@
+import os
+from array import array
+
+IS_DIR = 1
+EXPANDED = 2
+LOADED = 4
+
+# Orphaned nodes tolerated before `compact` reclaims them
+COMPACT_AFTER = 1024
+
+
+class NodeTable:
+    """Flat, array-backed table of file tree nodes.
+
+    Node `i` is described by `names[i]`, `parent[i]`, `depth[i]` and the
+    bit flags in `flags[i]`. A directory's children are stored as one
+    contiguous block starting at `first_child[i]`, so no per-node objects
+    or widgets exist. A relisted directory moves to a new block and the
+    old one is reclaimed by `compact`. `rows` holds the node indices currently visible
+    (every ancestor expanded), in display order.
+    """
+
+    def __init__(self, root_path):
+        self.root_path = root_path
+        self.names = [os.path.basename(root_path.rstrip(os.sep)) or root_path]
+        self.parent = array('i', [-1])
+        self.depth = array('i', [0])
+        self.flags = bytearray([IS_DIR | EXPANDED])
+        self.first_child = array('i', [0])
+        self.child_count = array('i', [0])
+        self.rows = array('i')
+        # Nodes left behind by relisted directories
+        self._dead = 0
+
+    def __len__(self):
+        return len(self.names)
+
+    def is_dir(self, index):
+        return bool(self.flags[index] & IS_DIR)
+
+    def is_expanded(self, index):
+        return bool(self.flags[index] & EXPANDED)
+
+    def is_loaded(self, index):
+        return bool(self.flags[index] & LOADED)
+
+    def children(self, index):
+        start = self.first_child[index]
+        return range(start, start + self.child_count[index])
+
+    def path(self, index):
+        parts = []
+        while index > 0:
+            parts.append(self.names[index])
+            index = self.parent[index]
+        return os.path.join(self.root_path, *reversed(parts))
+
+    def find(self, path):
+        """Return the node index for `path`, or -1 if it is not loaded."""
+        rel = os.path.relpath(path, self.root_path)
+        index = 0
+        if rel == os.curdir:
+            return index
+        for part in rel.split(os.sep):
+            for child in self.children(index):
+                if self.names[child] == part:
+                    index = child
+                    break
+            else:
+                return -1
+        return index
+
+    def set_children(self, index, entries):
+        """Merge the listing of directory `index` into its block of nodes.
+
+        `entries` is an iterable of (name, is_dir). Directories sort before
+        files. Entries that were already listed keep their flags and
+        loaded subtree; new ones become new nodes and gone ones are
+        dropped. Returns the removed and inserted row ranges as
+        (row, removed_count, inserted_count) when the rows changed,
+        otherwise None. After a compaction every node index changes and
+        the change covers all rows, from row -1.
+        """
+        entries = [(name, bool(is_dir)) for name, is_dir in
+                   sorted(entries, key=lambda entry: (not entry[1], entry[0].lower()))]
+        names = self.names
+        flags = self.flags
+        old = self.children(index) if flags[index] & LOADED else range(0)
+        if [(names[child], bool(flags[child] & IS_DIR)) for child in old] == entries:
+            flags[index] |= LOADED
+            return None
+
+        row_change = None
+        if flags[index] & EXPANDED:
+            row_change = self._hide_descendants(index)
+
+        # The block is rebuilt at the end of the table; kept children move
+        # there with their flags, and their own blocks get the new parent
+        kept = {(names[child], bool(flags[child] & IS_DIR)): child for child in old}
+        start = len(names)
+        depth = self.depth[index] + 1
+        for entry in entries:
+            name, is_dir = entry
+            child = kept.pop(entry, None)
+            names.append(name)
+            self.parent.append(index)
+            self.depth.append(depth)
+            if child is None:
+                flags.append(IS_DIR if is_dir else 0)
+                self.first_child.append(0)
+                self.child_count.append(0)
+                continue
+            flags.append(flags[child])
+            self.first_child.append(self.first_child[child])
+            self.child_count.append(self.child_count[child])
+            if flags[child] & LOADED:
+                for grandchild in self.children(child):
+                    self.parent[grandchild] = len(names) - 1
+        self._dead += len(old) + sum(self._subtree_size(child) for child in kept.values())
+        self.first_child[index] = start
+        self.child_count[index] = len(entries)
+        flags[index] |= LOADED
+
+        if row_change is not None:
+            row, removed = row_change
+            row_change = row, removed, self._show_descendants(index, row)
+        if self._dead > COMPACT_AFTER and self._dead > len(names) // 2:
+            visible = len(self.rows)
+            if row_change is not None:
+                visible += row_change[1] - row_change[2]
+            self.compact()
+            return -1, visible, len(self.rows)
+        return row_change
+
+    def _subtree_size(self, index):
+        # Nodes below `index` that are stored in the table
+        if not self.flags[index] & LOADED:
+            return 0
+        return sum(1 + self._subtree_size(child) for child in self.children(index))
+
+    def compact(self):
+        """Drop the nodes of relisted blocks; every node gets a new index."""
+        mapping = {0: 0}
+        names = [self.names[0]]
+        parent = array('i', [-1])
+        depth = array('i', [0])
+        flags = bytearray([self.flags[0]])
+        first_child = array('i', [0])
+        child_count = array('i', [0])
+        # Breadth first, so each directory's children stay one block
+        order = [0]
+        for old in order:
+            new = mapping[old]
+            if not self.flags[old] & LOADED:
+                continue
+            first_child[new] = len(names)
+            child_count[new] = self.child_count[old]
+            for child in self.children(old):
+                mapping[child] = len(names)
+                names.append(self.names[child])
+                parent.append(new)
+                depth.append(self.depth[child])
+                flags.append(self.flags[child])
+                first_child.append(0)
+                child_count.append(0)
+                order.append(child)
+        self.names = names
+        self.parent = parent
+        self.depth = depth
+        self.flags = flags
+        self.first_child = first_child
+        self.child_count = child_count
+        self.rows = array('i', (mapping[index] for index in self.rows))
+        self._dead = 0
+
+    def row_of(self, index):
+        try:
+            return self.rows.index(index)
+        except ValueError:
+            return -1
+
+    def _visible_descendants(self, index, out):
+        for child in self.children(index):
+            out.append(child)
+            if self.flags[child] & EXPANDED:
+                self._visible_descendants(child, out)
+
+    def _show_descendants(self, index, row):
+        # Insert the visible subtree of `index` right after `row`
+        visible = array('i')
+        self._visible_descendants(index, visible)
+        self.rows[row + 1:row + 1] = visible
+        return len(visible)
+
+    def _hide_descendants(self, index):
+        row = self.row_of(index) if index else -1
+        if index and row == -1:
+            return None
+        depth = self.depth[index]
+        end = row + 1
+        rows = self.rows
+        while end < len(rows) and self.depth[rows[end]] > depth:
+            end += 1
+        del rows[row + 1:end]
+        return row, end - row - 1
+
+    def expand(self, index):
+        """Expand a directory; returns (row, removed, inserted) or None."""
+        if self.flags[index] & EXPANDED:
+            return None
+        self.flags[index] |= EXPANDED
+        row = self.row_of(index) if index else -1
+        if index and row == -1:
+            return None
+        return row, 0, self._show_descendants(index, row)
+
+    def collapse(self, index):
+        """Collapse a directory; returns (row, removed, inserted) or None."""
+        if not self.flags[index] & EXPANDED:
+            return None
+        change = self._hide_descendants(index)
+        self.flags[index] &= ~EXPANDED
+        if change is None:
+            return None
+        row, removed = change
+        return row, removed, 0
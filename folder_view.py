@@ -2,17 +2,65 @@ import os
 import kivy
 from kivy.app import App
 from kivy.uix.boxlayout import BoxLayout
-from kivy.uix.treeview import TreeView, TreeViewLabel
-from kivy.uix.scrollview import ScrollView
+from kivy.uix.behaviors import ButtonBehavior
+from kivy.uix.recycleview import RecycleView
+from kivy.uix.recycleview.views import RecycleDataViewBehavior
+from kivy.uix.recycleboxlayout import RecycleBoxLayout
 from kivy.uix.label import Label
 from kivy.clock import Clock
-from kivy.uix.button import Button
+from kivy.core.window import Window
+from kivy.properties import NumericProperty
 import threading
-from multiprocessing import Pool, Manager
+
+from codeview import CodeView
+from editor import EditorInput
+from extension_host import ExtensionHost
+from file_tree import NodeTable
+from large_file import LARGE_FILE_THRESHOLD, MappedFile
+from path_index import IGNORED_DIRS
+from quick_open import FuzzyFinder, QuickOpen
+from search import FindInFiles, ProjectSearch
+from scanner import DirectoryScanner
+from symbols import SymbolIndex, SymbolSearch
+from tree_cache import TreeCache, unpack_entries
+from watcher import get_watcher
 
 kivy.require('2.0.0')  # Ensure the right Kivy version is being used
 
+ROW_HEIGHT = 24
+
+
+class TreeRow(RecycleDataViewBehavior, ButtonBehavior, Label):
+    """A recycled row widget; only as many exist as fit on screen."""
+    node = NumericProperty(-1)
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.halign = 'left'
+        self.valign = 'middle'
+        self.shorten = True
+        self.bind(size=self._update_text_size)
+
+    def _update_text_size(self, instance, value):
+        self.text_size = self.size
+
+    def refresh_view_attrs(self, rv, index, data):
+        self.explorer = rv.explorer
+        return super().refresh_view_attrs(rv, index, data)
+
+    def on_press(self):
+        self.explorer.toggle_node(self.node)
+
+
+class TreeRecycleView(RecycleView):
+    def __init__(self, explorer, **kwargs):
+        self.explorer = explorer
+        super().__init__(**kwargs)
+
+
 class FileExplorer(BoxLayout):
+    __events__ = ('on_open_file',)
+
     def __init__(self, **kwargs):
         super().__init__(**kwargs)
         self.orientation = 'horizontal'
@@ -20,87 +68,293 @@ class FileExplorer(BoxLayout):
 
         self.explorer_layout = BoxLayout(orientation='vertical', size_hint=(None, 1), width=300)
 
-        # Create a TreeView to display the file system
-        self.treeview = TreeView(hide_root=True, indent_level=4, size_hint=(1, None), height=500)
-        self.treeview.bind(on_node_expand=self.on_node_expand)
-
-        # Add a scrollable area to the TreeView
-        self.scrollview = ScrollView(size_hint=(None, 1), width=300)
-        self.scrollview.add_widget(self.treeview)
+        # The node table holds the whole tree, the RecycleView only creates
+        # row widgets for what is visible and reuses them while scrolling
+        self.table = NodeTable(os.getcwd())
+        self.scanner = DirectoryScanner(self.on_scan_batch)
+        self.treeview = TreeRecycleView(self, size_hint=(None, 1), width=300)
+        self.treeview.viewclass = TreeRow
+        rows_layout = RecycleBoxLayout(
+            orientation='vertical', size_hint=(1, None),
+            default_size=(None, ROW_HEIGHT), default_size_hint=(1, None)
+        )
+        rows_layout.bind(minimum_height=rows_layout.setter('height'))
+        self.treeview.add_widget(rows_layout)
 
         # Create a simple file explorer UI
         self.explorer_layout.add_widget(Label(text="File Explorer", size_hint_y=None, height=40))
-        self.explorer_layout.add_widget(self.scrollview)
+        self.explorer_layout.add_widget(self.treeview)
 
         # Add the explorer to the main layout
         self.add_widget(self.explorer_layout)
-        self.add_widget(Label(text="Editor Content", size_hint=(1, 1)))  # Placeholder for your main editor
-
-        # Start a thread to load the file tree when the app starts
-        threading.Thread(target=self.load_file_tree, args=(os.getcwd(),)).start()
-
-    def load_file_tree(self, path):
-        """Load the directory structure into the TreeView."""
-        # This is called in a separate thread
-        with Manager() as manager:
-            directories = manager.list()  # Shared list between threads
-            with Pool() as pool:
-                pool.apply_async(self.fetch_subdirectories, args=(path, directories))
-                pool.close()
-                pool.join()
-
-            # Schedule UI update on the main thread
-            Clock.schedule_once(lambda dt: self.populate_treeview(path, directories))
-
-    def fetch_subdirectories(self, path, directories):
-        """Fetch subdirectories and files in a separate process."""
-        if not os.path.isdir(path):
-            return
+        self.editor_area = BoxLayout(size_hint=(1, 1))
+        self.editor_area.add_widget(Label(text="Editor Content"))  # Shown until a file is opened
+        self.add_widget(self.editor_area)
+        self.editor = None
+
+        # Show the cached tree right away and only rescan the directories
+        # that changed since the last run; without a cache, scan two levels
+        self.cache = TreeCache(self.table.root_path)
+        self.records = self.cache.load()
+        self._cache_dirty = False
+        get_watcher().watch(self.table.root_path, self.on_directory_changed)
+        if os.curdir in self.records:
+            self.load_cached(0)
+            snapshot = dict(self.records)
+            threading.Thread(target=self._validate_cache, args=(snapshot,), daemon=True).start()
+        else:
+            self.load_directory(0, max_depth=1)
+
+        # Quick open matches against every file path, seeded from the cache
+        self.finder = FuzzyFinder(on_new_directory=self._scan_new_directory)
+        self.finder.load_records(self.records)
+        self.quick_open = None
+        self._workspace_scanned = False
+        self.search = ProjectSearch(self.table.root_path)
+        self.find_in_files = None
+        # Python definitions, indexed in the background and kept current
+        # from the same directory events as the tree
+        self.symbols = SymbolIndex(self.table.root_path)
+        self.symbol_search = None
+
+        # Extensions run in their own process, started on first activation
+        self.extensions = ExtensionHost()
+
+    def on_open_file(self, path):
+        self.open_in_editor(path)
+
+    def open_in_editor(self, path, line=0):
+        """Show a file in the editor pane, memory-mapped if it is large."""
         try:
-            for item in os.listdir(path):
-                item_path = os.path.join(path, item)
-                if os.path.isdir(item_path):
-                    directories.append((item, item_path))  # Append directory to the shared list
-        except PermissionError:
-            print(f"Permission denied to access {path}")
-
-    def populate_treeview(self, path, directories):
-        """Populate the TreeView with the directories."""
-        self.treeview.clear_widgets()
-        root_node = self.treeview.add_node(TreeViewLabel(text=path))
-        
-        # Add directories to the TreeView
-        for item, item_path in directories:
-            dir_node = self.treeview.add_node(TreeViewLabel(text=item), parent=root_node)
-            self.add_subdirectories(item_path, dir_node)
-
-    def add_subdirectories(self, path, parent_node):
-        """Add subdirectories and files to the TreeView."""
-        threading.Thread(target=self._add_subdirectories_thread, args=(path, parent_node)).start()
-
-    def _add_subdirectories_thread(self, path, parent_node):
-        """Add subdirectories recursively in a separate thread."""
+            size = os.path.getsize(path)
+        except OSError as error:
+            print(f"Cannot open {path}: {error}")
+            return
+        self.close_editor()
+        if size >= LARGE_FILE_THRESHOLD:
+            # Large files are viewed read-only: nothing is loaded up front
+            # and only the lines on screen are ever decoded
+            self.editor = CodeView(MappedFile(path))
+            self.editor.scroll_to_line(line)
+        else:
+            self.editor = EditorInput()
+            self.editor.open_file(path)
+            self.editor.cursor = (0, line)
+            self.extensions.attach(self.editor.document)
+            # The file may sit in a collapsed or unwatched directory, so
+            # its saves are followed directly to keep its symbols current
+            get_watcher().watch(path, self.on_file_changed)
+        self.editor_area.clear_widgets()
+        self.editor_area.add_widget(self.editor)
+        self.editor.focus = True
+
+    def close_editor(self):
+        if isinstance(self.editor, CodeView):
+            self.editor.source.close()
+        elif isinstance(self.editor, EditorInput):
+            self.extensions.detach(self.editor.document)
+            if self.editor.document.path:
+                get_watcher().unwatch(self.editor.document.path, self.editor.on_file_changed)
+                get_watcher().unwatch(self.editor.document.path, self.on_file_changed)
+        self.editor = None
+
+    def show_quick_open(self):
+        if not self._workspace_scanned:
+            # Walk the whole workspace once so every path gets indexed; the
+            # results also land in the tree cache for the next start
+            self._workspace_scanned = True
+            self.scanner.scan(self.table.root_path, max_depth=64, skip=IGNORED_DIRS)
+        if self.quick_open is None:
+            self.quick_open = QuickOpen(self.finder, self.open_relative_path)
+        self.quick_open.open()
+
+    def open_relative_path(self, path):
+        self.dispatch('on_open_file', os.path.join(self.table.root_path, path))
+
+    def show_find_in_files(self):
+        if self.find_in_files is None:
+            self.find_in_files = FindInFiles(self.search, self.open_search_result)
+        self.find_in_files.open()
+
+    def open_search_result(self, path, line):
+        self.open_in_editor(path, line - 1)
+
+    def show_symbol_search(self):
+        if self.symbol_search is None:
+            self.symbol_search = SymbolSearch(self.symbols, self.open_symbol)
+        self.symbol_search.open()
+
+    def go_to_definition(self):
+        if not isinstance(self.editor, EditorInput):
+            return
+        name = self.editor.word_at_cursor()
+        if name:
+            self.symbols.find_definitions(name, self._show_definition,
+                                          path=self.editor.document.path)
+
+    def _show_definition(self, symbols):
+        if not symbols:
+            print("No definition found")
+            return
+        self.open_symbol(symbols[0])
+
+    def open_symbol(self, symbol):
+        editor = self.editor
+        if isinstance(editor, EditorInput) and editor.document.path == symbol.path:
+            offset = editor.document.line_start(symbol.line - 1) + symbol.column
+            editor.cursor = editor._cursor_of(offset)
+            editor.focus = True
+        else:
+            self.open_in_editor(symbol.path, symbol.line - 1)
+
+    def _row_data(self, index):
+        table = self.table
+        if table.is_dir(index):
+            marker = '- ' if table.is_expanded(index) else '+ '
+        else:
+            marker = '  '
+        indent = '    ' * (table.depth[index] - 1)
+        return {'text': indent + marker + table.names[index], 'node': index}
+
+    def apply_row_change(self, change):
+        """Mirror a (row, removed, inserted) change of the table into the view."""
+        if change is None:
+            return
+        row, removed, inserted = change
+        rows = self.table.rows
+        new_rows = [self._row_data(index) for index in rows[row + 1:row + 1 + inserted]]
+        data = self.treeview.data
+        if row >= 0:
+            data[row] = self._row_data(rows[row])
+        data[row + 1:row + 1 + removed] = new_rows
+
+    def toggle_node(self, index):
+        table = self.table
+        if not table.is_dir(index):
+            self.dispatch('on_open_file', table.path(index))
+            return
+        path = table.path(index)
+        if table.is_expanded(index):
+            self.apply_row_change(table.collapse(index))
+            get_watcher().unwatch(path, self.on_directory_changed)
+            return
+        self.apply_row_change(table.expand(index))
+        # Only expanded directories are watched, which keeps the number of
+        # inotify watches proportional to what is on screen
+        get_watcher().watch(path, self.on_directory_changed)
+        if table.is_loaded(index) or self.load_cached(index):
+            # Changes while the directory was collapsed went unwatched
+            if not self._is_current(path):
+                self.scanner.scan(path)
+        else:
+            self.load_directory(index)
+
+    def _relative(self, path):
+        return os.path.relpath(path, self.table.root_path)
+
+    def _is_current(self, path):
+        """Whether the cached listing of `path` still matches the directory."""
+        record = self.records.get(self._relative(path))
         try:
-            for item in os.listdir(path):
-                item_path = os.path.join(path, item)
-                if os.path.isdir(item_path):
-                    dir_node = self.treeview.add_node(TreeViewLabel(text=item), parent=parent_node)
-                    threading.Thread(target=self.add_subdirectories, args=(item_path, dir_node)).start()
-                else:
-                    self.treeview.add_node(TreeViewLabel(text=item), parent=parent_node)
-        except PermissionError:
-            print(f"Permission denied to access {path}")
-
-    def on_node_expand(self, instance, node):
-        """Load subdirectories when a directory node is expanded."""
-        if isinstance(node, TreeViewLabel):
-            text = node.text
-            path = os.path.join(os.getcwd(), text)  # Update path based on current working directory
-            self.add_subdirectories(path, node)
+            info = os.stat(path)
+        except OSError:
+            return False
+        return record is not None and record[:2] == (info.st_mtime_ns, info.st_ino)
+
+    def load_cached(self, index):
+        """Fill a directory from the on-disk cache; returns False if it is not cached."""
+        record = self.records.get(self._relative(self.table.path(index)))
+        if record is None:
+            return False
+        self.apply_row_change(self.table.set_children(index, unpack_entries(record[2])))
+        return True
+
+    def on_directory_changed(self, path):
+        """Relist a loaded directory after the watcher saw it change."""
+        self.scanner.scan(path)
+        self.symbols.update_directory(path)
+
+    def on_file_changed(self, path):
+        """Re-index the open file after it was saved or changed on disk."""
+        self.symbols.update([path])
+
+    def _validate_cache(self, records):
+        stale = self.cache.stale_paths(records)
+        if stale:
+            Clock.schedule_once(lambda dt: self._rescan(stale))
+
+    def _rescan(self, paths):
+        for path in paths:
+            self.scanner.scan(os.path.join(self.table.root_path, path))
+
+    def _scan_new_directory(self, path):
+        # A created or moved-in subtree, so quick open can match its files
+        self.scanner.scan(os.path.join(self.table.root_path, path), max_depth=64,
+                          skip=IGNORED_DIRS)
+
+    def save_cache(self):
+        if self._cache_dirty:
+            self.cache.save(self.records)
+            self._cache_dirty = False
+
+    def load_directory(self, index, max_depth=0):
+        """Queue a directory listing on the scanner's worker pool."""
+        self.scanner.scan(self.table.path(index), max_depth)
+
+    def on_scan_batch(self, batch):
+        """Add scanned directories to the table, called on the main thread."""
+        table = self.table
+        listings = []
+        for path, entries, mtime, inode in batch:
+            relative = self._relative(path)
+            listings.append((relative, entries))
+            self._cache_dirty = True
+            if entries is None:
+                self.records.pop(relative, None)
+                continue
+            self.records[relative] = (mtime, inode, entries)
+            index = table.find(path)
+            if index != -1:
+                self.apply_row_change(table.set_children(index, entries))
+        self.finder.update(listings)
+
 
 class FileExplorerApp(App):
     def build(self):
+        Window.bind(on_key_down=self._on_key_down)
         return FileExplorer()
 
+    def _on_key_down(self, window, key, scancode, codepoint, modifiers):
+        # Ctrl+P opens the quick-open palette, Ctrl+Shift+F searches files,
+        # Ctrl+T searches symbols and F12 goes to a definition
+        if codepoint == 'p' and 'ctrl' in modifiers:
+            self.root.show_quick_open()
+            return True
+        if codepoint in ('f', 'F') and 'ctrl' in modifiers and 'shift' in modifiers:
+            self.root.show_find_in_files()
+            return True
+        if codepoint == 't' and 'ctrl' in modifiers:
+            self.root.show_symbol_search()
+            return True
+        if key == 293:
+            self.root.go_to_definition()
+            return True
+        return False
+
+    def on_start(self):
+        self.root.extensions.fire('onStartup')
+        self.root.symbols.sync()
+
+    def on_stop(self):
+        self.root.close_editor()
+        self.root.save_cache()
+        self.root.search.close()
+        self.root.symbols.close()
+        extensions = self.root.extensions
+        if extensions.activated:
+            print(extensions.summary())
+        extensions.close()
+
+
 if __name__ == '__main__':
     FileExplorerApp().run()
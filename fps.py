@@ -1,181 +1,148 @@
-import os
-import configparser
-import cProfile
+# Imported first so the startup timeline covers the Kivy imports
+from startup import after_first_frame, trace
 from kivy.app import App
 from kivy.uix.boxlayout import BoxLayout
-from kivy.uix.textinput import TextInput
-from kivy.uix.label import Label
-from kivy.graphics import Color, Rectangle
 from kivy.clock import Clock
-from kivy.uix.anchorlayout import AnchorLayout
+from editor import EditorInput
+from frame_stats import REFRESH_INTERVAL, FrameStats
+from profiler import SamplingProfiler, bind_hotkey
+from settings import get_settings
+from theme import Theme
 
 # Define the configuration file path
 config_file_path = 'app_config.conf'
 
+trace.mark('imports')
+
 class TextInputApp(App):
 
     def on_start(self):
-        self.profile = cProfile.Profile()
-        self.profile.enable()
-
-        # Check if the config file exists, if not create it
-        if not os.path.exists(config_file_path):
-            self.create_default_config()
-
-        # Load the configuration initially
-        self.load_config()
-
-        # Schedule a check for config file changes every second
-        Clock.schedule_interval(self.check_config_update, 1)
-
-        # Start updating FPS if debug mode is enabled
-        if self.debug_mode:
-            Clock.schedule_interval(self.update_fps, 1 / 60.0)
+        # First frame and first keystroke complete the startup timeline
+        trace.install()
+        # Secondary panes are built after the first frame is drawn
+        after_first_frame(self.build_secondary_panes)
+
+        # Sampling profiler: off unless enabled in the settings or with F9
+        self.profiler = SamplingProfiler(self.settings['profile_dir'])
+        bind_hotkey(self.profiler)
+        if self.settings['profiling']:
+            self.profiler.start()
+
+        # Reload the settings whenever the file changes on disk
+        self.settings.watch()
+
+        # Record frame times in debug mode; the label is refreshed a few
+        # times per second rather than every frame
+        self.frame_stats = FrameStats()
+        if self.settings['debug_mode']:
+            self.frame_stats.start()
+            if self.settings['frame_stats_file']:
+                self.frame_stats.stream_to(self.settings['frame_stats_file'])
 
     def on_stop(self):
-        self.profile.disable()
-        self.profile.dump_stats('myapp.profile')
+        self.profiler.stop()
+        self.frame_stats.stop()
 
     def build(self):
         # Create the main layout
         layout = BoxLayout(orientation='vertical', padding=10, spacing=10)
 
-        # Set the background color to the loaded CSS color
-        with layout.canvas.before:
-            Color(*self.hex_to_rgb(self.bg_color))  # Convert CSS color to RGB
-            self.rect = Rectangle(size=layout.size, pos=layout.pos)
-
-        # Update rectangle size and position on resize
-        layout.bind(size=self._update_rect, pos=self._update_rect)
+        # The theme owns the background instructions and recolors them in place
+        self.theme = Theme()
+        self.theme.add_rect('background', layout)
 
         # Create a TextInput widget
-        self.text_input = TextInput(
+        self.text_input = EditorInput(
             text='Hello world', height=40, multiline=True
         )
         self.text_input.background_normal = ''  # Remove the background
         self.text_input.background_active = ''  # Remove the active background
-        self.text_input.background_color = self.hex_to_rgb(self.bg_color) + (1,)  # RGBA
 
-        # Create the bottom layout for character count
-        bottom_layout = BoxLayout(
-            orientation="horizontal", size_hint=(1, None), height=40, padding=[10, 5]
-        )
+        # The status bar and FPS overlay follow after the first frame
+        layout.add_widget(self.text_input)
+
+        self.root = layout  # Set the root widget to the layout
+        self.theme.bind(self.apply_palette)
+        self.update_colors()
+
+        trace.mark('build')
+        return layout
 
-        # Add canvas instructions for the gray border
-        with bottom_layout.canvas.before:
-            Color(0.7, 0.7, 0.7, 1)  # Gray color for the border
-            self.border_rect = Rectangle(size=(0, 0), pos=(0, 0))
+    def build_secondary_panes(self, dt):
+        """Add the status bar and FPS overlay once the editor is on screen."""
+        from kivy.uix.anchorlayout import AnchorLayout
 
-        bottom_layout.bind(size=self._update_border_rect, pos=self._update_border_rect)
+        from stats import DocumentStats
+        from status_bar import StatusBar
 
-        # Create the character count label
-        self.char_count_label = Label(
-            text="Characters: 0",
-            size_hint=(1, 1),
+        # Create the bottom layout for character count
+        bottom_layout = BoxLayout(
+            orientation="horizontal", size_hint=(1, None), height=40, padding=[10, 5]
         )
-        bottom_layout.add_widget(self.char_count_label)
 
-        # Bind the text input to update character count
-        self.text_input.bind(text=self.update_char_count)
+        # Gray border behind the bottom layout
+        self.theme.add_rect('border', bottom_layout, (0.7, 0.7, 0.7, 1))
 
-        # Add widgets to the layout
-        layout.add_widget(self.text_input)
-        layout.add_widget(bottom_layout)
+        # Status text is drawn from a glyph atlas, updates never rasterize
+        self.status_bar = StatusBar(size_hint=(1, 1), padding=0)
+        self.status_bar.add_field('stats', "Characters: 0")
+        bottom_layout.add_widget(self.status_bar)
+        self.root.add_widget(bottom_layout)
 
-        # Create the FPS label for debug mode
-        self.fps_label = Label(
-            text="FPS: 0", size_hint=(None, None), size=(100, 30),
-            color=(1, 1, 1, 1), halign='left', valign='middle'
-        )
-        self.fps_label.bind(size=self._update_fps_label_position)
+        # Update the character count from edit deltas
+        self.stats = DocumentStats(self.text_input.document)
+        self.stats.bind(self.update_char_count)
+        self.text_input.bind(selection_text=self.update_selection)
+        self.theme.bind(self.apply_status_palette)
 
-        if self.debug_mode:
+        if self.settings['debug_mode']:
             # Anchor the FPS label to the top-left corner
+            self.fps_bar = StatusBar(size_hint=(None, None), size=(640, 30), padding=0)
+            self.fps_bar.add_field('fps', "FPS: 0")
             fps_anchor = AnchorLayout(
                 anchor_x='left', anchor_y='top', size_hint=(1, 1)
             )
-            fps_anchor.add_widget(self.fps_label)
-            layout.add_widget(fps_anchor)
+            fps_anchor.add_widget(self.fps_bar)
+            self.root.add_widget(fps_anchor)
+            Clock.schedule_interval(self.update_fps, REFRESH_INTERVAL)
+        trace.mark('secondary panes')
 
-        self.root = layout  # Set the root widget to the layout
-        self.update_colors()
+    def update_char_count(self, stats):
+        self.status_bar.set('stats', stats.summary())
 
-        return layout
-
-    def _update_rect(self, instance, value):
-        self.rect.size = instance.size
-        self.rect.pos = instance.pos
-
-    def _update_border_rect(self, instance, value):
-        self.border_rect.size = instance.size
-        self.border_rect.pos = instance.pos
-
-    def _update_fps_label_position(self, instance, value):
-        self.fps_label.text_size = self.fps_label.size
-
-    def update_char_count(self, instance, value):
-        char_count = len(value)
-        self.char_count_label.text = f"Characters: {char_count}"
+    def update_selection(self, instance, value):
+        self.stats.set_selection(value)
 
     def update_fps(self, dt):
-        """Calculate and display the FPS."""
-        fps = Clock.get_rfps()
-        self.fps_label.text = f"FPS: {fps:.1f}"
-
-    def create_default_config(self):
-        config = configparser.ConfigParser()
-        config['Settings'] = {
-            'background_color': '#FFFFFF',  # Default white color in CSS hex format
-            'debug_mode': 'False',  # Default debug mode is off
-        }
-        with open(config_file_path, 'w') as configfile:
-            config.write(configfile)
+        """Display frame time percentiles and flush streamed samples."""
+        self.fps_bar.set('fps', self.frame_stats.summary())
+        self.frame_stats.flush()
 
     def load_config(self):
-        config = configparser.ConfigParser()
-        config.read(config_file_path)
-        self.bg_color = config.get('Settings', 'background_color', fallback='#FFFFFF')
-        self.debug_mode = config.getboolean('Settings', 'debug_mode', fallback=False)
+        # Kivy calls this before build(); settings are parsed once and shared
+        self.settings = get_settings(config_file_path)
+        self.settings.bind(self.on_settings_changed)
+        trace.mark('config')
 
     def update_colors(self):
-        if not hasattr(self, 'root'):
-            return
-        with self.root.canvas.before:
-            Color(*self.hex_to_rgb(self.bg_color))
-            self.rect = Rectangle(size=self.root.size, pos=self.root.pos)
-        self.text_input.background_color = self.hex_to_rgb(self.bg_color) + (1,)
-        self.update_text_color()
-
-    def update_text_color(self):
-        brightness = self.get_brightness(self.bg_color)
-        if brightness < 0.5:
-            self.text_input.foreground_color = (1, 1, 1, 1)
-            self.char_count_label.color = (1, 1, 1, 1)
-        else:
-            self.text_input.foreground_color = (0, 0, 0, 1)
-            self.char_count_label.color = (0, 0, 0, 1)
-
-    def get_brightness(self, hex_color):
-        r, g, b = self.hex_to_rgb(hex_color)
-        return (r * 0.299 + g * 0.587 + b * 0.114)
-
-    def check_config_update(self, dt):
-        last_modified_time = os.path.getmtime(config_file_path)
-        if hasattr(self, 'last_checked_time') and last_modified_time > self.last_checked_time:
-            print("Config file updated!")
-            self.load_config()
+        self.theme.apply(self.settings['background_color'])
+
+    def apply_palette(self, palette):
+        self.text_input.background_color = palette.background
+        self.text_input.foreground_color = palette.foreground
+
+    def apply_status_palette(self, palette):
+        self.status_bar.color = palette.foreground
+
+    def on_settings_changed(self, changed):
+        print("Config file updated!")
+        if 'background_color' in changed:
             self.update_colors()
-        self.last_checked_time = last_modified_time
-
-    def hex_to_rgb(self, hex_color):
-        hex_color = hex_color.lstrip('#')
-        if len(hex_color) == 6:
-            r, g, b = hex_color[0:2], hex_color[2:4], hex_color[4:6]
-        elif len(hex_color) == 3:
-            r, g, b = hex_color[0] * 2, hex_color[1] * 2, hex_color[2] * 2
-        else:
-            raise ValueError("Invalid hex color format")
-        return (int(r, 16) / 255, int(g, 16) / 255, int(b, 16) / 255)
+        if 'profiling' in changed:
+            if changed['profiling']:
+                self.profiler.start()
+            else:
+                self.profiler.stop()
 
 # Run the app
 if __name__ == '__main__':
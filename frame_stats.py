@@ -0,0 +1,134 @@
+import time
+from array import array
+
+from kivy.clock import Clock
+from kivy.core.window import Window
+
+# Frames slower than this count as long frames (two 60 Hz frames missed)
+LONG_FRAME_MS = 50.0
+# How often the overlay text is rebuilt
+REFRESH_INTERVAL = 0.25
+
+
+class RingBuffer:
+    """Fixed-size buffer of float samples; the oldest is overwritten."""
+
+    def __init__(self, capacity):
+        self.samples = array('d', bytes(8 * capacity))
+        self.capacity = capacity
+        self.count = 0
+        self._next = 0
+
+    def append(self, value):
+        self.samples[self._next] = value
+        self._next = (self._next + 1) % self.capacity
+        if self.count < self.capacity:
+            self.count += 1
+
+    def values(self):
+        if self.count < self.capacity:
+            return self.samples[:self.count]
+        return self.samples
+
+    def recent(self, count):
+        """Return up to `count` of the newest samples."""
+        count = min(count, self.count)
+        start = self._next - count
+        if start >= 0:
+            return self.samples[start:self._next]
+        return self.samples[start:] + self.samples[:self._next]
+
+    def percentiles(self, *points, window=None):
+        ordered = sorted(self.values() if window is None else self.recent(window))
+        if not ordered:
+            return tuple(0.0 for point in points)
+        last = len(ordered) - 1
+        return tuple(ordered[min(last, int(point / 100 * len(ordered)))] for point in points)
+
+
+class FrameStats:
+    """Records frame times and input-to-paint latency.
+
+    Frame times are the intervals between clock ticks, so they include
+    everything done on the main thread for a frame. An input event starts
+    a latency sample that ends at the next window flip. Samples go into ring
+    buffers of `capacity` entries; nothing is allocated per frame. With
+    `stream_to(path)`, samples are also written to a CSV file for offline
+    analysis, in batches at each refresh.
+    """
+
+    def __init__(self, capacity=1024, long_frame_ms=LONG_FRAME_MS):
+        self.frames = RingBuffer(capacity)
+        self.latencies = RingBuffer(capacity)
+        self.long_frame_ms = long_frame_ms
+        self.long_frames = 0
+        self._input_time = None
+        self._event = None
+        self._stream = None
+        self._pending = []
+
+    def start(self):
+        if self._event is None:
+            self._event = Clock.schedule_interval(self._on_tick, 0)
+            Window.bind(on_flip=self._on_flip, on_key_down=self._on_input,
+                        on_touch_down=self._on_input)
+
+    def stop(self):
+        if self._event is not None:
+            self._event.cancel()
+            self._event = None
+            Window.unbind(on_flip=self._on_flip, on_key_down=self._on_input,
+                          on_touch_down=self._on_input)
+        self.close_stream()
+
+    def stream_to(self, path):
+        self.close_stream()
+        try:
+            self._stream = open(path, 'a')
+        except OSError as error:
+            print(f"Cannot write frame stats to {path}: {error}")
+
+    def close_stream(self):
+        if self._stream is not None:
+            self.flush()
+            self._stream.close()
+            self._stream = None
+
+    def flush(self):
+        if self._stream is not None and self._pending:
+            self._stream.write(''.join(self._pending))
+            self._stream.flush()
+        self._pending.clear()
+
+    def _on_input(self, *args):
+        # Only the first input before a paint is measured
+        if self._input_time is None:
+            self._input_time = time.perf_counter()
+
+    def _on_tick(self, dt):
+        frame_ms = dt * 1000
+        self.frames.append(frame_ms)
+        if frame_ms > self.long_frame_ms:
+            self.long_frames += 1
+        if self._stream is not None:
+            self._pending.append(f"frame,{time.perf_counter():.6f},{frame_ms:.3f}\n")
+
+    def _on_flip(self, window):
+        if self._input_time is None:
+            return
+        now = time.perf_counter()
+        latency_ms = (now - self._input_time) * 1000
+        self.latencies.append(latency_ms)
+        self._input_time = None
+        if self._stream is not None:
+            self._pending.append(f"latency,{now:.6f},{latency_ms:.3f}\n")
+
+    def fps(self):
+        median = self.frames.percentiles(50)[0]
+        return 1000 / median if median else 0.0
+
+    def summary(self):
+        p50, p95, p99 = self.frames.percentiles(50, 95, 99)
+        latency = self.latencies.percentiles(95)[0]
+        return (f"FPS: {self.fps():.0f}  p50 {p50:.1f} p95 {p95:.1f} p99 {p99:.1f} ms  "
+                f"long: {self.long_frames}  input p95 {latency:.1f} ms")
@@ -0,0 +1,85 @@
+from collections import namedtuple
+
+from kivy.clock import Clock
+from kivy.config import Config
+
+# A degradation step: `enter()` is called when the governor moves past
+# it, `leave()` when it recovers back below it.
+Level = namedtuple('Level', 'name enter leave')
+
+# p95 frame times (ms) that push the governor down a level or let it
+# recover one; the gap between them is the hysteresis band.
+DEGRADE_MS = 60.0
+RECOVER_MS = 40.0
+
+
+class PerformanceGovernor:
+    """Steps through degradation levels based on measured frame times.
+
+    Every `interval` seconds the p95 of the frames since the last check is
+    compared with the thresholds. A level is only given up after
+    `degrade_after` slow checks in a row, and only restored after
+    `recover_after` fast ones, so the editor does not flip between levels
+    on a single spike. Levels are applied in order and undone in reverse;
+    every change is logged.
+    """
+
+    def __init__(self, frame_stats, levels, interval=1.0, degrade_ms=DEGRADE_MS,
+                 recover_ms=RECOVER_MS, degrade_after=2, recover_after=5):
+        self.frame_stats = frame_stats
+        self.levels = list(levels)
+        self.interval = interval
+        self.degrade_ms = degrade_ms
+        self.recover_ms = recover_ms
+        self.degrade_after = degrade_after
+        self.recover_after = recover_after
+        # Number of levels currently applied
+        self.level = 0
+        self._slow = 0
+        self._fast = 0
+        self._event = None
+
+    def start(self):
+        if self._event is None:
+            self._event = Clock.schedule_interval(self.check, self.interval)
+
+    def stop(self):
+        """Stop governing and restore every level."""
+        if self._event is not None:
+            self._event.cancel()
+            self._event = None
+        self.set_level(0, 'stopped')
+
+    def check(self, dt):
+        # The frames drawn since the last check at the configured rate, or
+        # at the measured one when the rate is not capped
+        fps = Config.getint('graphics', 'maxfps') or Clock.get_fps()
+        frames = max(1, round(dt * fps))
+        p95 = self.frame_stats.frames.percentiles(95, window=frames)[0]
+        if p95 > self.degrade_ms:
+            self._slow += 1
+            self._fast = 0
+            if self._slow >= self.degrade_after and self.level < len(self.levels):
+                self.set_level(self.level + 1, f"p95 {p95:.1f} ms")
+        elif p95 < self.recover_ms:
+            self._fast += 1
+            self._slow = 0
+            if self._fast >= self.recover_after and self.level > 0:
+                self.set_level(self.level - 1, f"p95 {p95:.1f} ms")
+        else:
+            self._slow = self._fast = 0
+
+    def set_level(self, level, reason=''):
+        level = max(0, min(level, len(self.levels)))
+        while self.level < level:
+            step = self.levels[self.level]
+            step.enter()
+            self.level += 1
+            print(f"Performance governor: level {self.level} ({step.name}) entered, {reason}")
+        while self.level > level:
+            self.level -= 1
+            step = self.levels[self.level]
+            step.leave()
+            print(f"Performance governor: level {self.level + 1} ({step.name}) left, {reason}")
+        # Give the new level time to show its effect before judging again
+        self._slow = self._fast = 0
@@ -0,0 +1,191 @@
+import builtins
+import keyword
+import os
+import re
+from collections import OrderedDict
+
+# Lexer states carried from the end of one line to the start of the next
+NORMAL = 0
+IN_SINGLE_TRIPLE = 1
+IN_DOUBLE_TRIPLE = 2
+
+# Lines re-lexed synchronously after an edit before the rest is left to be
+# lexed lazily when it is displayed
+RELEX_BUDGET = 500
+CACHED_LINES = 2048
+
+STYLES = {
+    'keyword': 'cc7832',
+    'builtin': '8888c6',
+    'string': '6a8759',
+    'comment': '808080',
+    'number': '6897bb',
+    'decorator': 'bbb529',
+    'function': 'ffc66d',
+    'class': 'ffc66d',
+}
+
+_TOKEN = re.compile(r'''
+    (?P<comment>\#.*)
+  | (?P<triple>[rRbBuUfF]{0,2}(?:\'\'\'|"""))
+  | (?P<string>[rRbBuUfF]{0,2}(?:'(?:\\.|[^'\\])*'?|"(?:\\.|[^"\\])*"?))
+  | (?P<number>\b(?:0[xXoObB][\da-fA-F_]+|\d[\d_]*\.?\d*(?:[eE][+-]?\d+)?j?))
+  | (?P<decorator>@[\w.]+)
+  | (?P<name>[A-Za-z_]\w*)
+''', re.VERBOSE)
+
+_TRIPLE_END = {
+    IN_SINGLE_TRIPLE: re.compile(r"(?:\\.|[^\\])*?'''"),
+    IN_DOUBLE_TRIPLE: re.compile(r'(?:\\.|[^\\])*?"""'),
+}
+
+_KEYWORDS = frozenset(keyword.kwlist + keyword.softkwlist)
+_BUILTINS = frozenset(dir(builtins)) | {'self', 'cls'}
+
+
+class PythonLexer:
+    """Line-at-a-time Python lexer.
+
+    `tokenize(line, state)` returns the (start, end, kind) tokens of one
+    line and the state at its end, so a line can be lexed knowing only the
+    state its previous line ended in.
+    """
+
+    def tokenize(self, line, state=NORMAL):
+        tokens = []
+        position = 0
+        if state != NORMAL:
+            match = _TRIPLE_END[state].match(line)
+            if match is None:
+                return [(0, len(line), 'string')] if line else [], state
+            tokens.append((0, match.end(), 'string'))
+            position = match.end()
+            state = NORMAL
+        previous = None
+        while True:
+            match = _TOKEN.search(line, position)
+            if match is None:
+                break
+            kind = match.lastgroup
+            start, end = match.span()
+            if kind == 'triple':
+                quote = match.group()[-3:]
+                state = IN_SINGLE_TRIPLE if quote == "'''" else IN_DOUBLE_TRIPLE
+                rest = _TRIPLE_END[state].match(line, end)
+                if rest is None:
+                    tokens.append((start, len(line), 'string'))
+                    return tokens, state
+                end = rest.end()
+                state = NORMAL
+                kind = 'string'
+            elif kind == 'name':
+                word = match.group()
+                if previous in ('def', 'class'):
+                    kind = 'function' if previous == 'def' else 'class'
+                elif word in _KEYWORDS:
+                    kind = 'keyword'
+                elif word in _BUILTINS:
+                    kind = 'builtin'
+                else:
+                    kind = None
+                previous = word
+            if kind is not None:
+                tokens.append((start, end, kind))
+            position = end
+        return tokens, state
+
+
+LEXERS = {'.py': PythonLexer, '.pyw': PythonLexer, '.pyi': PythonLexer}
+
+
+def lexer_for(path):
+    """Return a lexer for `path` based on its extension, or None."""
+    lexer = LEXERS.get(os.path.splitext(path)[1].lower())
+    return lexer() if lexer is not None else None
+
+
+def escape_markup(text):
+    return text.replace('&', '&amp;').replace('[', '&bl;').replace(']', '&br;')
+
+
+def to_markup(text, tokens, tab_width=4):
+    parts = []
+    position = 0
+    for start, end, kind in tokens:
+        parts.append(escape_markup(text[position:start]))
+        parts.append(f"[color={STYLES[kind]}]{escape_markup(text[start:end])}[/color]")
+        position = end
+    parts.append(escape_markup(text[position:]))
+    return ''.join(parts).replace('\t', ' ' * tab_width)
+
+
+class Highlighter:
+    """Incremental highlighter for a `Document`.
+
+    The lexer state at the start of every line is cached. After an edit
+    only the changed lines are re-lexed, continuing down just until a
+    line ends in the state that was cached for the next one. Lines past
+    the cached states are lexed lazily, the first time they are shown,
+    and tokens are kept per (text, state) so unchanged lines that scroll
+    back into view are not lexed again.
+    """
+
+    def __init__(self, document, lexer):
+        self.document = document
+        self.lexer = lexer
+        # State at the start of line i, known for i < len(self._states)
+        self._states = [NORMAL]
+        self._tokens = OrderedDict()
+        document.bind(self.on_delta)
+
+    def detach(self):
+        self.document.unbind(self.on_delta)
+
+    def _lex(self, line):
+        text = self.document.get_line(line)
+        state = self._states[line]
+        key = (text, state)
+        result = self._tokens.get(key)
+        if result is None:
+            result = self._tokens[key] = self.lexer.tokenize(text, state)
+            if len(self._tokens) > CACHED_LINES:
+                self._tokens.popitem(last=False)
+        else:
+            self._tokens.move_to_end(key)
+        return text, result
+
+    def on_delta(self, delta):
+        states = self._states
+        first = self.document.line_of_offset(delta.offset)
+        if first >= len(states):
+            return
+        # Lines merged or split by the edit lose their cached states
+        removed = delta.removed.count('\n')
+        inserted = delta.inserted.count('\n')
+        states[first + 1:first + 1 + removed] = [None] * inserted
+        line_count = self.document.line_count()
+        del states[line_count:]
+        line = first
+        while line + 1 < len(states):
+            end_state = self._lex(line)[1][1]
+            line += 1
+            if line > first + inserted and states[line] == end_state:
+                return  # Back in step with the cached states below
+            states[line] = end_state
+            if line - first >= RELEX_BUDGET:
+                break
+        # Everything below is unknown; it is lexed again when displayed
+        del states[line + 1:]
+
+    def line_tokens(self, line):
+        """Return (text, tokens) for `line`, lexing down to it if needed."""
+        states = self._states
+        while len(states) <= line:
+            states.append(self._lex(len(states) - 1)[1][1])
+        text, (tokens, end_state) = self._lex(line)
+        return text, tokens
+
+    def line_markup(self, line, tab_width=4):
+        """Return `line` as Kivy markup with a color per token kind."""
+        text, tokens = self.line_tokens(line)
+        return to_markup(text, tokens, tab_width)
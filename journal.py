@@ -0,0 +1,335 @@
+"""Crash-recovery journal for unsaved edits.
+
+Every open document appends its edit deltas to a journal file in
+`recovery/` under the cache directory. A journal starts with a base
+record, either a reference to the file on disk (path, size, mtime) or a
+snapshot of the text, followed by edit records. Records are `<BQQI` headers (kind, a, b, payload length)
+followed by the payload:
+
+    BASE      a=size b=mtime_ns   payload=path
+    SNAPSHOT  a=len(path) b=dirty payload=path + text
+    EDIT      a=offset b=removed  payload=inserted text
+
+Text is UTF-8 with lone surrogates passed through. Journals are removed
+when a document is closed normally, so any journal left from a process
+that is no longer running is a crash to recover from. A snapshot is
+dirty when it holds unsaved changes; a journal with only a clean
+snapshot, such as that of an untouched scratch buffer, is not recovered.
+"""
+import itertools
+import os
+import queue
+import struct
+import threading
+from collections import deque
+
+from kivy.clock import Clock
+
+from document import Document
+from paths import cache_dir
+
+# Pending edits are handed to the writer and fsynced this often
+FLUSH_INTERVAL = 0.2
+# A journal this many bytes past its base is compacted into a snapshot
+COMPACT_BYTES = 1024 * 1024
+# Documents longer than this are never snapshotted on compaction, their
+# journals only restart when the file is saved or reloaded
+SNAPSHOT_LIMIT = 4 * 1024 * 1024
+
+BASE = 1
+SNAPSHOT = 2
+EDIT = 3
+_RECORD = struct.Struct('<BQQI')
+
+_ids = itertools.count(1)
+
+
+def _encode(text):
+    return text.encode('utf-8', 'surrogatepass')
+
+
+def _decode(data):
+    return data.decode('utf-8', 'surrogatepass')
+
+
+def _encode_op(op):
+    kind = op[0]
+    if kind == EDIT:
+        payload = _encode(op[3])
+        return _RECORD.pack(EDIT, op[1], op[2], len(payload)) + payload
+    if kind == BASE:
+        payload = _encode(op[1])
+        return _RECORD.pack(BASE, op[2], op[3], len(payload)) + payload
+    path = _encode(op[1])
+    payload = path + _encode(op[2])
+    return _RECORD.pack(SNAPSHOT, len(path), op[3], len(payload)) + payload
+
+
+def recovery_dir():
+    return os.path.join(cache_dir(), 'recovery')
+
+
+class JournalWriter:
+    """Writes journals on one background thread.
+
+    The UI thread only moves pending operations into a queue every
+    `interval` seconds; encoding, writing and fsync happen here.
+    """
+
+    def __init__(self, interval=FLUSH_INTERVAL):
+        self.journals = []
+        self._queue = queue.Queue()
+        # Journals closed normally; held while writing so a late write
+        # cannot recreate a file `discard` already removed
+        self._closed = set()
+        self._lock = threading.Lock()
+        threading.Thread(target=self._run, daemon=True).start()
+        self._event = Clock.schedule_interval(self._tick, interval)
+
+    def add(self, journal):
+        self.journals.append(journal)
+
+    def remove(self, journal):
+        if journal in self.journals:
+            self.journals.remove(journal)
+
+    def _tick(self, dt):
+        for journal in self.journals:
+            journal.flush()
+
+    def submit(self, path, ops):
+        self._queue.put((path, ops))
+
+    def discard(self, path):
+        """Remove a journal now, on the calling thread, and drop any
+        writes for it still queued."""
+        with self._lock:
+            self._closed.add(path)
+            for name in (path, path + '.tmp'):
+                try:
+                    os.remove(name)
+                except FileNotFoundError:
+                    pass
+
+    def _run(self):
+        while True:
+            batches = [self._queue.get()]
+            while not self._queue.empty():
+                batches.append(self._queue.get())
+            # One write and fsync per file per wake-up
+            merged = {}
+            for path, ops in batches:
+                merged.setdefault(path, []).extend(ops)
+            for path, ops in merged.items():
+                with self._lock:
+                    if path in self._closed:
+                        continue
+                    try:
+                        self._write(path, ops)
+                    except OSError as error:
+                        print(f"Cannot write recovery journal {path}: {error}")
+
+    def _write(self, path, ops):
+        restart = None
+        for index, op in enumerate(ops):
+            if op[0] != EDIT:
+                restart = index
+        data = b''.join(_encode_op(op) for op in ops[restart or 0:])
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        if restart is None:
+            with open(path, 'ab') as target:
+                target.write(data)
+                target.flush()
+                os.fsync(target.fileno())
+            return
+        # A new base replaces the journal atomically
+        temporary = path + '.tmp'
+        with open(temporary, 'wb') as target:
+            target.write(data)
+            target.flush()
+            os.fsync(target.fileno())
+        os.replace(temporary, path)
+
+
+_writer = None
+
+
+def get_writer():
+    global _writer
+    if _writer is None:
+        _writer = JournalWriter()
+    return _writer
+
+
+class Journal:
+    """Records the edits of one document for crash recovery.
+
+    Each delta costs one deque append on the UI thread. The journal
+    restarts from the file on disk whenever the document is saved or
+    reloaded, and from a snapshot when it grows past COMPACT_BYTES.
+    """
+
+    def __init__(self, document, directory=None):
+        if directory is None:
+            directory = recovery_dir()
+        self.path = os.path.join(directory, f"{os.getpid()}-{next(_ids)}.journal")
+        self.document = None
+        # Bytes written since the last base record
+        self.size = 0
+        self._pending = deque()
+        self._saved_version = None
+        self._writer = get_writer()
+        self._writer.add(self)
+        self.attach(document)
+
+    def attach(self, document, restart=True):
+        """Follow `document`; without `restart` it continues the journal,
+        e.g. for a tab restored from the same text."""
+        if self.document is not None:
+            self.detach()
+        self.document = document
+        self._saved_version = document.saved_version
+        document.bind(self.on_delta)
+        if restart:
+            self._restart()
+
+    def detach(self):
+        if self.document is None:
+            return
+        self.flush()
+        self.document.unbind(self.on_delta)
+        self.document = None
+
+    def on_delta(self, delta):
+        op = (EDIT, delta.offset, len(delta.removed), delta.inserted)
+        self._pending.append((self.document.version, op))
+        self.size += _RECORD.size + len(delta.inserted)
+
+    def _restart(self):
+        document = self.document
+        self.size = 0
+        if document.path and not document.modified:
+            try:
+                stat = os.stat(document.path)
+            except OSError:
+                pass
+            else:
+                self._pending.append((document.version, (BASE, document.path,
+                                                         stat.st_size, stat.st_mtime_ns)))
+                return
+        self._pending.append((document.version, (SNAPSHOT, document.path or '',
+                                                 document.get_text(), int(document.modified))))
+
+    def flush(self):
+        document = self.document
+        if document is None:
+            return
+        if document.saved_version != self._saved_version:
+            # Saved or reloaded: the file on disk is the new base, or a
+            # snapshot if there were edits after the save
+            self._saved_version = document.saved_version
+            self._pending.clear()
+            self._restart()
+        elif self.size > COMPACT_BYTES and len(document) <= SNAPSHOT_LIMIT:
+            self._pending.clear()
+            self._restart()
+        if self._pending:
+            ops = [op for version, op in self._pending]
+            self._pending.clear()
+            self._writer.submit(self.path, ops)
+
+    def close(self):
+        """Stop journaling and remove the journal file before returning."""
+        if self.document is not None:
+            self.document.unbind(self.on_delta)
+            self.document = None
+        self._pending.clear()
+        self._writer.remove(self)
+        self._writer.discard(self.path)
+
+
+def replay(path):
+    """Rebuild the document of a journal; None if there is nothing to recover."""
+    with open(path, 'rb') as source:
+        data = source.read()
+    document = None
+    edited = False
+    position = 0
+    while position + _RECORD.size <= len(data):
+        kind, a, b, length = _RECORD.unpack_from(data, position)
+        position += _RECORD.size
+        payload = data[position:position + length]
+        if len(payload) < length:
+            # Torn write at the moment of the crash
+            break
+        position += length
+        if kind == BASE:
+            origin = _decode(payload)
+            try:
+                stat = os.stat(origin)
+                if (stat.st_size, stat.st_mtime_ns) != (a, b):
+                    print(f"Cannot recover {origin}: the file changed on disk")
+                    return None
+                with open(origin, encoding='utf-8', errors='surrogateescape') as source:
+                    document = Document(source.read(), origin)
+            except OSError as error:
+                print(f"Cannot recover {origin}: {error}")
+                return None
+            edited = False
+        elif kind == SNAPSHOT:
+            document = Document(_decode(payload[a:]), _decode(payload[:a]) or None)
+            edited = bool(b)
+        elif kind == EDIT and document is not None:
+            document.replace(a, b, _decode(payload))
+            edited = True
+    if document is None or not edited:
+        return None
+    # Unsaved until the user saves it again
+    document.saved_version = -1
+    return document
+
+
+def _running(pid):
+    if pid == os.getpid():
+        return True
+    if os.name != 'posix':
+        # No cheap liveness check elsewhere; os.kill would signal the process
+        return False
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def recover(directory=None):
+    """Return the documents left behind by crashed sessions.
+
+    Their journals are removed; the caller attaches new journals to the
+    recovered documents.
+    """
+    documents = []
+    if directory is None:
+        directory = recovery_dir()
+    try:
+        names = sorted(os.listdir(directory))
+    except OSError:
+        return documents
+    for name in names:
+        if not name.endswith('.journal'):
+            continue
+        pid = name.partition('-')[0]
+        if not pid.isdigit() or _running(int(pid)):
+            continue
+        path = os.path.join(directory, name)
+        try:
+            document = replay(path)
+        except (OSError, ValueError) as error:
+            print(f"Cannot read recovery journal {path}: {error}")
+            continue
+        if document is not None:
+            documents.append(document)
+        os.remove(path)
+    return documents
@@ -0,0 +1,163 @@
+import mmap
+import os
+import threading
+from array import array
+from bisect import bisect_right
+from collections import OrderedDict
+
+from kivy.clock import Clock
+
+from watcher import get_watcher
+
+# Files above this size open read-only in large-file mode
+LARGE_FILE_THRESHOLD = 8 * 1024 * 1024
+# The line index stores one newline count per chunk of this many bytes
+CHUNK_SIZE = 1 << 16
+# Chunks whose exact newline positions are kept around for lookups
+CACHED_CHUNKS = 32
+# Longest part of a single line that is decoded for display
+MAX_LINE_CHARS = 4000
+
+
+class MappedFile:
+    """Read-only, memory-mapped view of a large file addressed by line.
+
+    Nothing is decoded up front. A background thread counts newlines per
+    64 KiB chunk (bytes.count runs in C), which gives a sparse index from
+    line numbers to chunks; exact line offsets are only worked out for the
+    chunks that are actually looked at. `line_count` grows while the index
+    is being built; listeners registered with `bind` are called on the main
+    thread as it does, and again when the file is remapped after it
+    changed on disk.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._file = open(path, 'rb')
+        self._map = None
+        self._listeners = []
+        self._progress_trigger = Clock.create_trigger(self._notify, 0.1)
+        self._closed = False
+        # Bumped on every remap so an index thread of an old map stops
+        self._generation = 0
+        self._map_file()
+        # Reading a page past the end of a file truncated by another
+        # process raises SIGBUS, so the mapping follows the file's size
+        get_watcher().watch(path, self._on_file_changed)
+
+    def bind(self, callback):
+        self._listeners.append(callback)
+
+    def close(self):
+        self._closed = True
+        get_watcher().unwatch(self.path, self._on_file_changed)
+        if self._map is not None:
+            self._map.close()
+            self._map = None
+        self._file.close()
+
+    def _map_file(self):
+        """Map the file at its current size and start indexing it again."""
+        info = os.fstat(self._file.fileno())
+        self._stat = (info.st_size, info.st_mtime_ns)
+        self._generation += 1
+        if self._map is not None:
+            self._map.close()
+            self._map = None
+        self.size = info.st_size
+        if self.size:
+            self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        # Newlines before the start of each indexed chunk
+        self._newlines_before = array('q', [0])
+        self._indexed_bytes = 0
+        self.indexed = not self.size
+        self._chunk_cache = OrderedDict()
+        if self.size:
+            threading.Thread(target=self._build_index, args=(self._generation,),
+                             daemon=True).start()
+
+    def _on_file_changed(self, path):
+        if self._closed:
+            return
+        try:
+            info = os.fstat(self._file.fileno())
+        except OSError:
+            return
+        if (info.st_size, info.st_mtime_ns) != self._stat:
+            self._map_file()
+            self._notify(0)
+
+    def _check_size(self):
+        # The watcher reports a truncation only after its coalescing delay
+        if self._map is not None and os.fstat(self._file.fileno()).st_size < self.size:
+            self._map_file()
+            self._progress_trigger()
+
+    def _build_index(self, generation):
+        mapped = self._map
+        size = self.size
+        newlines_before = self._newlines_before
+        newlines = 0
+        for start in range(0, size, CHUNK_SIZE):
+            if self._closed or generation != self._generation:
+                return
+            try:
+                newlines += mapped[start:start + CHUNK_SIZE].count(b'\n')
+            except ValueError:
+                return  # Closed or remapped while indexing
+            newlines_before.append(newlines)
+            self._indexed_bytes = min(start + CHUNK_SIZE, size)
+            if len(newlines_before) % 256 == 0:
+                self._progress_trigger()
+        if generation == self._generation:
+            self.indexed = True
+            self._progress_trigger()
+
+    def _notify(self, dt):
+        for callback in self._listeners:
+            callback(self)
+
+    def line_count(self):
+        """Number of lines indexed so far (all of them once `indexed`)."""
+        return self._newlines_before[-1] + 1 if self._newlines_before else 1
+
+    def _chunk_newlines(self, chunk):
+        # Exact newline positions inside one chunk, computed on demand
+        positions = self._chunk_cache.get(chunk)
+        if positions is not None:
+            self._chunk_cache.move_to_end(chunk)
+            return positions
+        positions = array('q')
+        mapped = self._map
+        end = min((chunk + 1) * CHUNK_SIZE, self.size)
+        index = mapped.find(b'\n', chunk * CHUNK_SIZE, end)
+        while index != -1:
+            positions.append(index)
+            index = mapped.find(b'\n', index + 1, end)
+        self._chunk_cache[chunk] = positions
+        if len(self._chunk_cache) > CACHED_CHUNKS:
+            self._chunk_cache.popitem(last=False)
+        return positions
+
+    def line_start(self, line):
+        """Byte offset of the start of `line` (0-based)."""
+        if line <= 0 or self._map is None:
+            return 0
+        newlines_before = self._newlines_before
+        # Chunk holding the line-th newline
+        chunk = bisect_right(newlines_before, line - 1) - 1
+        if chunk >= len(newlines_before) - 1:
+            return self._indexed_bytes
+        positions = self._chunk_newlines(chunk)
+        return positions[line - 1 - newlines_before[chunk]] + 1
+
+    def get_line(self, line):
+        """Decode one line (without its newline) for display."""
+        self._check_size()
+        if self._map is None:
+            return ''
+        start = self.line_start(line)
+        end = self._map.find(b'\n', start, start + MAX_LINE_CHARS * 4)
+        if end == -1:
+            end = min(self.size, start + MAX_LINE_CHARS * 4)
+        return self._map[start:end].decode('utf-8', 'replace').rstrip('\r')[:MAX_LINE_CHARS]
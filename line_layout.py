@@ -0,0 +1,256 @@
+from collections import OrderedDict
+
+from kivy.clock import Clock
+from kivy.core.text import Label as CoreLabel
+from kivy.graphics import Color, Rectangle
+from kivy.properties import ListProperty
+from kivy.uix.textinput import FL_IS_LINEBREAK, FL_IS_WORDBREAK
+from kivy.uix.widget import Widget
+
+# Logical lines whose wrapped form is kept per font and wrap width, and
+# the number of such layouts kept, so going back to a previous width
+# finds its lines still wrapped
+CACHED_WRAPS = 100000
+CACHED_LAYOUTS = 4
+# Measured text runs kept per font
+CACHED_WIDTHS = 50000
+CACHED_NUMBERS = 2048
+GUTTER_PADDING = 8
+
+
+def wrap_line(line, width, measure, tokenize):
+    """Break one logical line into rows no wider than `width`.
+
+    Same rules as TextInput's word wrap: words move to the next row when
+    they do not fit, words wider than a row are split. Returns the rows
+    and their TextInput line flags.
+    """
+    rows = []
+    flags = []
+    flag = 0
+    x = 0
+    current = []
+    for word in tokenize(line):
+        if not word:
+            continue
+        w = measure(word)
+        if x + w > width and current:
+            rows.append(''.join(current))
+            flags.append(flag)
+            flag = 0
+            current = []
+            x = 0
+        if width >= 1 and w > width:
+            while w > width:
+                split_width = split_pos = 0
+                for char in word:
+                    char_width = measure(char)
+                    if split_width + char_width > width:
+                        break
+                    split_width += char_width
+                    split_pos += 1
+                if split_pos == 0:
+                    # Not even one char fits, give up on this word
+                    break
+                rows.append(word[:split_pos])
+                flags.append(flag)
+                flag = FL_IS_WORDBREAK
+                word = word[split_pos:]
+                w -= split_width
+            x = w
+        else:
+            x += w
+        current.append(word)
+    rows.append(''.join(current))
+    flags.append(flag)
+    return tuple(rows), tuple(flags)
+
+
+class LineLayoutCache:
+    """Measured widths and wrapped rows per logical line.
+
+    Widths are keyed by font only, so resizing never measures text again;
+    wrapped rows are kept per (font, wrap width) layout and keyed by line
+    text, so an edit only re-wraps the lines it touched and switching
+    between a few widths does not evict the others.
+    """
+
+    def __init__(self):
+        self._widths = {}
+        self._wraps = OrderedDict()
+        self._numbers = OrderedDict()
+
+    def text_width(self, font_key, text, measure):
+        widths = self._widths.get(font_key)
+        if widths is None:
+            widths = self._widths[font_key] = {}
+        width = widths.get(text)
+        if width is None:
+            if len(widths) >= CACHED_WIDTHS:
+                widths.clear()
+            width = widths[text] = measure(text)
+        return width
+
+    def _layout(self, font_key, width):
+        key = (font_key, width)
+        wraps = self._wraps.get(key)
+        if wraps is None:
+            wraps = self._wraps[key] = OrderedDict()
+            if len(self._wraps) > CACHED_LAYOUTS:
+                self._wraps.popitem(last=False)
+        else:
+            self._wraps.move_to_end(key)
+        return wraps
+
+    def wrap(self, font_key, width, line, measure, tokenize):
+        wraps = self._layout(font_key, width)
+        wrapped = wraps.get(line)
+        if wrapped is None:
+            wrapped = wraps[line] = wrap_line(line, width, measure, tokenize)
+            if len(wraps) > CACHED_WRAPS:
+                wraps.popitem(last=False)
+        else:
+            wraps.move_to_end(line)
+        return wrapped
+
+    def cached_wrap(self, font_key, width, line):
+        """The wrapped rows of `line` if they are cached, else None."""
+        wraps = self._wraps.get((font_key, width))
+        return wraps.get(line) if wraps is not None else None
+
+    def number_texture(self, font_key, number, options):
+        key = (font_key, number)
+        texture = self._numbers.get(key)
+        if texture is None:
+            label = CoreLabel(text=str(number), **options)
+            label.refresh()
+            texture = self._numbers[key] = label.texture
+            if len(self._numbers) > CACHED_NUMBERS:
+                self._numbers.popitem(last=False)
+        else:
+            self._numbers.move_to_end(key)
+        return texture
+
+
+# Shared so every editor and gutter in the process reuses measurements
+layout_cache = LineLayoutCache()
+
+
+class LazyLine:
+    """Stands in for a row texture until the row is first drawn."""
+    __slots__ = ('editor', 'text', 'height')
+
+    def __init__(self, editor, text, height):
+        self.editor = editor
+        self.text = text
+        self.height = height
+
+    @property
+    def width(self):
+        return self.editor.measure_text(self.text)
+
+    @property
+    def size(self):
+        # Only used for the row's initial rectangle, which is resized when
+        # the row is drawn; measuring here would defeat the laziness
+        return 0, self.height
+
+
+class LineNumberGutter(Widget):
+    """Line numbers for the visible rows of an `EditorInput`.
+
+    Numbers are drawn only for the rows on screen, with textures from the
+    shared layout cache; rows that continue a wrapped line stay blank.
+    With wrapping, the logical line of the first visible row is counted
+    from an anchor row kept between redraws, so scrolling costs the rows
+    scrolled rather than the rows above the view.
+    """
+    color = ListProperty([0.5, 0.5, 0.5, 1])
+
+    def __init__(self, editor, **kwargs):
+        kwargs.setdefault('size_hint_x', None)
+        super().__init__(**kwargs)
+        self.editor = editor
+        self._document = None
+        # (layout key, row, line, offset): `row` starts logical `line`,
+        # which starts at `offset` in the document
+        self._anchor = None
+        self._trigger = Clock.create_trigger(self.redraw, 0)
+        editor.bind(layout_version=self._trigger, font_size=self._trigger,
+                    font_name=self._trigger)
+        self.bind(pos=self._trigger, size=self._trigger, color=self._trigger)
+        self._trigger()
+
+    def _on_delta(self, delta):
+        # Rows before an edit keep their layout, rows after it may not
+        if self._anchor is not None and delta.offset < self._anchor[3]:
+            self._anchor = None
+
+    def _first_line(self, first):
+        """Logical line of row `first`, and the row that starts it."""
+        editor = self.editor
+        flags = editor._lines_flags
+        start = first
+        while start and not flags[start] & FL_IS_LINEBREAK:
+            start -= 1
+        if not (editor.multiline and editor.do_wrap):
+            # Every row is a logical line
+            return start, start
+        # Replacing estimated rows moves rows without an edit
+        key = (editor._layout_key, editor._wrap_generation)
+        anchor = self._anchor
+        if anchor is None or anchor[0] != key:
+            anchor = (key, 0, 0, 0)
+        _, row, line, offset = anchor
+        if start >= row:
+            line += flags[row + 1:start + 1].count(FL_IS_LINEBREAK)
+        else:
+            line -= flags[start + 1:row + 1].count(FL_IS_LINEBREAK)
+        self._anchor = (key, start, line, editor.document.line_start(line))
+        return line, start
+
+    def visible_numbers(self):
+        """(row, line number) for the rows on screen that start a line."""
+        flags = self.editor._lines_flags
+        first, end = self.editor._visible_lines_range
+        end = min(end, len(flags))
+        if first >= end:
+            return []
+        number, start = self._first_line(first)
+        numbers = []
+        for row in range(first, end):
+            if row != start:
+                if not flags[row] & FL_IS_LINEBREAK:
+                    # Continuation of a wrapped line, no number
+                    continue
+                number += 1
+            numbers.append((row, number + 1))
+        return numbers
+
+    def redraw(self, dt=0):
+        editor = self.editor
+        document = editor.document
+        if document is not self._document:
+            if self._document is not None:
+                self._document.unbind(self._on_delta)
+            document.bind(self._on_delta)
+            self._document = document
+            self._anchor = None
+        options = editor._get_line_options()
+        font_key = editor.font_key()
+        digits = len(str(document.line_count()))
+        self.width = editor.measure_text('9' * digits) + 2 * GUTTER_PADDING
+
+        self.canvas.clear()
+        line_height = editor.line_height
+        dy = line_height + editor.line_spacing
+        top = editor.top - editor.padding[1] + editor.scroll_y
+        with self.canvas:
+            Color(*self.color)
+            for row, number in self.visible_numbers():
+                y = top - row * dy - line_height
+                if y < editor.y or y + line_height > editor.top:
+                    continue
+                texture = layout_cache.number_texture(font_key, number, options)
+                Rectangle(texture=texture, size=texture.size,
+                          pos=(self.right - GUTTER_PADDING - texture.width, y))
@@ -0,0 +1,196 @@
+import heapq
+import os
+import re
+import time
+from array import array
+from itertools import islice
+
+# Directories that are never worth offering in quick open
+IGNORED_DIRS = frozenset(('.git', '.hg', '.svn', '__pycache__', 'node_modules',
+                          '.venv', 'venv', '.mypy_cache', '.pytest_cache', '.tox'))
+
+_SEPARATORS = '/\\_-. '
+
+# Paths checked between cancellation polls
+CHUNK_SIZE = 5000
+# Scan time before the first partial result, within one frame, and the
+# minimum time between later ones so the view is not rebuilt every chunk
+FIRST_PARTIAL = 0.008
+PARTIAL_INTERVAL = 0.1
+
+
+def char_mask(text):
+    """64-bit set of the characters in `text`, used as a cheap prefilter."""
+    mask = 0
+    for ch in set(text):
+        if 'a' <= ch <= 'z':
+            mask |= 1 << (ord(ch) - 97)
+        elif '0' <= ch <= '9':
+            mask |= 1 << (ord(ch) - 22)
+        else:
+            mask |= 1 << (36 + ord(ch) % 28)
+    return mask
+
+
+def fuzzy_score(query, path, base_start):
+    """Score a subsequence match of `query` in lowercased `path`, or None.
+
+    Consecutive characters and characters at word boundaries score higher,
+    as do matches that stay inside the file name.
+    """
+    for start in (base_start, 0):
+        score = 0
+        position = start
+        previous = -2
+        for ch in query:
+            found = path.find(ch, position)
+            if found == -1:
+                break
+            score += 1
+            if found == previous + 1:
+                score += 5
+            if found == 0 or path[found - 1] in _SEPARATORS:
+                score += 8
+            previous = found
+            position = found + 1
+        else:
+            if start:
+                score += 10
+            return score - len(path) * 0.01
+    return None
+
+
+class PathIndex:
+    """In-memory index of file paths for fuzzy quick open.
+
+    Paths are kept in a packed list with a parallel array of character
+    bitmasks. Candidates are found by bitmask and a compiled subsequence
+    regex (both run in C), and only the best matches get the finer
+    Python scoring pass. Removal leaves a tombstone that `compact`
+    reclaims.
+    """
+
+    def __init__(self):
+        self.paths = []
+        self._lower = []
+        self._masks = array('Q')
+        self._positions = {}
+        self._dead = 0
+        # Bumped on every change; the query cache is only valid for one
+        self._generation = 0
+        # Cache of the previous query so typing more characters only
+        # re-checks the previous candidates
+        self._last_query = None
+        self._last_candidates = None
+
+    def __len__(self):
+        return len(self._positions)
+
+    def add(self, path):
+        if path in self._positions:
+            return
+        lower = path.lower()
+        self._positions[path] = len(self.paths)
+        self.paths.append(path)
+        self._lower.append(lower)
+        # Appended last: queries running on another thread bound their
+        # scan by the mask count
+        self._masks.append(char_mask(lower))
+        self._generation += 1
+
+    def remove(self, path):
+        index = self._positions.pop(path, None)
+        if index is None:
+            return
+        self.paths[index] = None
+        self._lower[index] = None
+        self._masks[index] = 0
+        self._dead += 1
+        self._generation += 1
+        if self._dead > 1024 and self._dead > len(self.paths) // 2:
+            self.compact()
+
+    def compact(self):
+        live = [path for path in self.paths if path is not None]
+        self.paths = []
+        self._lower = []
+        self._masks = array('Q')
+        self._positions = {}
+        self._dead = 0
+        for path in live:
+            self.add(path)
+
+    def update_directory(self, directory, old_names, new_names):
+        """Apply a relisted directory: add new files, drop removed ones."""
+        for name in old_names - new_names:
+            self.remove(os.path.join(directory, name))
+        for name in new_names - old_names:
+            self.add(os.path.join(directory, name))
+
+    def query(self, text, limit=50, cancelled=None, partial=None):
+        """Return up to `limit` best matching paths, best first.
+
+        The index is scanned in chunks. Between chunks `cancelled` is polled
+        so a newer query can abort this one (None is returned then), and
+        `partial` is called with the best results so far, first after
+        FIRST_PARTIAL seconds and then every PARTIAL_INTERVAL, so a caller
+        can show something within a frame and refine it as the scan goes on.
+        """
+        query = text.lower().replace(' ', '')
+        if not query:
+            return list(islice((path for path in self.paths if path is not None), limit))
+        query_mask = char_mask(query)
+        search = re.compile('.*?'.join(map(re.escape, query))).search
+        lower = self._lower
+        masks = self._masks
+        generation = self._generation
+
+        if (self._last_query and query.startswith(self._last_query[1])
+                and self._last_query[0] == generation):
+            indices = self._last_candidates
+        else:
+            indices = range(len(masks))
+
+        candidates = []
+        # Bounded min-heap of the best cheap rankings seen so far
+        best = []
+        keep = limit * 4
+        next_partial = time.perf_counter() + FIRST_PARTIAL
+        for chunk_start in range(0, len(indices), CHUNK_SIZE):
+            if cancelled is not None and cancelled():
+                return None
+            for index in indices[chunk_start:chunk_start + CHUNK_SIZE]:
+                if masks[index] & query_mask != query_mask:
+                    continue
+                path = lower[index]
+                match = search(path)
+                if match is None:
+                    continue
+                candidates.append(index)
+                # Cheap ranking from the regex span; tight matches in the
+                # file name come first
+                entry = (match.start() > path.rfind(os.sep),
+                         match.start() - match.end(), -len(path), index)
+                if len(best) < keep:
+                    heapq.heappush(best, entry)
+                elif entry > best[0]:
+                    heapq.heapreplace(best, entry)
+            if (partial is not None and chunk_start + CHUNK_SIZE < len(indices)
+                    and time.perf_counter() >= next_partial):
+                partial(self._rank(query, best, limit))
+                next_partial = time.perf_counter() + PARTIAL_INTERVAL
+        self._last_query = (generation, query)
+        self._last_candidates = candidates
+        return self._rank(query, best, limit)
+
+    def _rank(self, query, best, limit):
+        # Finer scoring pass over the best cheap candidates only
+        results = []
+        lower = self._lower
+        for in_name, span, length, index in best:
+            path = lower[index]
+            score = fuzzy_score(query, path, path.rfind(os.sep) + 1)
+            if score is not None:
+                results.append((score, -index))
+        results.sort(reverse=True)
+        return [self.paths[-index] for score, index in results[:limit]]
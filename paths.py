@@ -0,0 +1,12 @@
+"""Where the editor keeps its per-user files.
+
+The tree cache, symbol index, recovery journals and profiler dumps all
+live under one cache directory, `$XDG_CACHE_HOME/cassata` or
+`~/.cache/cassata`.
+"""
+import os
+
+
+def cache_dir():
+    base = os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache')
+    return os.path.join(base, 'cassata')
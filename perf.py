@@ -1,15 +1,16 @@
-import os
-import configparser
-import threading
-import cProfile
+# Imported first so the startup timeline covers the Kivy imports
+from startup import after_first_frame, trace
 from kivy.app import App
 from kivy.uix.boxlayout import BoxLayout
-from kivy.uix.textinput import TextInput
-from kivy.uix.label import Label
-from kivy.graphics import Color, Rectangle
 from kivy.clock import Clock, mainthread
-from kivy.uix.anchorlayout import AnchorLayout
 from kivy import Config
+from editor import EditorInput
+from frame_stats import REFRESH_INTERVAL, FrameStats
+from governor import Level, PerformanceGovernor
+from profiler import SamplingProfiler, bind_hotkey
+from settings import get_settings
+from watcher import get_watcher
+from theme import Theme
 
 # Enable GPU acceleration
 Config.set('graphics', 'multisamples', '0')
@@ -19,142 +20,163 @@ Config.set('graphics', 'backend', 'sdl2')
 
 # Define the configuration file path
 config_file_path = 'app_config.conf'
+# Coalescing delay of the file watcher at full performance
+WATCHER_DELAY = 0.05
+
+trace.mark('imports')
 
 class TextInputApp(App):
     def __init__(self, **kwargs):
         super().__init__(**kwargs)
-        self.bg_color = "#FFFFFF"
-        self.debug_mode = False
-        self.performance_mode = False
-        self.stop_threads = False
+        self.decorations = True
+        self.bottom_layout = None
 
     def on_start(self):
-        self.profile = cProfile.Profile()
-        self.profile.enable()
-
-        # Load the configuration in a background thread
-        threading.Thread(target=self.load_config_in_background, daemon=True).start()
-
-        # Schedule FPS updates
-        Clock.schedule_interval(self.update_fps, 1 / 60.0)
+        # First frame and first keystroke complete the startup timeline
+        trace.install()
+        # Secondary panes are built after the first frame is drawn
+        after_first_frame(self.build_secondary_panes)
+
+        # Sampling profiler: off unless enabled in the settings or with F9
+        self.profiler = SamplingProfiler(self.settings['profile_dir'])
+        bind_hotkey(self.profiler)
+        if self.settings['profiling']:
+            self.profiler.start()
+
+        # Settings were loaded before build(), reload only when the file changes
+        self.settings.watch()
+
+        # Record frame times; the overlay is refreshed a few times per second
+        self.frame_stats = FrameStats()
+        self.frame_stats.start()
+        if self.settings['frame_stats_file']:
+            self.frame_stats.stream_to(self.settings['frame_stats_file'])
+
+        # Degrade step by step when frames get slow, most visible last
+        self.governor = PerformanceGovernor(self.frame_stats, [
+            Level("pause syntax highlighting",
+                  lambda: self.text_input.pause_highlighting(True),
+                  lambda: self.text_input.pause_highlighting(False)),
+            Level("throttle file watchers",
+                  lambda: self.set_watcher_delay(1.0),
+                  lambda: self.set_watcher_delay(WATCHER_DELAY)),
+            Level("drop decorations",
+                  lambda: self.set_decorations(False),
+                  lambda: self.set_decorations(True)),
+        ])
+        # performance_mode keeps the full editor regardless of frame times
+        if not self.settings['performance_mode']:
+            self.governor.start()
 
     def on_stop(self):
-        self.profile.disable()
-        self.profile.dump_stats('myapp.profile')
-        self.stop_threads = True
+        self.profiler.stop()
+        self.frame_stats.stop()
 
     def build(self):
         # Main layout
         self.layout = BoxLayout(orientation='vertical', padding=10, spacing=10)
 
-        # Background color
-        with self.layout.canvas.before:
-            Color(*self.hex_to_rgb(self.bg_color))
-            self.rect = Rectangle(size=self.layout.size, pos=self.layout.pos)
-        self.layout.bind(size=self._update_rect, pos=self._update_rect)
+        # Background color; the theme recolors its instructions in place
+        self.theme = Theme()
+        self.theme.add_rect("background", self.layout)
 
         # Text input
-        self.text_input = TextInput(
-            text="Hello world", height=40, multiline=True,
-            background_color=self.hex_to_rgb(self.bg_color) + (1,),
-        )
-        self.text_input.bind(text=self.update_char_count)
+        self.text_input = EditorInput(text="Hello world", height=40, multiline=True)
 
-        # Character count label
-        self.char_count_label = Label(
-            text="Characters: 0", size_hint=(1, None), height=40
-        )
+        # The FPS overlay and status bar follow after the first frame
+        self.layout.add_widget(self.text_input)
 
-        # FPS label (anchored at top-left)
-        self.fps_label = Label(
-            text="FPS: 0", size_hint=(None, None), size=(100, 30),
-            color=(1, 1, 1, 1), halign="left", valign="middle"
-        )
+        self.theme.bind(self.apply_palette)
+        self.update_colors()
+
+        trace.mark('build')
+        return self.layout
+
+    def build_secondary_panes(self, dt):
+        """Add the FPS overlay and status bar once the editor is on screen."""
+        from kivy.uix.anchorlayout import AnchorLayout
+
+        from stats import DocumentStats
+        from status_bar import StatusBar
+
+        # Status text is drawn from a glyph atlas, updates never rasterize
+        self.status_bar = StatusBar()
+        self.status_bar.add_field("stats", "Characters: 0")
+        self.stats = DocumentStats(self.text_input.document)
+        self.stats.bind(self.update_char_count)
+        self.text_input.bind(selection_text=self.update_selection)
+
+        # FPS overlay (anchored at top-left), redrawn several times a second
+        self.fps_bar = StatusBar(size_hint=(None, None), size=(640, 30), padding=0)
+        self.fps_bar.add_field("fps", "FPS: 0")
         self.fps_anchor = AnchorLayout(
             anchor_x="left", anchor_y="top", size_hint=(1, 1)
         )
-        self.fps_anchor.add_widget(self.fps_label)
+        self.fps_anchor.add_widget(self.fps_bar)
 
         # Bottom layout for character count
         self.bottom_layout = BoxLayout(orientation="horizontal", size_hint=(1, None), height=40)
-        with self.bottom_layout.canvas.before:
-            Color(0.7, 0.7, 0.7, 1)  # Gray border
-            self.border_rect = Rectangle(size=(0, 0), pos=(0, 0))
-        self.bottom_layout.bind(size=self._update_border_rect, pos=self._update_border_rect)
-        self.bottom_layout.add_widget(self.char_count_label)
-
-        # Add elements to the layout
-        self.layout.add_widget(self.fps_anchor)
-        self.layout.add_widget(self.text_input)
-        self.layout.add_widget(self.bottom_layout)
+        self.theme.add_rect("border", self.bottom_layout, (0.7, 0.7, 0.7, 1))  # Gray border
+        self.bottom_layout.add_widget(self.status_bar)
+        self.bottom_layout.opacity = 1 if self.decorations else 0
 
-        return self.layout
+        # The overlay goes above the editor, the status bar below it
+        self.layout.add_widget(self.fps_anchor, index=len(self.layout.children))
+        self.layout.add_widget(self.bottom_layout)
 
-    def _update_rect(self, instance, value):
-        self.rect.size = instance.size
-        self.rect.pos = instance.pos
+        self.theme.bind(self.apply_status_palette)
+        Clock.schedule_interval(self.update_fps, REFRESH_INTERVAL)
+        trace.mark('secondary panes')
 
-    def _update_border_rect(self, instance, value):
-        self.border_rect.size = instance.size
-        self.border_rect.pos = instance.pos
+    def update_char_count(self, stats):
+        self.status_bar.set("stats", stats.summary())
 
-    @mainthread
-    def update_char_count(self, instance, value):
-        self.char_count_label.text = f"Characters: {len(value)}"
+    def update_selection(self, instance, value):
+        self.stats.set_selection(value)
 
     def update_fps(self, dt):
-        fps = Clock.get_rfps()
-        self.fps_label.text = f"FPS: {fps:.1f}"
-
-        # Toggle visibility based on FPS
-        if fps < 10 and not self.performance_mode:
-            self.set_visibility(False)
-        elif fps >= 10:
-            self.set_visibility(True)
-
-    def set_visibility(self, visible):
-        opacity = 1 if visible else 0
-        self.text_input.opacity = opacity
-        self.bottom_layout.opacity = opacity
-
-    def load_config_in_background(self):
-        while not self.stop_threads:
-            config = configparser.ConfigParser()
-            config.read(config_file_path)
-            self.bg_color = config.get("Settings", "background_color", fallback="#FFFFFF")
-            self.debug_mode = config.getboolean("Settings", "debug_mode", fallback=False)
-            self.performance_mode = config.getboolean("Settings", "performance_mode", fallback=False)
-            Clock.schedule_once(self.update_colors)
-            Clock.schedule_once(self.update_text_color)
-            threading.Event().wait(1)  # Check every second
+        self.fps_bar.set("fps", self.frame_stats.summary())
+        self.frame_stats.flush()
+
+    def set_watcher_delay(self, delay):
+        get_watcher().delay = delay
+
+    def set_decorations(self, visible):
+        # Remembered for the status bar if it is not built yet
+        self.decorations = visible
+        if self.bottom_layout is not None:
+            self.bottom_layout.opacity = 1 if visible else 0
+
+    def load_config(self):
+        # Kivy calls this before build(); settings are parsed once and shared
+        self.settings = get_settings(config_file_path)
+        self.settings.bind(self.on_settings_changed)
+        trace.mark('config')
+
+    def on_settings_changed(self, changed):
+        if "background_color" in changed:
+            self.update_colors()
+        if "performance_mode" in changed:
+            if changed["performance_mode"]:
+                self.governor.stop()
+            else:
+                self.governor.start()
+        if "profiling" in changed:
+            if changed["profiling"]:
+                self.profiler.start()
+            else:
+                self.profiler.stop()
 
     @mainthread
     def update_colors(self, *args):
-        with self.layout.canvas.before:
-            Color(*self.hex_to_rgb(self.bg_color))
-            self.rect = Rectangle(size=self.layout.size, pos=self.layout.pos)
-        self.text_input.background_color = self.hex_to_rgb(self.bg_color) + (1,)
+        self.theme.apply(self.settings["background_color"])
 
-    @mainthread
-    def update_text_color(self, *args):
-        brightness = self.get_brightness(self.bg_color)
-        color = (1, 1, 1, 1) if brightness < 0.5 else (0, 0, 0, 1)
-        self.text_input.foreground_color = color
-        self.char_count_label.color = color
-
-    def hex_to_rgb(self, hex_color):
-        hex_color = hex_color.lstrip("#")
-        if len(hex_color) == 6:
-            r, g, b = hex_color[:2], hex_color[2:4], hex_color[4:6]
-        elif len(hex_color) == 3:
-            r, g, b = hex_color[0] * 2, hex_color[1] * 2, hex_color[2] * 2
-        else:
-            raise ValueError("Invalid hex color format")
-        return tuple(int(x, 16) / 255 for x in (r, g, b))
-
-    def get_brightness(self, hex_color):
-        r, g, b = self.hex_to_rgb(hex_color)
-        return r * 0.299 + g * 0.587 + b * 0.114
+    def apply_palette(self, palette):
+        self.text_input.background_color = palette.background
+        self.text_input.foreground_color = palette.foreground
+
+    def apply_status_palette(self, palette):
+        self.status_bar.color = palette.foreground
 
 # Run the app
 if __name__ == "__main__":
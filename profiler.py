@@ -0,0 +1,208 @@
+"""Low-overhead sampling profiler and a CLI for its dumps.
+
+The profiler wakes up every few milliseconds on its own thread, records
+the main thread's stack and counts identical stacks. Nothing is hooked
+into the interpreter, so while it is off it costs nothing and while it
+is on the cost does not grow with the number of Python calls.
+
+Dumps go to `profiles/` in the cache directory unless the `profile_dir`
+setting names another one. They are written in the collapsed-stack
+format used by flamegraph tools, one `frame;frame;frame count` line per
+stack:
+
+    python profiler.py collapse ~/.cache/cassata/profiles/*.folded -o session.folded
+    python profiler.py diff before.folded --after after.folded
+"""
+import argparse
+import glob
+import os
+import sys
+import threading
+import time
+from collections import Counter
+
+from paths import cache_dir
+
+SAMPLE_INTERVAL = 0.005
+# Samples are written out this often so a crash loses little data
+DUMP_INTERVAL = 60.0
+KEEP_DUMPS = 20
+# F9 toggles profiling in the apps
+HOTKEY = 290
+
+
+def profile_dir():
+    return os.path.join(cache_dir(), 'profiles')
+
+
+def _frame_name(frame):
+    code = frame.f_code
+    return f"{os.path.basename(code.co_filename)}:{code.co_name}"
+
+
+class SamplingProfiler:
+    """Samples the main thread's stack on a timer thread.
+
+    `start`, `stop` and `toggle` can be called at any time; each session
+    is written to timestamped files in `directory` (`profile_dir()` by
+    default), and only the newest `keep` dumps are kept.
+    """
+
+    def __init__(self, directory=None, interval=SAMPLE_INTERVAL,
+                 dump_interval=DUMP_INTERVAL, keep=KEEP_DUMPS):
+        self.directory = directory or profile_dir()
+        self.interval = interval
+        self.dump_interval = dump_interval
+        self.keep = keep
+        self.counts = Counter()
+        self._lock = threading.Lock()
+        self._stop = None
+        self._thread = None
+
+    @property
+    def running(self):
+        return self._thread is not None
+
+    def start(self):
+        if self._thread is not None:
+            return
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, args=(self._stop,), daemon=True)
+        self._thread.start()
+        print("Profiler started")
+
+    def stop(self):
+        if self._thread is None:
+            return
+        self._stop.set()
+        self._thread.join()
+        self._thread = None
+        path = self.dump()
+        print(f"Profiler stopped, samples written to {path}" if path else "Profiler stopped")
+
+    def toggle(self):
+        if self.running:
+            self.stop()
+        else:
+            self.start()
+
+    def _run(self, stop):
+        main_ident = threading.main_thread().ident
+        last_dump = time.monotonic()
+        while not stop.wait(self.interval):
+            frame = sys._current_frames().get(main_ident)
+            stack = []
+            while frame is not None:
+                stack.append(_frame_name(frame))
+                frame = frame.f_back
+            if stack:
+                stack.reverse()
+                with self._lock:
+                    self.counts[';'.join(stack)] += 1
+            if time.monotonic() - last_dump > self.dump_interval:
+                self.dump()
+                last_dump = time.monotonic()
+
+    def dump(self):
+        """Write and clear the collected samples; returns the file path."""
+        with self._lock:
+            counts = self.counts
+            self.counts = Counter()
+        if not counts:
+            return None
+        os.makedirs(self.directory, exist_ok=True)
+        stamp = time.strftime('%Y%m%d-%H%M%S')
+        path = os.path.join(self.directory, f"profile-{stamp}-{os.getpid()}.folded")
+        write_collapsed(path, counts, mode='a')
+        self._rotate()
+        return path
+
+    def _rotate(self):
+        dumps = sorted(glob.glob(os.path.join(self.directory, 'profile-*.folded')))
+        for path in dumps[:-self.keep]:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+
+def bind_hotkey(profiler, key=HOTKEY):
+    """Toggle `profiler` with a key (F9 by default) in a running app."""
+    # Imported here so the CLI never opens a window
+    from kivy.core.window import Window
+
+    def on_key_down(window, keycode, scancode, codepoint, modifiers):
+        if keycode == key:
+            profiler.toggle()
+            return True
+        return False
+
+    Window.bind(on_key_down=on_key_down)
+
+
+def read_collapsed(paths):
+    counts = Counter()
+    for path in paths:
+        with open(path) as source:
+            for line in source:
+                stack, _, count = line.rstrip('\n').rpartition(' ')
+                if stack and count.isdigit():
+                    counts[stack] += int(count)
+    return counts
+
+
+def write_collapsed(path, counts, mode='w'):
+    lines = [f"{stack} {count}\n" for stack, count in counts.most_common()]
+    if path == '-':
+        sys.stdout.writelines(lines)
+    else:
+        with open(path, mode) as target:
+            target.writelines(lines)
+
+
+def self_times(counts):
+    """Samples per function where it was the innermost frame."""
+    result = Counter()
+    for stack, count in counts.items():
+        result[stack.rpartition(';')[2]] += count
+    return result
+
+
+def diff(before, after, limit=30):
+    """Rows of (function, before %, after %) sorted by the largest change."""
+    before_self = self_times(before)
+    after_self = self_times(after)
+    before_total = sum(before_self.values()) or 1
+    after_total = sum(after_self.values()) or 1
+    rows = []
+    for name in before_self.keys() | after_self.keys():
+        old = 100 * before_self[name] / before_total
+        new = 100 * after_self[name] / after_total
+        rows.append((name, old, new))
+    rows.sort(key=lambda row: abs(row[2] - row[1]), reverse=True)
+    return rows[:limit]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    commands = parser.add_subparsers(dest='command', required=True)
+    collapse = commands.add_parser('collapse', help='merge dumps into one collapsed-stack file')
+    collapse.add_argument('dumps', nargs='+')
+    collapse.add_argument('-o', '--output', default='-')
+    compare = commands.add_parser('diff', help='compare self time between two sessions')
+    compare.add_argument('before', nargs='+')
+    compare.add_argument('--after', nargs='+', required=True)
+    compare.add_argument('-n', '--limit', type=int, default=30)
+    args = parser.parse_args(argv)
+
+    if args.command == 'collapse':
+        write_collapsed(args.output, read_collapsed(args.dumps))
+    else:
+        rows = diff(read_collapsed(args.before), read_collapsed(args.after), args.limit)
+        print(f"{'before':>8} {'after':>8} {'change':>8}  function")
+        for name, old, new in rows:
+            print(f"{old:7.2f}% {new:7.2f}% {new - old:+7.2f}%  {name}")
+
+
+if __name__ == '__main__':
+    main()
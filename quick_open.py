@@ -0,0 +1,186 @@
+import os
+import threading
+from collections import deque
+
+from kivy.clock import Clock
+from kivy.uix.boxlayout import BoxLayout
+from kivy.uix.button import Button
+from kivy.uix.modalview import ModalView
+from kivy.uix.recycleboxlayout import RecycleBoxLayout
+from kivy.uix.recycleview import RecycleView
+from kivy.uix.textinput import TextInput
+
+from path_index import IGNORED_DIRS, PathIndex
+from tree_cache import unpack_entries
+
+RESULT_HEIGHT = 28
+
+
+class FuzzyFinder:
+    """Keeps a PathIndex on its own worker thread.
+
+    Index updates and queries are queued and run in order on that thread,
+    so the index needs no locking and the UI thread never waits on a
+    match. A newer query cancels the one in progress. When a relisted
+    directory gained a subdirectory, `on_new_directory(path)` is called
+    on the main thread so the caller can scan that subtree.
+    """
+
+    def __init__(self, on_new_directory=None):
+        self.index = PathIndex()
+        self.on_new_directory = on_new_directory
+        # directory -> set of file names currently in the index
+        self._files = {}
+        # directory -> set of its subdirectory names
+        self._dirs = {}
+        self._jobs = deque()
+        self._wakeup = threading.Condition()
+        self._generation = 0
+        threading.Thread(target=self._work, daemon=True).start()
+
+    def _put(self, job):
+        with self._wakeup:
+            self._jobs.append(job)
+            self._wakeup.notify()
+
+    def load_records(self, records):
+        """Seed the index from the explorer's cached tree records."""
+        self._put((self._load_records, dict(records)))
+
+    def update(self, batch):
+        """Apply a batch of scanned directories from the explorer."""
+        self._put((self._update, batch))
+
+    def search(self, text, callback):
+        """Match `text`; `callback(results)` runs on the main thread, possibly
+        several times as partial results are refined."""
+        self._generation += 1
+        self._put((self._search, (self._generation, text, callback)))
+
+    def _work(self):
+        while True:
+            with self._wakeup:
+                while not self._jobs:
+                    self._wakeup.wait()
+                function, argument = self._jobs.popleft()
+            function(argument)
+
+    def _set_directory(self, directory, entries):
+        if any(part in IGNORED_DIRS for part in directory.split(os.sep)):
+            return
+        names = {name for name, is_dir in entries if not is_dir}
+        subdirectories = {name for name, is_dir in entries if is_dir}
+        known = directory in self._dirs
+        old_names = self._files.get(directory, set())
+        old_subdirectories = self._dirs.get(directory, set())
+        self._files[directory] = names
+        self._dirs[directory] = subdirectories
+        base = '' if directory == os.curdir else directory
+        self.index.update_directory(base, old_names, names)
+        # A subdirectory that is gone takes its whole indexed subtree along
+        for name in old_subdirectories - subdirectories:
+            self._remove_tree(os.path.join(base, name))
+        if known and self.on_new_directory is not None:
+            for name in subdirectories - old_subdirectories:
+                if name not in IGNORED_DIRS:
+                    self._deliver(self.on_new_directory, os.path.join(base, name))
+
+    def _remove_tree(self, path):
+        prefix = path + os.sep
+        for directory in [directory for directory in self._files
+                          if directory == path or directory.startswith(prefix)]:
+            self.index.update_directory(directory, self._files.pop(directory), set())
+            self._dirs.pop(directory, None)
+
+    def _deliver(self, callback, path):
+        Clock.schedule_once(lambda dt: callback(path))
+
+    def _load_records(self, records):
+        for directory, (mtime, inode, entries) in records.items():
+            self._set_directory(directory, unpack_entries(entries))
+
+    def _update(self, batch):
+        for directory, entries in batch:
+            if entries is None:
+                self._set_directory(directory, ())
+            else:
+                self._set_directory(directory, entries)
+
+    def _search(self, job):
+        generation, text, callback = job
+        if generation != self._generation:
+            return  # Superseded before it started
+
+        def cancelled():
+            return generation != self._generation
+
+        def deliver(results):
+            Clock.schedule_once(lambda dt: cancelled() or callback(results))
+
+        results = self.index.query(text, cancelled=cancelled, partial=deliver)
+        if results is not None:
+            deliver(results)
+
+
+class ResultRow(Button):
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.halign = 'left'
+        self.valign = 'middle'
+        self.shorten = True
+        self.bind(size=self._update_text_size)
+
+    def _update_text_size(self, instance, value):
+        self.text_size = self.size
+
+    def on_press(self):
+        self.parent.parent.palette.choose(self.text)
+
+
+class QuickOpen(ModalView):
+    """Quick-open palette: type to fuzzy-match file paths, pick to open."""
+
+    def __init__(self, finder, on_choose, **kwargs):
+        kwargs.setdefault('size_hint', (0.6, 0.6))
+        kwargs.setdefault('pos_hint', {'top': 0.95})
+        super().__init__(**kwargs)
+        self.finder = finder
+        self.on_choose = on_choose
+
+        layout = BoxLayout(orientation='vertical', spacing=5, padding=5)
+        self.query_input = TextInput(multiline=False, size_hint_y=None, height=36)
+        self.query_input.bind(text=self.on_query)
+        self.query_input.bind(on_text_validate=self.choose_first)
+
+        self.results = RecycleView()
+        self.results.palette = self
+        self.results.viewclass = ResultRow
+        rows_layout = RecycleBoxLayout(
+            orientation='vertical', size_hint=(1, None),
+            default_size=(None, RESULT_HEIGHT), default_size_hint=(1, None)
+        )
+        rows_layout.bind(minimum_height=rows_layout.setter('height'))
+        self.results.add_widget(rows_layout)
+
+        layout.add_widget(self.query_input)
+        layout.add_widget(self.results)
+        self.add_widget(layout)
+
+    def on_open(self):
+        self.query_input.text = ''
+        self.query_input.focus = True
+        self.on_query(self.query_input, '')
+
+    def on_query(self, instance, value):
+        self.finder.search(value, self.show_results)
+
+    def show_results(self, results):
+        self.results.data = [{'text': path} for path in results]
+
+    def choose_first(self, instance):
+        if self.results.data:
+            self.choose(self.results.data[0]['text'])
+
+    def choose(self, path):
+        self.dismiss()
+        self.on_choose(path)
@@ -0,0 +1,110 @@
+import os
+import queue
+import threading
+import time
+from collections import deque
+
+from kivy.clock import Clock
+
+
+class DirectoryScanner:
+    """Lists directories on a fixed pool of worker threads.
+
+    Workers use `os.scandir`, so `is_dir` comes from the cached directory
+    entry instead of an extra stat per item. Results are handed to
+    `callback` on the main thread as a list of
+    (path, entries, mtime_ns, inode) tuples, where entries are
+    (name, is_dir) tuples, or None if the directory no longer exists.
+    Subdirectories are followed up to `max_depth` levels below the
+    requested path, except those named in `skip` and symlinks, which are
+    listed as directories but never descended into, so a link cycle
+    cannot make a deep scan explode.
+    """
+
+    def __init__(self, callback, workers=4, batch_time=0.004):
+        self.callback = callback
+        self.batch_time = batch_time
+        self._tasks = queue.Queue()
+        self._results = deque()
+        self._generation = 0
+        self._threads = []
+        self._workers = workers
+        self._trigger = Clock.create_trigger(self._deliver, 0)
+
+    def _start(self):
+        for _ in range(self._workers):
+            thread = threading.Thread(target=self._work, daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def scan(self, path, max_depth=0, skip=()):
+        """Queue `path` for listing, following subdirectories `max_depth` deep."""
+        if not self._threads:
+            self._start()
+        self._tasks.put((self._generation, path, max_depth, skip))
+
+    def cancel(self):
+        """Drop every queued, running and undelivered scan."""
+        self._generation += 1
+        try:
+            while True:
+                self._tasks.get_nowait()
+        except queue.Empty:
+            pass
+        self._results.clear()
+
+    def _work(self):
+        while True:
+            generation, path, depth, skip = self._tasks.get()
+            if generation != self._generation:
+                continue
+            entries = []
+            links = set()
+            try:
+                # Stat before listing so a change during the scan is caught
+                # by the next mtime check
+                info = os.stat(path)
+            except OSError:
+                self._results.append((generation, path, None, 0, 0))
+                self._trigger()
+                continue
+            try:
+                with os.scandir(path) as items:
+                    for entry in items:
+                        try:
+                            is_dir = entry.is_dir()
+                            if is_dir and entry.is_symlink():
+                                links.add(entry.name)
+                        except OSError:
+                            is_dir = False
+                        entries.append((entry.name, is_dir))
+            except PermissionError:
+                print(f"Permission denied to access {path}")
+            except OSError:
+                pass
+            if generation != self._generation:
+                continue
+            # Publish the parent before queueing its children so results
+            # always arrive parent first
+            self._results.append((generation, path, entries, info.st_mtime_ns, info.st_ino))
+            self._trigger()
+            if depth > 0:
+                for name, is_dir in entries:
+                    if is_dir and name not in skip and name not in links:
+                        self._tasks.put((generation, os.path.join(path, name), depth - 1, skip))
+
+    def _deliver(self, dt):
+        # Hand over as many results as fit in the time budget of one frame
+        deadline = time.perf_counter() + self.batch_time
+        batch = []
+        results = self._results
+        while results:
+            result = results.popleft()
+            if result[0] == self._generation:
+                batch.append(result[1:])
+            if time.perf_counter() > deadline:
+                break
+        if results:
+            self._trigger()
+        if batch:
+            self.callback(batch)
@@ -0,0 +1,307 @@
+import mmap
+import os
+import re
+import threading
+import time
+from collections import deque
+from multiprocessing.sharedctypes import RawValue
+
+from kivy.clock import Clock
+from kivy.properties import NumericProperty, StringProperty
+from kivy.uix.boxlayout import BoxLayout
+from kivy.uix.button import Button
+from kivy.uix.label import Label
+from kivy.uix.modalview import ModalView
+from kivy.uix.recycleboxlayout import RecycleBoxLayout
+from kivy.uix.recycleview import RecycleView
+from kivy.uix.textinput import TextInput
+
+from path_index import IGNORED_DIRS
+from workers import get_context
+
+# Bytes looked at to decide whether a file is binary
+BINARY_SNIFF = 8192
+# Caps that keep a broad query from flooding memory and the UI
+MAX_MATCHES_PER_FILE = 200
+MAX_MATCHES = 20000
+MAX_LINE_PREVIEW = 200
+# Largest slice copied at once while counting lines between matches
+COUNT_CHUNK = 1 << 20
+# Files handed to the pool and not yet answered. The pool's task handler
+# reads paths only this far ahead, so a cancelled search stops walking
+# the tree instead of queueing all of it in front of the next search.
+MAX_IN_FLIGHT = 256
+
+RESULT_HEIGHT = 26
+
+# Set in each worker by the pool initializer: the generation of the search
+# that is currently wanted. Tasks from an older generation stop early.
+_current_generation = None
+_patterns = {}
+
+
+def _init_worker(generation):
+    global _current_generation
+    _current_generation = generation
+
+
+def _count_newlines(mapped, start, end):
+    count = 0
+    while start < end:
+        stop = min(end, start + COUNT_CHUNK)
+        count += mapped[start:stop].count(b'\n')
+        start = stop
+    return count
+
+
+def search_file(task):
+    """Search one file in a worker process.
+
+    The file is memory-mapped and the regex runs over the mapping, so the
+    file is never decoded into a Python string. Returns a list of
+    (path, line_number, column, preview) tuples.
+    """
+    generation, path, pattern, flags = task
+    if _current_generation is not None and _current_generation.value != generation:
+        return path, []
+    key = (pattern, flags)
+    regex = _patterns.get(key)
+    if regex is None:
+        regex = _patterns[key] = re.compile(pattern, flags)
+    matches = []
+    try:
+        with open(path, 'rb') as source:
+            if os.fstat(source.fileno()).st_size == 0:
+                return path, matches
+            with mmap.mmap(source.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                if b'\0' in mapped[:BINARY_SNIFF]:
+                    return path, matches
+                line = 1
+                counted = 0
+                for match in regex.finditer(mapped):
+                    start = match.start()
+                    line += _count_newlines(mapped, counted, start)
+                    counted = start
+                    line_start = mapped.rfind(b'\n', 0, start) + 1
+                    line_end = mapped.find(b'\n', start)
+                    if line_end == -1:
+                        line_end = len(mapped)
+                    preview = mapped[line_start:min(line_end, line_start + MAX_LINE_PREVIEW)]
+                    matches.append((path, line, start - line_start,
+                                    preview.decode('utf-8', 'replace').strip()))
+                    if len(matches) >= MAX_MATCHES_PER_FILE:
+                        break
+                    if (_current_generation is not None
+                            and _current_generation.value != generation):
+                        break
+    except (OSError, ValueError):
+        pass
+    return path, matches
+
+
+def iter_files(root):
+    """Yield the files under `root`, skipping ignored directories."""
+    stack = [root]
+    while stack:
+        directory = stack.pop()
+        try:
+            with os.scandir(directory) as entries:
+                for entry in entries:
+                    try:
+                        if entry.is_dir(follow_symlinks=False):
+                            if entry.name not in IGNORED_DIRS:
+                                stack.append(entry.path)
+                        elif entry.is_file():
+                            yield entry.path
+                    except OSError:
+                        continue
+        except OSError:
+            continue
+
+
+class ProjectSearch:
+    """Find-in-files across a process pool with streamed results.
+
+    `start(query, callback)` cancels any running search; `callback(batch)`
+    is called on the main thread with lists of matches as workers find
+    them, and `done_callback()` once the search finished.
+    """
+
+    def __init__(self, root_path, processes=None, batch_time=0.004):
+        self.root_path = root_path
+        self.processes = processes
+        self.batch_time = batch_time
+        self._pool = None
+        # Workers get this value when they start and read it between matches
+        self._generation = RawValue('i', 0)
+        self._results = deque()
+        # Generation whose results are still wanted by the UI
+        self._active = None
+        self._callback = None
+        self._done_callback = None
+        self._trigger = Clock.create_trigger(self._deliver, 0)
+
+    def _ensure_pool(self):
+        if self._pool is None:
+            self._pool = get_context().Pool(self.processes, initializer=_init_worker,
+                                            initargs=(self._generation,))
+        return self._pool
+
+    def start(self, query, callback, done_callback=None, regex=False, case_sensitive=False):
+        self.cancel()
+        if not query:
+            return
+        generation = self._active = self._generation.value
+        pattern = query.encode('utf-8') if regex else re.escape(query.encode('utf-8'))
+        flags = 0 if case_sensitive else re.IGNORECASE
+        self._callback = callback
+        self._done_callback = done_callback
+        pool = self._ensure_pool()
+        threading.Thread(target=self._collect, args=(pool, generation, pattern, flags),
+                         daemon=True).start()
+
+    def cancel(self):
+        """Stop the running search; workers notice before their next match."""
+        self._generation.value += 1
+        self._active = None
+        self._results.clear()
+
+    def close(self):
+        self.cancel()
+        if self._pool is not None:
+            self._pool.terminate()
+            self._pool = None
+
+    def _collect(self, pool, generation, pattern, flags):
+        window = threading.Semaphore(MAX_IN_FLIGHT)
+
+        def tasks():
+            # Runs on the pool's task handler thread, which every search
+            # shares: it must return promptly once this search is cancelled
+            for path in iter_files(self.root_path):
+                while not window.acquire(timeout=0.05):
+                    if self._generation.value != generation:
+                        return
+                if self._generation.value != generation:
+                    return
+                yield generation, path, pattern, flags
+
+        found = 0
+        for path, matches in pool.imap_unordered(search_file, tasks(), chunksize=8):
+            window.release()
+            if self._generation.value != generation:
+                return
+            if matches:
+                found += len(matches)
+                self._results.append((generation, matches))
+                self._trigger()
+            if found >= MAX_MATCHES:
+                # Stop the workers but still deliver what was found
+                self._generation.value += 1
+                break
+        self._results.append((generation, None))
+        self._trigger()
+
+    def _deliver(self, dt):
+        # Hand over what fits in a frame's time budget, the rest next frame
+        deadline = time.perf_counter() + self.batch_time
+        batch = []
+        finished = False
+        results = self._results
+        while results and time.perf_counter() < deadline:
+            generation, matches = results.popleft()
+            if generation != self._active:
+                continue
+            if matches is None:
+                finished = True
+            else:
+                batch.extend(matches)
+        if results:
+            self._trigger()
+        if batch and self._callback is not None:
+            self._callback(batch)
+        if finished and self._done_callback is not None:
+            self._done_callback()
+
+
+class SearchResultRow(Button):
+    path = StringProperty('')
+    line = NumericProperty(0)
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.halign = 'left'
+        self.valign = 'middle'
+        self.shorten = True
+        self.bind(size=self._update_text_size)
+
+    def _update_text_size(self, instance, value):
+        self.text_size = self.size
+
+    def on_press(self):
+        self.parent.parent.panel.choose(self.path, self.line)
+
+
+class FindInFiles(ModalView):
+    """Find-in-files panel; results stream in while the search runs."""
+
+    def __init__(self, search, on_choose, **kwargs):
+        kwargs.setdefault('size_hint', (0.8, 0.8))
+        super().__init__(**kwargs)
+        self.search = search
+        self.on_choose = on_choose
+        # Wait for a short pause in typing before starting a new search
+        self._start_trigger = Clock.create_trigger(self._start_search, 0.15)
+
+        layout = BoxLayout(orientation='vertical', spacing=5, padding=5)
+        self.query_input = TextInput(multiline=False, size_hint_y=None, height=36)
+        self.query_input.bind(text=self.on_query)
+        self.status_label = Label(text='', size_hint_y=None, height=24)
+
+        self.results = RecycleView()
+        self.results.panel = self
+        self.results.viewclass = SearchResultRow
+        rows_layout = RecycleBoxLayout(
+            orientation='vertical', size_hint=(1, None),
+            default_size=(None, RESULT_HEIGHT), default_size_hint=(1, None)
+        )
+        rows_layout.bind(minimum_height=rows_layout.setter('height'))
+        self.results.add_widget(rows_layout)
+
+        layout.add_widget(self.query_input)
+        layout.add_widget(self.status_label)
+        layout.add_widget(self.results)
+        self.add_widget(layout)
+
+    def on_open(self):
+        self.query_input.focus = True
+
+    def on_dismiss(self):
+        self.search.cancel()
+
+    def on_query(self, instance, value):
+        # Cancel right away so workers stop, start the new one after a pause
+        self.search.cancel()
+        self.results.data = []
+        self._start_trigger()
+
+    def _start_search(self, dt):
+        query = self.query_input.text
+        self.status_label.text = 'Searching...' if query else ''
+        self.search.start(query, self.add_results, self.search_done)
+
+    def add_results(self, batch):
+        root = self.search.root_path
+        self.results.data.extend(
+            {'text': f"{os.path.relpath(path, root)}:{line}: {preview}",
+             'path': path, 'line': line}
+            for path, line, column, preview in batch
+        )
+        self.status_label.text = f"Searching... {len(self.results.data)} matches"
+
+    def search_done(self):
+        self.status_label.text = f"{len(self.results.data)} matches"
+
+    def choose(self, path, line):
+        self.dismiss()
+        self.on_choose(path, line)
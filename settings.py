@@ -0,0 +1,152 @@
+import configparser
+import hashlib
+import os
+import re
+from collections import namedtuple
+
+from watcher import get_watcher
+
+SECTION = 'Settings'
+
+# One typed entry of the settings schema
+Setting = namedtuple('Setting', 'name parse default')
+
+_HEX_COLOR = re.compile(r'#?(?:[0-9a-fA-F]{3}|[0-9a-fA-F]{6})')
+
+
+def parse_bool(value):
+    state = configparser.ConfigParser.BOOLEAN_STATES.get(value.strip().lower())
+    if state is None:
+        raise ValueError(f"not a boolean: {value!r}")
+    return state
+
+
+def parse_color(value):
+    value = value.strip()
+    if not _HEX_COLOR.fullmatch(value):
+        raise ValueError(f"not a hex color: {value!r}")
+    return '#' + value.lstrip('#').upper()
+
+
+SCHEMA = (
+    Setting('background_color', parse_color, '#FFFFFF'),
+    Setting('debug_mode', parse_bool, False),
+    Setting('performance_mode', parse_bool, False),
+    Setting('stop_threads', parse_bool, False),
+    Setting('profiling', parse_bool, False),
+    # Directory for profiler dumps, empty for the cache directory
+    Setting('profile_dir', str.strip, ''),
+    # CSV file that frame time samples are streamed to, empty for none
+    Setting('frame_stats_file', str.strip, ''),
+    # Memory the undo history of one document may use
+    Setting('undo_budget_mb', int, 16),
+)
+
+
+class Settings:
+    """Typed settings read from an INI file, parsed once and cached.
+
+    `load()` re-reads the file only when its mtime or size changed and
+    calls the callbacks registered with `bind` with a dict of just the
+    keys whose value actually changed. A watcher event forces a read,
+    since an edit that keeps the size within the filesystem's mtime
+    granularity leaves the stamp alone; the content digest then decides.
+    """
+
+    def __init__(self, path, schema=SCHEMA):
+        self.path = path
+        self.schema = {setting.name: setting for setting in schema}
+        self.values = {setting.name: setting.default for setting in schema}
+        self._listeners = []
+        self._stamp = None
+        self._digest = None
+        self._watching = False
+
+    def __getitem__(self, name):
+        return self.values[name]
+
+    def bind(self, callback, keys=None):
+        """Call `callback(changed)` after a reload; only for `keys` if given."""
+        keys = frozenset(keys) if keys is not None else None
+        if (callback, keys) not in self._listeners:
+            self._listeners.append((callback, keys))
+
+    def unbind(self, callback):
+        self._listeners = [entry for entry in self._listeners if entry[0] != callback]
+
+    def watch(self):
+        """Reload whenever the file changes on disk."""
+        if not self._watching:
+            self._watching = True
+            get_watcher().watch(self.path, self._on_file_changed)
+
+    def _on_file_changed(self, path):
+        self.load(force=True)
+
+    def write_defaults(self):
+        config = configparser.ConfigParser()
+        config[SECTION] = {name: str(setting.default) for name, setting in self.schema.items()}
+        with open(self.path, 'w') as configfile:
+            config.write(configfile)
+
+    def load(self, force=False):
+        """Re-read the file if it changed and return the changed values.
+
+        With `force` the (mtime, size) stamp is not trusted and the file
+        is read whenever its content differs from the last load.
+        """
+        if not os.path.exists(self.path):
+            self.write_defaults()
+        try:
+            stat = os.stat(self.path)
+            if not force and (stat.st_mtime_ns, stat.st_size) == self._stamp:
+                return {}
+            with open(self.path, 'rb') as source:
+                data = source.read()
+        except OSError as error:
+            print(f"Cannot read {self.path}: {error}")
+            return {}
+        self._stamp = (stat.st_mtime_ns, stat.st_size)
+        digest = hashlib.sha1(data).digest()
+        if digest == self._digest:
+            return {}
+        self._digest = digest
+
+        config = configparser.ConfigParser()
+        try:
+            config.read_string(data.decode('utf-8'), self.path)
+        except (configparser.Error, UnicodeDecodeError) as error:
+            print(f"Cannot parse {self.path}: {error}")
+            return {}
+        section = config[SECTION] if config.has_section(SECTION) else {}
+        changed = {}
+        for name, setting in self.schema.items():
+            value = setting.default
+            raw = section.get(name)
+            if raw is not None:
+                try:
+                    value = setting.parse(raw)
+                except ValueError as error:
+                    print(f"Ignoring setting {name}: {error}")
+            if value != self.values[name]:
+                self.values[name] = value
+                changed[name] = value
+        if changed:
+            for callback, keys in list(self._listeners):
+                if keys is None:
+                    callback(changed)
+                elif not keys.isdisjoint(changed):
+                    callback({key: changed[key] for key in keys if key in changed})
+        return changed
+
+
+_settings = {}
+
+
+def get_settings(path):
+    """Return the shared, loaded `Settings` for `path`."""
+    settings = _settings.get(path)
+    if settings is None:
+        settings = _settings[path] = Settings(path)
+        settings.load()
+    return settings
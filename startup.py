@@ -0,0 +1,95 @@
+import json
+import os
+import sys
+import time
+
+# Imported first by the apps, so this is as close to process start as the
+# tracer gets without help from the interpreter
+_START = time.perf_counter()
+
+# Cold start to an editable window we want to stay under
+STARTUP_BUDGET_MS = 1500
+# Set to a file path to have the timeline written after the first keystroke
+TRACE_ENV = 'CASSATA_STARTUP_TRACE'
+
+
+class StartupTrace:
+    """Timeline of named startup milestones, in ms since process start.
+
+    The apps mark imports, config load and build themselves; `install`
+    adds the first frame and the first keystroke. `write` dumps the
+    timeline as JSON together with the budget so runs can be compared.
+    """
+
+    def __init__(self):
+        self.marks = []
+        self._installed = False
+
+    def mark(self, name):
+        self.marks.append((name, (time.perf_counter() - _START) * 1000))
+
+    def elapsed(self, name):
+        for mark, ms in self.marks:
+            if mark == name:
+                return ms
+        return None
+
+    def install(self):
+        """Record the first frame and first keystroke of the running app."""
+        if self._installed:
+            return
+        self._installed = True
+        from kivy.core.window import Window
+
+        def on_flip(window):
+            Window.unbind(on_flip=on_flip)
+            self.mark('first frame')
+
+        def on_key_down(window, *args):
+            Window.unbind(on_key_down=on_key_down)
+            self.mark('first keystroke')
+            path = os.environ.get(TRACE_ENV)
+            if path:
+                self.write(path)
+
+        Window.bind(on_flip=on_flip, on_key_down=on_key_down)
+
+    def report(self):
+        lines = [f"{ms:8.1f} ms  {name}" for name, ms in self.marks]
+        first_frame = self.elapsed('first frame')
+        if first_frame is not None and first_frame > STARTUP_BUDGET_MS:
+            lines.append(f"first frame is over the {STARTUP_BUDGET_MS} ms budget")
+        return '\n'.join(lines)
+
+    def write(self, path):
+        data = {
+            'argv': sys.argv,
+            'budget_ms': STARTUP_BUDGET_MS,
+            'marks': [{'name': name, 'ms': round(ms, 2)} for name, ms in self.marks],
+        }
+        try:
+            with open(path, 'w') as target:
+                json.dump(data, target, indent=2)
+        except OSError as error:
+            print(f"Cannot write startup trace to {path}: {error}")
+            return
+        print(self.report())
+
+
+def after_first_frame(callback):
+    """Call `callback(dt)` on the frame after the first one is shown.
+
+    Used for panes the editor does not need to be usable, so they and
+    their imports stay out of the time to the first frame.
+    """
+    from kivy.clock import Clock
+    from kivy.core.window import Window
+
+    def on_flip(window):
+        Window.unbind(on_flip=on_flip)
+        Clock.schedule_once(callback, 0)
+
+    Window.bind(on_flip=on_flip)
+
+
+trace = StartupTrace()
@@ -0,0 +1,126 @@
+import re
+
+from kivy.clock import Clock
+
+from document import Delta
+
+_word_re = re.compile(r'\S+')
+
+
+class Counter:
+    """An incrementally maintained document statistic.
+
+    `reset` computes the value from scratch (only on load), `apply` updates
+    it from a single edit delta and must cost O(len(delta)), not O(n).
+    """
+    name = None
+
+    def __init__(self):
+        self.value = 0
+
+    def reset(self, document):
+        self.value = 0
+        self.apply(document, Delta(0, '', document.get_text()))
+
+    def apply(self, document, delta):
+        raise NotImplementedError
+
+
+class CharCounter(Counter):
+    name = 'characters'
+
+    def apply(self, document, delta):
+        self.value += len(delta.inserted) - len(delta.removed)
+
+
+class LineCounter(Counter):
+    name = 'lines'
+
+    def reset(self, document):
+        self.value = document.line_count()
+
+    def apply(self, document, delta):
+        self.value += delta.inserted.count('\n') - delta.removed.count('\n')
+
+
+class WordCounter(Counter):
+    name = 'words'
+
+    def apply(self, document, delta):
+        # Words are runs of non-whitespace; only the chars touching the edit
+        # can merge or split words, so count with one char of context
+        before = document.get_text(delta.offset - 1, delta.offset) if delta.offset else ''
+        end = delta.offset + len(delta.inserted)
+        after = document.get_text(end, end + 1)
+        self.value += (len(_word_re.findall(before + delta.inserted + after))
+                       - len(_word_re.findall(before + delta.removed + after)))
+
+
+class ByteCounter(Counter):
+    name = 'bytes'
+
+    def apply(self, document, delta):
+        self.value += (len(delta.inserted.encode('utf-8', 'surrogatepass'))
+                       - len(delta.removed.encode('utf-8', 'surrogatepass')))
+
+
+class DocumentStats:
+    """Keeps document statistics up to date from edit deltas.
+
+    Listeners registered with `bind` are called with the stats object at
+    most once per frame, however many edits happened in between.
+    """
+
+    def __init__(self, document, counters=None):
+        self.document = None
+        self.counters = {}
+        self.selection = 0
+        self.selection_lines = 0
+        self._listeners = []
+        self._trigger = Clock.create_trigger(self._dispatch, 0)
+        for counter in counters or (CharCounter(), WordCounter(), LineCounter()):
+            self.counters[counter.name] = counter
+        self.attach(document)
+
+    def __getitem__(self, name):
+        return self.counters[name].value
+
+    def attach(self, document):
+        """Follow another document, e.g. when switching tabs."""
+        if self.document is not None:
+            self.document.unbind(self.on_delta)
+        self.document = document
+        document.bind(self.on_delta)
+        for counter in self.counters.values():
+            counter.reset(document)
+        self._trigger()
+
+    def add_counter(self, counter):
+        counter.reset(self.document)
+        self.counters[counter.name] = counter
+        self._trigger()
+
+    def bind(self, callback):
+        self._listeners.append(callback)
+
+    def on_delta(self, delta):
+        for counter in self.counters.values():
+            counter.apply(self.document, delta)
+        self._trigger()
+
+    def set_selection(self, text):
+        self.selection = len(text)
+        self.selection_lines = text.count('\n') + 1 if text else 0
+        self._trigger()
+
+    def summary(self):
+        """Short status bar text for the current values."""
+        text = (f"Characters: {self['characters']}  Words: {self['words']}"
+                f"  Lines: {self['lines']}")
+        if self.selection:
+            text += f"  Selected: {self.selection} ({self.selection_lines} lines)"
+        return text
+
+    def _dispatch(self, dt):
+        for callback in self._listeners:
+            callback(self)
@@ -0,0 +1,165 @@
+from kivy.clock import Clock
+from kivy.core.text import Label as CoreLabel
+from kivy.graphics import Color, Mesh
+from kivy.properties import ListProperty, NumericProperty
+from kivy.uix.widget import Widget
+
+# Printable ASCII; anything else is drawn as FALLBACK
+CHARSET = ''.join(chr(code) for code in range(32, 127))
+FALLBACK = '?'
+FIELD_SPACING = 24
+
+
+class GlyphAtlas:
+    """Printable ASCII rasterized once into a single texture.
+
+    Glyphs are rendered white in one line; `glyphs` maps each char to its
+    advance and the horizontal texture coordinates of its cell, so text
+    can be drawn as quads without going through the text provider again.
+    """
+
+    def __init__(self, font_size, font_name=None):
+        options = {'font_size': font_size}
+        if font_name:
+            options['font_name'] = font_name
+        label = CoreLabel(text=CHARSET, **options)
+        label.refresh()
+        self.texture = label.texture
+        self.height = self.texture.height
+        coords = self.texture.tex_coords
+        # Bottom-left, bottom-right, top-right, top-left; already flipped
+        left, right = coords[0], coords[2]
+        self.v_bottom, self.v_top = coords[1], coords[5]
+        width = self.texture.width
+        self.glyphs = {}
+        x = 0
+        for index, char in enumerate(CHARSET):
+            end = label.get_extents(CHARSET[:index + 1])[0]
+            self.glyphs[char] = (end - x,
+                                 left + (right - left) * x / width,
+                                 left + (right - left) * end / width)
+            x = end
+
+    def text_width(self, text):
+        glyphs = self.glyphs
+        fallback = glyphs[FALLBACK]
+        return sum(glyphs.get(char, fallback)[0] for char in text)
+
+
+_atlases = {}
+
+
+def get_atlas(font_size, font_name=None):
+    """Shared atlas per font, rasterized on first use."""
+    key = (font_size, font_name)
+    atlas = _atlases.get(key)
+    if atlas is None:
+        atlas = _atlases[key] = GlyphAtlas(font_size, font_name)
+    return atlas
+
+
+class StatusField:
+    def __init__(self, name, text, min_chars, right):
+        self.name = name
+        self.text = text
+        self.min_chars = min_chars
+        self.right = right
+
+
+class StatusBar(Widget):
+    """Status text drawn from a `GlyphAtlas` with a single mesh.
+
+    Fields are short strings set by name, laid out left to right, with
+    `right` fields packed against the right edge. Changing a field only
+    rewrites the mesh vertices at the next frame; no texture is created.
+    """
+    color = ListProperty([1, 1, 1, 1])
+    font_size = NumericProperty(15)
+    padding = NumericProperty(10)
+
+    def __init__(self, font_name=None, **kwargs):
+        kwargs.setdefault('size_hint_y', None)
+        kwargs.setdefault('height', 40)
+        super().__init__(**kwargs)
+        self.fields = {}
+        self._order = []
+        self.atlas = get_atlas(self.font_size, font_name)
+        with self.canvas:
+            self._color = Color(*self.color)
+            self._mesh = Mesh(mode='triangles', texture=self.atlas.texture)
+        self._font_name = font_name
+        self._trigger = Clock.create_trigger(self._rebuild, 0)
+        self.bind(pos=self._trigger, size=self._trigger, padding=self._trigger,
+                  color=self._update_color, font_size=self._update_font)
+
+    def _update_color(self, instance, value):
+        self._color.rgba = value
+
+    def _update_font(self, instance, value):
+        self.atlas = get_atlas(value, self._font_name)
+        self._mesh.texture = self.atlas.texture
+        self._trigger()
+
+    def add_field(self, name, text='', min_chars=0, right=False):
+        """Add a field; `min_chars` reserves room so it does not jitter."""
+        self.fields[name] = StatusField(name, text, min_chars, right)
+        self._order.append(name)
+        self._trigger()
+
+    def set(self, name, text):
+        field = self.fields[name]
+        if field.text != text:
+            field.text = text
+            self._trigger()
+
+    def _field_width(self, field):
+        width = self.atlas.text_width(field.text)
+        if field.min_chars:
+            width = max(width, self.atlas.glyphs['0'][0] * field.min_chars)
+        return width
+
+    def _rebuild(self, dt=0):
+        atlas = self.atlas
+        glyphs = atlas.glyphs
+        fallback = glyphs[FALLBACK]
+        bottom = int(self.center_y - atlas.height / 2)
+        top = bottom + atlas.height
+        v_bottom, v_top = atlas.v_bottom, atlas.v_top
+        limit = self.right - self.padding
+        vertices = []
+        indices = []
+
+        # Right fields are placed first, left fields stop where they begin
+        placed = []
+        x = limit
+        for name in reversed(self._order):
+            field = self.fields[name]
+            if field.right:
+                x -= self._field_width(field)
+                placed.append((field, x))
+                x -= FIELD_SPACING
+        right_start = x + FIELD_SPACING
+        x = self.x + self.padding
+        for name in self._order:
+            field = self.fields[name]
+            if not field.right:
+                placed.append((field, x))
+                x += self._field_width(field) + FIELD_SPACING
+
+        for field, x in placed:
+            end = limit if field.right else right_start - FIELD_SPACING
+            for char in field.text:
+                advance, u0, u1 = glyphs.get(char, fallback)
+                if x + advance > end:
+                    break
+                if char != ' ':
+                    index = len(vertices) // 4
+                    vertices.extend((x, bottom, u0, v_bottom,
+                                     x + advance, bottom, u1, v_bottom,
+                                     x + advance, top, u1, v_top,
+                                     x, top, u0, v_top))
+                    indices.extend((index, index + 1, index + 2,
+                                    index + 2, index + 3, index))
+                x += advance
+        self._mesh.vertices = vertices
+        self._mesh.indices = indices
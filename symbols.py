@@ -0,0 +1,587 @@
+"""Python symbol index for go-to-definition and workspace symbols.
+
+The `.py` files under a root are parsed with `ast` in a process pool and
+their definitions and references stored in SQLite:
+
+    files        path (relative to the root), mtime_ns, size
+    names        every identifier once, with its lowercase form
+    definitions  name, file, kind, line, column, enclosing scope
+    refs         name, file, packed (line, column) pairs
+
+A file is parsed again only when its mtime or size changed, so a warm
+start only stats the tree and a change re-indexes just that file.
+"""
+import ast
+import hashlib
+import multiprocessing
+import os
+import sqlite3
+import threading
+from array import array
+from collections import deque, namedtuple
+
+from kivy.clock import Clock
+from kivy.properties import NumericProperty
+from kivy.uix.boxlayout import BoxLayout
+from kivy.uix.button import Button
+from kivy.uix.modalview import ModalView
+from kivy.uix.recycleboxlayout import RecycleBoxLayout
+from kivy.uix.recycleview import RecycleView
+from kivy.uix.textinput import TextInput
+
+from path_index import IGNORED_DIRS
+from paths import cache_dir
+from search import iter_files
+from workers import get_context
+
+FORMAT_VERSION = 1
+
+CLASS = 1
+FUNCTION = 2
+METHOD = 3
+VARIABLE = 4
+KIND_NAMES = {CLASS: 'class', FUNCTION: 'function', METHOD: 'method', VARIABLE: 'variable'}
+
+# Parsed files written per SQLite transaction
+WRITE_BATCH = 200
+# Files sent to a worker at once
+PARSE_CHUNK = 16
+# Identifier ids kept in memory by the indexer thread
+NAME_CACHE = 200000
+# How often the indexer looks up from the pool to see if it was closed
+CLOSE_POLL = 0.1
+MAX_RESULTS = 100
+RESULT_HEIGHT = 28
+
+Symbol = namedtuple('Symbol', 'name path kind line column scope')
+
+SCHEMA = """
+CREATE TABLE files (id INTEGER PRIMARY KEY, path TEXT UNIQUE NOT NULL,
+                    mtime_ns INTEGER, size INTEGER);
+CREATE TABLE names (id INTEGER PRIMARY KEY, name TEXT UNIQUE NOT NULL, lower TEXT NOT NULL);
+CREATE INDEX names_lower ON names (lower);
+CREATE TABLE definitions (name INTEGER, file INTEGER, kind INTEGER,
+                          line INTEGER, col INTEGER, scope TEXT);
+CREATE INDEX definitions_name ON definitions (name);
+CREATE INDEX definitions_file ON definitions (file);
+CREATE TABLE refs (name INTEGER, file INTEGER, positions BLOB,
+                   PRIMARY KEY (name, file)) WITHOUT ROWID;
+CREATE INDEX refs_file ON refs (file);
+"""
+
+_SELECT_DEFINITIONS = """
+SELECT names.name, files.path, definitions.kind, definitions.line, definitions.col,
+       definitions.scope
+FROM names JOIN definitions ON definitions.name = names.id
+           JOIN files ON files.id = definitions.file
+"""
+
+
+class _Collector(ast.NodeVisitor):
+    """Definitions and references of one module.
+
+    Functions, classes and assignments at module or class level are
+    definitions; every loaded name and attribute is a reference.
+    """
+
+    def __init__(self):
+        self.definitions = []
+        # name -> array of line, column pairs
+        self.references = {}
+        # Enclosing (name, is_class) scopes
+        self._scope = []
+
+    def _define(self, name, kind, node):
+        scope = '.'.join(name for name, is_class in self._scope)
+        self.definitions.append((name, kind, node.lineno, node.col_offset, scope))
+
+    def _refer(self, name, line, column):
+        positions = self.references.get(name)
+        if positions is None:
+            positions = self.references[name] = array('I')
+        positions.append(line)
+        positions.append(column)
+
+    def visit_ClassDef(self, node):
+        self._define(node.name, CLASS, node)
+        self._scope.append((node.name, True))
+        self.generic_visit(node)
+        self._scope.pop()
+
+    def visit_FunctionDef(self, node):
+        in_class = bool(self._scope) and self._scope[-1][1]
+        self._define(node.name, METHOD if in_class else FUNCTION, node)
+        self._scope.append((node.name, False))
+        self.generic_visit(node)
+        self._scope.pop()
+
+    visit_AsyncFunctionDef = visit_FunctionDef
+
+    def _define_target(self, target):
+        if isinstance(target, ast.Name):
+            self._define(target.id, VARIABLE, target)
+        elif isinstance(target, (ast.Tuple, ast.List)):
+            for element in target.elts:
+                self._define_target(element)
+
+    def visit_Assign(self, node):
+        # Locals of functions are not worth a workspace-wide entry
+        if not self._scope or self._scope[-1][1]:
+            for target in node.targets:
+                self._define_target(target)
+        self.generic_visit(node)
+
+    def visit_AnnAssign(self, node):
+        if not self._scope or self._scope[-1][1]:
+            self._define_target(node.target)
+        self.generic_visit(node)
+
+    def visit_Name(self, node):
+        if isinstance(node.ctx, ast.Load):
+            self._refer(node.id, node.lineno, node.col_offset)
+
+    def visit_Attribute(self, node):
+        self._refer(node.attr, node.end_lineno, max(0, node.end_col_offset - len(node.attr)))
+        self.generic_visit(node)
+
+
+def index_file(path):
+    """Parse one file in a worker process.
+
+    Returns (path, (mtime_ns, size), definitions, references), with no
+    stat if the file is gone. Files that do not parse are indexed empty
+    so they are not parsed again until they change.
+    """
+    try:
+        with open(path, 'rb') as source:
+            info = os.fstat(source.fileno())
+            data = source.read()
+    except OSError:
+        return path, None, (), ()
+    stat = (info.st_mtime_ns, info.st_size)
+    collector = _Collector()
+    try:
+        collector.visit(ast.parse(data, path))
+    except (SyntaxError, ValueError, RecursionError):
+        return path, stat, (), ()
+    references = [(name, positions.tobytes())
+                  for name, positions in collector.references.items()]
+    return path, stat, collector.definitions, references
+
+
+def index_files(paths):
+    return [index_file(path) for path in paths]
+
+
+class SymbolIndex:
+    """Definitions and references of the Python files under `root_path`.
+
+    Parsing runs in a process pool. Writes happen on an indexer thread
+    and lookups on a query thread, each with its own connection to a
+    WAL-mode database, so lookups never wait for indexing and the UI
+    thread never touches SQLite. Callbacks run on the main thread:
+    `on_indexed(paths)` after every sync or update with the paths it
+    parsed again, `on_error(message)` when the index cannot be opened or
+    written; errors are printed without one.
+    """
+
+    def __init__(self, root_path, path=None, processes=None, on_indexed=None, on_error=None):
+        self.root_path = os.path.abspath(root_path)
+        if path is None:
+            key = hashlib.sha1(self.root_path.encode('utf-8', 'surrogateescape')).hexdigest()
+            path = os.path.join(cache_dir(), f'symbols-{key[:16]}.sqlite')
+        self.path = path
+        self.processes = processes
+        self.on_indexed = on_indexed
+        self.on_error = on_error
+        self._pool = None
+        self._names = {}
+        self._closed = False
+        self._ready = threading.Event()
+        self._symbol_generation = 0
+        self._index_jobs = deque()
+        self._index_wakeup = threading.Condition()
+        self._query_jobs = deque()
+        self._query_wakeup = threading.Condition()
+        self._threads = [
+            threading.Thread(target=self._work, args=(self._index_jobs, self._index_wakeup, True),
+                             daemon=True),
+            threading.Thread(target=self._work, args=(self._query_jobs, self._query_wakeup, False),
+                             daemon=True),
+        ]
+        for thread in self._threads:
+            thread.start()
+
+    def _ensure_pool(self):
+        # Created on the main thread, before any job needs it
+        if self._pool is None and not self._closed:
+            self._pool = get_context().Pool(self.processes)
+
+    def _put(self, jobs, wakeup, job):
+        with wakeup:
+            jobs.append(job)
+            wakeup.notify()
+
+    def sync(self):
+        """Index new and changed files under the root, drop deleted ones."""
+        self._ensure_pool()
+        self._put(self._index_jobs, self._index_wakeup, (self._sync, None))
+
+    def update(self, paths):
+        """Re-index `paths` if they changed since they were indexed."""
+        self._ensure_pool()
+        self._put(self._index_jobs, self._index_wakeup, (self._update, list(paths)))
+
+    def update_directory(self, directory):
+        """Re-check the `.py` files of one directory after a watcher event,
+        and the subtrees of its subdirectories that appeared or went away."""
+        self._ensure_pool()
+        self._put(self._index_jobs, self._index_wakeup, (self._update_directory, directory))
+
+    def find_definitions(self, name, callback, path=None):
+        """`callback(symbols)` with the definitions of `name`, those in
+        `path` first, then classes and functions before variables."""
+        self._put(self._query_jobs, self._query_wakeup,
+                  (self._definitions, (name, path, callback)))
+
+    def find_references(self, name, callback):
+        """`callback(references)` with (path, line, column) uses of `name`."""
+        self._put(self._query_jobs, self._query_wakeup, (self._references, (name, callback)))
+
+    def workspace_symbols(self, query, callback, limit=MAX_RESULTS):
+        """`callback(symbols)` with definitions whose name contains `query`,
+        prefix matches first. A newer query supersedes a pending one."""
+        self._symbol_generation += 1
+        self._put(self._query_jobs, self._query_wakeup,
+                  (self._symbols, (self._symbol_generation, query, limit, callback)))
+
+    def close(self):
+        """Stop both threads, then the pool; a batch being written is
+        committed or rolled back before this returns."""
+        self._closed = True
+        for wakeup in (self._index_wakeup, self._query_wakeup):
+            with wakeup:
+                wakeup.notify()
+        # The indexer looks up from the pool every CLOSE_POLL seconds, so
+        # it is out of imap_unordered before the pool goes away
+        for thread in self._threads:
+            thread.join()
+        if self._pool is not None:
+            self._pool.terminate()
+            self._pool = None
+
+    def _connect(self, create):
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        db = sqlite3.connect(self.path)
+        db.execute('PRAGMA journal_mode=WAL')
+        db.execute('PRAGMA synchronous=NORMAL')
+        if create and db.execute('PRAGMA user_version').fetchone()[0] != FORMAT_VERSION:
+            for (table,) in db.execute("SELECT name FROM sqlite_master WHERE type = 'table'").fetchall():
+                db.execute(f'DROP TABLE {table}')
+            db.executescript(SCHEMA)
+            db.execute(f'PRAGMA user_version = {FORMAT_VERSION}')
+            db.commit()
+        return db
+
+    def _work(self, jobs, wakeup, indexer):
+        try:
+            if indexer:
+                try:
+                    db = self._connect(True)
+                except sqlite3.DatabaseError as error:
+                    self._report(f"Rebuilding symbol index {self.path}: {error}")
+                    os.remove(self.path)
+                    db = self._connect(True)
+                self._ready.set()
+            else:
+                self._ready.wait()
+                db = self._connect(False)
+        except (OSError, sqlite3.Error) as error:
+            self._report(f"Cannot open symbol index {self.path}: {error}")
+            self._ready.set()
+            return
+        while True:
+            with wakeup:
+                while not jobs and not self._closed:
+                    wakeup.wait()
+                if self._closed:
+                    break
+                function, argument = jobs.popleft()
+            try:
+                function(db, argument)
+            except sqlite3.Error as error:
+                self._report(f"Symbol index error: {error}")
+                if indexer:
+                    # Ids of names inserted by the rolled back batch
+                    self._names.clear()
+        db.close()
+
+    def _report(self, message):
+        if self.on_error is None:
+            print(message)
+        else:
+            self._deliver(self.on_error, message)
+
+    def _relative(self, path):
+        return os.path.relpath(path, self.root_path)
+
+    def _changed(self, db, paths):
+        """The paths whose stat differs from the index, and the vanished ones."""
+        changed = []
+        for path in paths:
+            row = db.execute('SELECT mtime_ns, size FROM files WHERE path = ?',
+                             (self._relative(path),)).fetchone()
+            try:
+                info = os.stat(path)
+            except OSError:
+                if row is not None:
+                    changed.append(path)
+                continue
+            if row != (info.st_mtime_ns, info.st_size):
+                changed.append(path)
+        return changed
+
+    def _sync(self, db, argument):
+        known = {path: (mtime, size)
+                 for path, mtime, size in db.execute('SELECT path, mtime_ns, size FROM files')}
+        changed = []
+        for path in iter_files(self.root_path):
+            if not path.endswith('.py'):
+                continue
+            relative = self._relative(path)
+            stat = known.pop(relative, None)
+            try:
+                info = os.stat(path)
+            except OSError:
+                continue
+            if stat != (info.st_mtime_ns, info.st_size):
+                changed.append(path)
+            if self._closed:
+                return
+        # Whatever was not seen again has been deleted
+        changed.extend(os.path.join(self.root_path, relative) for relative in known)
+        self._index(db, changed)
+
+    def _update(self, db, paths):
+        self._index(db, self._changed(db, [path for path in paths if path.endswith('.py')]))
+
+    def _update_directory(self, db, directory):
+        paths = set()
+        subdirectories = set()
+        try:
+            with os.scandir(directory) as entries:
+                for entry in entries:
+                    try:
+                        if entry.is_dir(follow_symlinks=False):
+                            if entry.name not in IGNORED_DIRS:
+                                subdirectories.add(entry.name)
+                        elif entry.name.endswith('.py') and entry.is_file():
+                            paths.add(entry.path)
+                    except OSError:
+                        continue
+        except OSError:
+            pass
+        # Indexed files of the directory that are no longer listed, and
+        # every indexed file under a subdirectory that is gone
+        relative = self._relative(directory)
+        prefix = '' if relative == os.curdir else relative + os.sep
+        indexed = set()
+        for (path,) in db.execute('SELECT path FROM files WHERE path >= ? AND path < ?',
+                                  (prefix, prefix + '\U0010ffff')):
+            sub, separator, rest = path[len(prefix):].partition(os.sep)
+            if separator and sub in subdirectories:
+                indexed.add(sub)
+            else:
+                paths.add(os.path.join(self.root_path, path))
+        # A subdirectory with nothing indexed under it may have been
+        # created or moved in, so its whole subtree is checked
+        for sub in subdirectories - indexed:
+            paths.update(path for path in iter_files(os.path.join(directory, sub))
+                         if path.endswith('.py'))
+        self._update(db, paths)
+
+    def _index(self, db, paths):
+        if paths:
+            batch = []
+            chunks = [paths[i:i + PARSE_CHUNK] for i in range(0, len(paths), PARSE_CHUNK)]
+            # Chunked by hand: only a chunksize of 1 returns an iterator
+            # whose next() takes a timeout
+            results = self._pool.imap_unordered(index_files, chunks)
+            while True:
+                try:
+                    chunk = results.next(CLOSE_POLL)
+                except multiprocessing.TimeoutError:
+                    if self._closed:
+                        return
+                    continue
+                except StopIteration:
+                    break
+                batch.extend(chunk)
+                if len(batch) >= WRITE_BATCH:
+                    self._store(db, batch)
+                    batch = []
+            self._store(db, batch)
+        if self.on_indexed is not None:
+            self._deliver(self.on_indexed, paths)
+
+    def _name_id(self, db, name):
+        name_id = self._names.get(name)
+        if name_id is None:
+            row = db.execute('SELECT id FROM names WHERE name = ?', (name,)).fetchone()
+            if row is not None:
+                name_id = row[0]
+            else:
+                name_id = db.execute('INSERT INTO names (name, lower) VALUES (?, ?)',
+                                     (name, name.lower())).lastrowid
+            if len(self._names) >= NAME_CACHE:
+                self._names.clear()
+            self._names[name] = name_id
+        return name_id
+
+    def _store(self, db, results):
+        with db:
+            for path, stat, definitions, references in results:
+                relative = self._relative(path)
+                row = db.execute('SELECT id FROM files WHERE path = ?', (relative,)).fetchone()
+                if row is not None:
+                    file_id = row[0]
+                    db.execute('DELETE FROM definitions WHERE file = ?', (file_id,))
+                    db.execute('DELETE FROM refs WHERE file = ?', (file_id,))
+                    if stat is None:
+                        db.execute('DELETE FROM files WHERE id = ?', (file_id,))
+                        continue
+                    db.execute('UPDATE files SET mtime_ns = ?, size = ? WHERE id = ?',
+                               stat + (file_id,))
+                elif stat is None:
+                    continue
+                else:
+                    file_id = db.execute('INSERT INTO files (path, mtime_ns, size) VALUES (?, ?, ?)',
+                                         (relative,) + stat).lastrowid
+                db.executemany('INSERT INTO definitions VALUES (?, ?, ?, ?, ?, ?)',
+                               [(self._name_id(db, name), file_id, kind, line, column, scope)
+                                for name, kind, line, column, scope in definitions])
+                db.executemany('INSERT INTO refs VALUES (?, ?, ?)',
+                               [(self._name_id(db, name), file_id, positions)
+                                for name, positions in references])
+
+    def _symbol(self, row):
+        name, path, kind, line, column, scope = row
+        return Symbol(name, os.path.join(self.root_path, path), kind, line, column, scope)
+
+    def _deliver(self, callback, results):
+        Clock.schedule_once(lambda dt: callback(results))
+
+    def _definitions(self, db, job):
+        name, path, callback = job
+        rows = db.execute(_SELECT_DEFINITIONS + 'WHERE names.name = ?', (name,)).fetchall()
+        current = self._relative(path) if path else None
+        rows.sort(key=lambda row: (row[1] != current, row[2] == VARIABLE, row[1], row[3]))
+        self._deliver(callback, [self._symbol(row) for row in rows])
+
+    def _references(self, db, job):
+        name, callback = job
+        references = []
+        for path, data in db.execute(
+                'SELECT files.path, refs.positions FROM names'
+                ' JOIN refs ON refs.name = names.id JOIN files ON files.id = refs.file'
+                ' WHERE names.name = ?', (name,)):
+            positions = array('I')
+            positions.frombytes(data)
+            path = os.path.join(self.root_path, path)
+            references.extend((path, positions[i], positions[i + 1])
+                              for i in range(0, len(positions), 2))
+        references.sort()
+        self._deliver(callback, references)
+
+    def _symbols(self, db, job):
+        generation, query, limit, callback = job
+        if generation != self._symbol_generation:
+            return  # Superseded before it started
+        lower = query.lower()
+        if not lower:
+            self._deliver(callback, [])
+            return
+        # Prefix matches come straight from the index on the lowercase names
+        rows = db.execute(_SELECT_DEFINITIONS + 'WHERE names.lower >= ? AND names.lower < ? LIMIT ?',
+                          (lower, lower + '\U0010ffff', limit)).fetchall()
+        if len(rows) < limit and generation == self._symbol_generation:
+            escaped = lower.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+            rows += db.execute(
+                _SELECT_DEFINITIONS + "WHERE names.lower LIKE ? ESCAPE '\\'"
+                " AND names.lower NOT LIKE ? ESCAPE '\\' LIMIT ?",
+                (f'%{escaped}%', f'{escaped}%', limit - len(rows))).fetchall()
+        if generation == self._symbol_generation:
+            self._deliver(callback, [self._symbol(row) for row in rows])
+
+
+class SymbolRow(Button):
+    index = NumericProperty(-1)
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.halign = 'left'
+        self.valign = 'middle'
+        self.shorten = True
+        self.bind(size=self._update_text_size)
+
+    def _update_text_size(self, instance, value):
+        self.text_size = self.size
+
+    def on_press(self):
+        self.parent.parent.palette.choose(self.index)
+
+
+class SymbolSearch(ModalView):
+    """Workspace symbol palette: type part of a name, pick to jump to it."""
+
+    def __init__(self, index, on_choose, **kwargs):
+        kwargs.setdefault('size_hint', (0.6, 0.6))
+        kwargs.setdefault('pos_hint', {'top': 0.95})
+        super().__init__(**kwargs)
+        self.index = index
+        self.on_choose = on_choose
+        self.symbols = []
+
+        layout = BoxLayout(orientation='vertical', spacing=5, padding=5)
+        self.query_input = TextInput(multiline=False, size_hint_y=None, height=36)
+        self.query_input.bind(text=self.on_query)
+        self.query_input.bind(on_text_validate=self.choose_first)
+
+        self.results = RecycleView()
+        self.results.palette = self
+        self.results.viewclass = SymbolRow
+        rows_layout = RecycleBoxLayout(
+            orientation='vertical', size_hint=(1, None),
+            default_size=(None, RESULT_HEIGHT), default_size_hint=(1, None)
+        )
+        rows_layout.bind(minimum_height=rows_layout.setter('height'))
+        self.results.add_widget(rows_layout)
+
+        layout.add_widget(self.query_input)
+        layout.add_widget(self.results)
+        self.add_widget(layout)
+
+    def on_open(self):
+        self.query_input.text = ''
+        self.query_input.focus = True
+
+    def on_query(self, instance, value):
+        self.index.workspace_symbols(value, self.show_results)
+
+    def show_results(self, symbols):
+        self.symbols = symbols
+        root = self.index.root_path
+        self.results.data = [
+            {'text': f"{symbol.name}  {KIND_NAMES[symbol.kind]}"
+                     f"  {os.path.relpath(symbol.path, root)}:{symbol.line}",
+             'index': index}
+            for index, symbol in enumerate(symbols)
+        ]
+
+    def choose_first(self, instance):
+        if self.symbols:
+            self.choose(0)
+
+    def choose(self, index):
+        self.dismiss()
+        self.on_choose(self.symbols[index])
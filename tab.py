@@ -1,176 +1,173 @@
-import os
-import configparser
-import cProfile
+# Imported first so the startup timeline covers the Kivy imports
+from startup import after_first_frame, trace
+import sys
 from kivy.app import App
 from kivy.uix.boxlayout import BoxLayout
-from kivy.uix.textinput import TextInput
-from kivy.uix.label import Label
-from kivy.graphics import Color, Rectangle
-from kivy.clock import Clock
+from kivy.core.window import Window
+from editor import EditorInput
+from journal import recover
+from line_layout import LineNumberGutter
+from profiler import SamplingProfiler, bind_hotkey
+from settings import get_settings
+from tabs import TabBar, TabManager
+from theme import Theme
 
 # Define the configuration file path
 config_file_path = 'app_config.conf'
 
+trace.mark('imports')
+
 class TextInputApp(App):
 
     def on_start(self):
-        self.profile = cProfile.Profile()
-        self.profile.enable()
-
-        # Check if the config file exists, if not create it
-        if not os.path.exists(config_file_path):
-            self.create_default_config()
+        # First frame and first keystroke complete the startup timeline
+        trace.install()
+        # Secondary panes are built after the first frame is drawn
+        after_first_frame(self.build_status_bar)
 
-        # Load the configuration initially
-        self.load_config()
+        # Sampling profiler: off unless enabled in the settings or with F9
+        self.profiler = SamplingProfiler(self.settings['profile_dir'])
+        bind_hotkey(self.profiler)
+        if self.settings['profiling']:
+            self.profiler.start()
 
-        # Schedule a check for config file changes every second
-        Clock.schedule_interval(self.check_config_update, 1)
+        # Reload the settings whenever the file changes on disk
+        self.settings.watch()
 
     def on_stop(self):
-        self.profile.disable()
-        self.profile.dump_stats('myapp.profile')
+        self.profiler.stop()
+        self.tabs.close_all()
 
     def build(self):
         # Create the main layout
         layout = BoxLayout(orientation='vertical', padding=10, spacing=10)
 
-        # Set the background color to the loaded CSS color
-        with layout.canvas.before:
-            Color(*self.hex_to_rgb(self.bg_color))  # Convert CSS color to RGB
-            self.rect = Rectangle(size=layout.size, pos=layout.pos)
-
-        # Update rectangle size and position on resize
-        layout.bind(size=self._update_rect, pos=self._update_rect)
+        # The theme owns the background instructions and recolors them in place
+        self.theme = Theme()
+        self.theme.add_rect('background', layout)
 
         # Create a TextInput widget with a transparent background
-        self.text_input = TextInput(
+        self.text_input = EditorInput(
             text='Hello world', height=40, multiline=True
         )
         self.text_input.background_normal = ''  # Remove the background
         self.text_input.background_active = ''  # Remove the active background
-        # Set the background color of the TextInput to match the app's background
-        self.text_input.background_color = self.hex_to_rgb(self.bg_color) + (1,)  # RGBA
-
-        # Create the bottom layout for character count
-        bottom_layout = BoxLayout(
-            orientation="horizontal", size_hint=(1, None), height=40, padding=[10, 5]
-        )
-        self.char_count_label = Label(
-            text="Characters: 0",
-            size_hint=(1, 1),
-        )
-        bottom_layout.add_widget(self.char_count_label)
-
-        # Bind the text input to update character count
-        self.text_input.bind(text=self.update_char_count)
-
-        # Add widgets to the layout
-        layout.add_widget(self.text_input)
-        layout.add_widget(bottom_layout)
+        self.text_input.set_undo_budget(self.settings['undo_budget_mb'] * 1024 * 1024)
+
+        # Every tab is shown in the same editor widget; files given on the
+        # command line open as tabs next to the scratch buffer, followed by
+        # unsaved buffers recovered from a crashed session
+        self.stats = None
+        self.tabs = TabManager(self.text_input)
+        self.tabs.bind(self.on_tab_changed)
+        tab_bar = TabBar(self.tabs)
+        self.tabs.add(self.text_input.document)
+        for path in sys.argv[1:]:
+            self.tabs.open(path)
+        for document in recover():
+            print(f"Recovered unsaved changes to {document.path or 'an untitled buffer'}")
+            self.tabs.add(document)
+        Window.bind(on_key_down=self._on_key_down)
+
+        # Add widgets to the layout; the status bar follows after the first frame
+        # Line numbers to the left of the editor, for the rows on screen
+        self.gutter = LineNumberGutter(self.text_input)
+        editor_row = BoxLayout(orientation='horizontal')
+        editor_row.add_widget(self.gutter)
+        editor_row.add_widget(self.text_input)
+        layout.add_widget(tab_bar)
+        layout.add_widget(editor_row)
 
         self.root = layout  # Set the root widget to the layout
 
-        # Call update_colors after root is initialized
+        # Color the widgets from the theme, then apply the configured color
+        self.theme.bind(self.apply_palette)
         self.update_colors()
         self.title = 'Cassata'
         self.icon = './assets/images/Cassata.ico'
 
+        trace.mark('build')
         return layout
 
-    def _update_rect(self, instance, value):
-        # Update the rectangle size and position whenever the window is resized
-        self.rect.size = instance.size
-        self.rect.pos = instance.pos
+    def build_status_bar(self, dt):
+        """Add the character count bar once the editor is on screen."""
+        from stats import DocumentStats
+        from status_bar import StatusBar
+
+        # Drawn from a prebaked glyph atlas, updates never rasterize text
+        self.status_bar = StatusBar()
+        self.status_bar.add_field('stats', "Characters: 0")
+        self.status_bar.add_field('cursor', "Ln 1, Col 1", min_chars=16, right=True)
+        self.root.add_widget(self.status_bar)
+
+        # Update the character count from edit deltas
+        self.stats = DocumentStats(self.text_input.document)
+        self.stats.bind(self.update_char_count)
+        self.text_input.bind(selection_text=self.update_selection,
+                             cursor=self.update_cursor)
+        self.theme.bind(self.apply_status_palette)
+        trace.mark('status bar')
+
+    def on_tab_changed(self, tabs):
+        if self.stats is not None and self.stats.document is not self.text_input.document:
+            self.stats.attach(self.text_input.document)
+
+    def _on_key_down(self, window, key, scancode, codepoint, modifiers):
+        # Ctrl+T opens a tab, Ctrl+W closes it, Ctrl+Tab moves to the next
+        if 'ctrl' not in modifiers:
+            return False
+        if codepoint == 't':
+            self.tabs.new()
+        elif codepoint == 'w':
+            self.tabs.close(self.tabs.active)
+        elif key == 9:
+            self.tabs.cycle(-1 if 'shift' in modifiers else 1)
+        else:
+            return False
+        return True
 
-    def update_char_count(self, instance, value):
-        """Update the character count label with the current text length."""
-        char_count = len(value)
-        self.char_count_label.text = f"Characters: {char_count}"
+    def update_char_count(self, stats):
+        """Update the status label, called at most once per frame."""
+        self.status_bar.set('stats', stats.summary())
 
-    def create_default_config(self):
-        # Create a config parser and add default values (using CSS hex color)
-        config = configparser.ConfigParser()
-        config['Settings'] = {
-            'background_color': '#FFFFFF',  # Default white color in CSS hex format
-        }
+    def update_cursor(self, instance, cursor):
+        self.status_bar.set('cursor', f"Ln {cursor[1] + 1}, Col {cursor[0] + 1}")
 
-        # Write the config to a file
-        with open(config_file_path, 'w') as configfile:
-            config.write(configfile)
+    def update_selection(self, instance, value):
+        self.stats.set_selection(value)
 
     def load_config(self):
-        # Load the configuration from the .conf file
-        config = configparser.ConfigParser()
-        config.read(config_file_path)
-
-        # Read background color from config file (default is white if not found)
-        self.bg_color = config.get('Settings', 'background_color', fallback='#FFFFFF')
+        # Kivy calls this before build(); settings are parsed once and shared
+        self.settings = get_settings(config_file_path)
+        self.settings.bind(self.on_settings_changed)
+        trace.mark('config')
 
     def update_colors(self):
         """Update the app and TextInput background color dynamically."""
-        if not hasattr(self, 'root'):
-            return  # Ensure root is set before updating
-
-        # Update the app background color
-        with self.root.canvas.before:
-            Color(*self.hex_to_rgb(self.bg_color))  # Convert CSS color to RGB
-            self.rect = Rectangle(size=self.root.size, pos=self.root.pos)
-
-        # Update the TextInput background color
-        self.text_input.background_color = self.hex_to_rgb(self.bg_color) + (1,)  # RGBA
-
-        # Update the text color of the character count label
-        self.update_text_color()
-
-        # Request the canvas to be updated
-        self.root.canvas.ask_update()
-
-    def update_text_color(self):
-        """Update the text color dynamically based on the background brightness."""
-        brightness = self.get_brightness(self.bg_color)
-
-        # If brightness is less than 0.5 (dark background), use light text color
-        if brightness < 0.5:
-            self.text_input.foreground_color = (1, 1, 1, 1)  # White text
-            self.char_count_label.color = (1, 1, 1, 1)  # White text for bottom label
-        else:
-            self.text_input.foreground_color = (0, 0, 0, 1)  # Black text
-            self.char_count_label.color = (0, 0, 0, 1)  # Black text for bottom label
-
-    def get_brightness(self, hex_color):
-        """Calculate the brightness of a hex color. Returns a value between 0 (dark) and 1 (bright)."""
-        r, g, b = self.hex_to_rgb(hex_color)
-        # Formula to calculate brightness
-        brightness = (r * 0.299 + g * 0.587 + b * 0.114)
-        return brightness
-
-    def check_config_update(self, dt):
-        """Check if the config file has been updated and reload if necessary."""
-        # Check if the file's last modified time has changed
-        last_modified_time = os.path.getmtime(config_file_path)
-
-        if hasattr(self, 'last_checked_time'):
-            if last_modified_time > self.last_checked_time:
-                print("Config file updated!")
-                self.load_config()
-                self.update_colors()  # Trigger color update after config change
-
-        # Update the last checked time
-        self.last_checked_time = last_modified_time
-
-    def hex_to_rgb(self, hex_color):
-        """Convert a hex color string to an RGB tuple."""
-        hex_color = hex_color.lstrip('#')  # Remove the leading '#'
-        if len(hex_color) == 6:  # Standard 6-character hex format
-            r, g, b = hex_color[0:2], hex_color[2:4], hex_color[4:6]
-        elif len(hex_color) == 3:  # Shortened 3-character hex format
-            r, g, b = hex_color[0] * 2, hex_color[1] * 2, hex_color[2] * 2
-        else:
-            raise ValueError("Invalid hex color format")
-
-        # Convert to RGB values (0-1)
-        return (int(r, 16) / 255, int(g, 16) / 255, int(b, 16) / 255)
+        self.theme.apply(self.settings['background_color'])
+
+    def apply_palette(self, palette):
+        """Color the widgets from the theme palette."""
+        self.text_input.background_color = palette.background
+        # Light text on a dark background, dark text on a light one
+        self.text_input.foreground_color = palette.foreground
+        self.gutter.color = palette.foreground[:3] + (0.5,)
+
+    def apply_status_palette(self, palette):
+        self.status_bar.color = palette.foreground
+
+    def on_settings_changed(self, changed):
+        """Apply the settings that changed after the file was reloaded."""
+        print("Config file updated!")
+        if 'background_color' in changed:
+            self.update_colors()
+        if 'undo_budget_mb' in changed:
+            self.text_input.set_undo_budget(changed['undo_budget_mb'] * 1024 * 1024)
+        if 'profiling' in changed:
+            if changed['profiling']:
+                self.profiler.start()
+            else:
+                self.profiler.stop()
 
 # Run the app
 if __name__ == '__main__':
@@ -0,0 +1,257 @@
+import os
+import shutil
+import tempfile
+import time
+import zlib
+
+from kivy.clock import Clock
+from kivy.properties import NumericProperty
+from kivy.uix.behaviors import ButtonBehavior
+from kivy.uix.label import Label
+from kivy.uix.recycleboxlayout import RecycleBoxLayout
+from kivy.uix.recycleview import RecycleView
+from kivy.uix.recycleview.views import RecycleDataViewBehavior
+
+from document import Document
+from journal import Journal
+
+# Inactive tabs untouched for this long are suspended
+IDLE_SECONDS = 120
+CHECK_INTERVAL = 10
+# Suspended buffers larger than this (compressed) go to a temp file
+SPILL_BYTES = 256 * 1024
+# Fast compression: suspending and restoring must not show up as a stall
+COMPRESS_LEVEL = 1
+
+TAB_WIDTH = 160
+TAB_BAR_HEIGHT = 32
+
+
+class Tab:
+    """One open document and its view state.
+
+    An inactive tab holds its `Document` and its undo history. Once
+    suspended the history is dropped and the tab holds the text
+    zlib-compressed, or only the name of a temp file when the compressed
+    text is large.
+    """
+
+    def __init__(self, document):
+        self.path = document.path
+        self.document = document
+        self.journal = Journal(document)
+        # Undo steps, kept while the tab is not shown
+        self.history = None
+        self.cursor = (0, 0)
+        self.scroll = (0, 0)
+        self.last_active = time.monotonic()
+        # (version, saved_version) of a suspended document
+        self._versions = None
+        self._compressed = None
+        self._spill_path = None
+
+    @property
+    def title(self):
+        return os.path.basename(self.path) if self.path else 'untitled'
+
+    @property
+    def suspended(self):
+        return self.document is None
+
+    def suspend(self, spill_dir):
+        if self.document is None:
+            return
+        self.journal.detach()
+        # Undo steps are not kept for suspended tabs, they would keep
+        # up to a whole undo budget per tab in memory
+        if self.history is not None:
+            self.history.detach()
+            self.history = None
+        self._versions = (self.document.version, self.document.saved_version)
+        data = zlib.compress(self.document.get_text().encode('utf-8', 'surrogateescape'),
+                             COMPRESS_LEVEL)
+        if len(data) > SPILL_BYTES:
+            handle, path = tempfile.mkstemp(suffix='.tab', dir=spill_dir)
+            with os.fdopen(handle, 'wb') as target:
+                target.write(data)
+            self._spill_path = path
+        else:
+            self._compressed = data
+        self.document = None
+
+    def resume(self):
+        if self.document is not None:
+            return self.document
+        data = self._compressed
+        if self._spill_path is not None:
+            with open(self._spill_path, 'rb') as source:
+                data = source.read()
+            os.remove(self._spill_path)
+            self._spill_path = None
+        self._compressed = None
+        self.document = Document(zlib.decompress(data).decode('utf-8', 'surrogateescape'),
+                                 self.path)
+        # Keep the unsaved marker across the round trip
+        self.document.version, self.document.saved_version = self._versions
+        self.journal.attach(self.document, restart=False)
+        return self.document
+
+    def discard(self):
+        self.journal.close()
+        if self.history is not None:
+            self.history.detach()
+            self.history = None
+        if self._spill_path is not None:
+            try:
+                os.remove(self._spill_path)
+            except OSError:
+                pass
+        self._spill_path = None
+        self._compressed = None
+        self.document = None
+
+
+class TabManager:
+    """Open documents sharing one `EditorInput`.
+
+    Only the active tab is shown in the editor; switching stores the view
+    state of the old tab and loads the new tab's document into the same
+    widget, so widgets and textures do not grow with the number of tabs.
+    Listeners registered with `bind` are called with the manager whenever
+    the tab list or the active tab changes.
+    """
+
+    def __init__(self, editor, idle_seconds=IDLE_SECONDS):
+        self.editor = editor
+        self.idle_seconds = idle_seconds
+        self.tabs = []
+        self.active = None
+        self._listeners = []
+        self._spill_dir = None
+        self._event = Clock.schedule_interval(self.suspend_idle, CHECK_INTERVAL)
+
+    def bind(self, callback):
+        self._listeners.append(callback)
+
+    def _dispatch(self):
+        for callback in self._listeners:
+            callback(self)
+
+    def new(self, text=''):
+        return self.add(Document(text))
+
+    def open(self, path):
+        """Activate the tab showing `path`, opening it if needed."""
+        path = os.path.abspath(path)
+        for tab in self.tabs:
+            if tab.path == path:
+                self.activate(tab)
+                return tab
+        try:
+            with open(path, encoding='utf-8', errors='surrogateescape') as source:
+                text = source.read()
+        except OSError as error:
+            print(f"Cannot open {path}: {error}")
+            return None
+        return self.add(Document(text, path))
+
+    def add(self, document):
+        tab = Tab(document)
+        self.tabs.append(tab)
+        self.activate(tab)
+        return tab
+
+    def activate(self, tab):
+        if tab is self.active:
+            return
+        previous = self.active
+        if previous is not None:
+            previous.cursor, previous.scroll = self.editor.view_state()
+            previous.history = self.editor.history
+            previous.last_active = time.monotonic()
+        self.active = tab
+        tab.last_active = time.monotonic()
+        self.editor.set_document(tab.resume(), tab.cursor, tab.scroll, tab.history)
+        tab.history = None
+        self._dispatch()
+
+    def close(self, tab):
+        index = self.tabs.index(tab)
+        self.tabs.remove(tab)
+        tab.discard()
+        if tab is not self.active:
+            self._dispatch()
+        elif self.tabs:
+            self.active = None
+            self.activate(self.tabs[min(index, len(self.tabs) - 1)])
+        else:
+            # Always keep one tab for the editor to show
+            self.active = None
+            self.new()
+
+    def cycle(self, step=1):
+        if self.active is not None and len(self.tabs) > 1:
+            index = self.tabs.index(self.active)
+            self.activate(self.tabs[(index + step) % len(self.tabs)])
+
+    def suspend_idle(self, dt=0):
+        now = time.monotonic()
+        for tab in self.tabs:
+            if (tab is not self.active and not tab.suspended
+                    and now - tab.last_active > self.idle_seconds):
+                if self._spill_dir is None:
+                    self._spill_dir = tempfile.mkdtemp(prefix='cassata-tabs-')
+                tab.suspend(self._spill_dir)
+
+    def close_all(self):
+        self._event.cancel()
+        for tab in self.tabs:
+            tab.discard()
+        self.tabs = []
+        self.active = None
+        if self._spill_dir is not None:
+            shutil.rmtree(self._spill_dir, ignore_errors=True)
+            self._spill_dir = None
+
+
+class TabButton(RecycleDataViewBehavior, ButtonBehavior, Label):
+    """A recycled tab title; only the tabs in view have a widget."""
+    index = NumericProperty(-1)
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.shorten = True
+        self.bind(size=self._update_text_size)
+
+    def _update_text_size(self, instance, value):
+        self.text_size = self.size
+
+    def refresh_view_attrs(self, rv, index, data):
+        self.manager = rv.manager
+        return super().refresh_view_attrs(rv, index, data)
+
+    def on_press(self):
+        self.manager.activate(self.manager.tabs[self.index])
+
+
+class TabBar(RecycleView):
+    """Horizontal strip of tab titles for a `TabManager`."""
+
+    def __init__(self, manager, **kwargs):
+        self.manager = manager
+        kwargs.setdefault('size_hint', (1, None))
+        kwargs.setdefault('height', TAB_BAR_HEIGHT)
+        super().__init__(do_scroll_y=False, **kwargs)
+        self.viewclass = TabButton
+        layout = RecycleBoxLayout(
+            orientation='horizontal', size_hint=(None, 1),
+            default_size=(TAB_WIDTH, None), default_size_hint=(None, 1)
+        )
+        layout.bind(minimum_width=layout.setter('width'))
+        self.add_widget(layout)
+        manager.bind(self.refresh)
+        self.refresh(manager)
+
+    def refresh(self, manager):
+        self.data = [{'text': tab.title, 'index': index, 'bold': tab is manager.active}
+                     for index, tab in enumerate(manager.tabs)]
@@ -0,0 +1,147 @@
+import random
+
+import pytest
+
+from carets import (backspace_edit, delete_edit, edit_span, insert_edit, merge_ranges,
+                    plan_edits)
+from document import Document
+
+
+def _apply(text, edits):
+    for offset, length, inserted in edits:
+        text = text[:offset] + inserted + text[offset + length:]
+    return text
+
+
+def _random_ranges(rng, size, count):
+    ranges = []
+    for _ in range(count):
+        start = rng.randint(0, size)
+        end = start if rng.random() < 0.5 else rng.randint(start, size)
+        ranges.append((start, end))
+    return ranges
+
+
+def test_merge_ranges_joins_overlapping_and_touching():
+    assert merge_ranges([(7, 10), (5, 8), (10, 10), (2, 2), (2, 2), (12, 14)]) == [
+        (2, 2), (5, 10), (12, 14)]
+    assert merge_ranges([(3, 3), (3, 6), (0, 1)]) == [(0, 1), (3, 6)]
+
+
+@pytest.mark.parametrize('seed', range(20))
+def test_plan_edits_matches_editing_each_range(seed):
+    rng = random.Random(seed)
+    text = ''.join(rng.choice('ab\n') for _ in range(rng.randint(0, 40)))
+    ranges = merge_ranges(_random_ranges(rng, len(text), rng.randint(1, 6)))
+    edit_for = rng.choice([insert_edit('xyz'), insert_edit(''), backspace_edit,
+                           delete_edit(len(text))])
+    edits, positions = plan_edits(ranges, edit_for)
+
+    # The same edits made one range at a time, last range first
+    expected = text
+    for start, end in reversed(ranges):
+        edit = edit_for(start, end)
+        if edit is not None:
+            expected = _apply(expected, [edit])
+    assert _apply(text, edits) == expected
+    document = Document(text)
+    document.apply(edits)
+    assert document.get_text() == expected
+
+    # Carets land after their replacement, in the edited text
+    assert positions == sorted(positions)
+    assert len(positions) == len(ranges)
+    if edit_for is not backspace_edit and isinstance(edit_for(0, 0), tuple):
+        inserted = edit_for(0, 0)[2]
+        for position in positions:
+            assert expected[position - len(inserted):position] == inserted
+
+
+@pytest.mark.parametrize('seed', range(20))
+def test_edit_span_covers_every_change(seed):
+    rng = random.Random(seed)
+    before = ''.join(rng.choice('ab') for _ in range(30))
+    after = before
+    edits = []
+    for _ in range(rng.randint(1, 5)):
+        offset = rng.randint(0, len(after))
+        length = rng.randint(0, min(3, len(after) - offset))
+        edits.append((offset, length, 'X' * rng.randint(0, 3)))
+        after = _apply(after, edits[-1:])
+    start, end = edit_span(edits)
+    shift = len(after) - len(before)
+    assert 0 <= start <= end <= len(after)
+    assert after[:start] == before[:start]
+    assert after[end:] == before[end - shift:]
+    assert after.count('X') == after[start:end].count('X')
+
+
+def test_transaction_is_one_change():
+    document = Document('one\ntwo\n')
+    changes = []
+    deltas = []
+    document.bind_changes(changes.append)
+    document.bind(deltas.append)
+    with document.transaction():
+        document.insert(0, '> ')
+        with document.transaction():
+            document.insert(6, '> ')
+        assert changes == []
+    assert len(deltas) == 2
+    assert changes == [deltas]
+    document.apply([(8, 0, '!'), (0, 0, '!')])
+    assert len(changes) == 2 and len(changes[1]) == 2
+    assert document.get_text() == '!> one\n> !two\n'
+
+
+@pytest.fixture
+def editor():
+    pytest.importorskip('kivy')
+    from editor import EditorInput
+    editor = EditorInput(document=Document('alpha\nbeta\ngamma\n'), do_wrap=False,
+                         size=(400, 300))
+    editor._update_text_options()
+    return editor
+
+
+def test_typing_at_overlapping_carets_is_one_change(editor):
+    document = editor.document
+    changes = []
+    document.bind_changes(changes.append)
+    editor.cursor = editor._cursor_of(0)
+    editor.add_caret(6)
+    editor.add_caret(6)
+    editor.add_caret(11, anchor=13)
+    editor.insert_text('>')
+    assert document.get_text() == '>alpha\n>beta\n>mma\n'
+    assert len(changes) == 1 and len(changes[0]) == 3
+    assert editor.cursor_index() == 1
+    assert editor.carets == [[8, 8], [14, 14]]
+
+    editor.keyboard_on_key_down(None, (8, 'backspace'), None, [])
+    assert document.get_text() == 'alpha\nbeta\nmma\n'
+    assert len(changes) == 2
+    assert editor.history.undo(document.apply)
+    assert document.get_text() == '>alpha\n>beta\n>mma\n'
+
+
+def test_column_selection_edits_every_line(editor):
+    document = editor.document
+    changes = []
+    document.bind_changes(changes.append)
+    editor.cursor = editor._cursor_of(1)
+    editor.extend_column(1)
+    editor.extend_column(1)
+    editor.select_column(0, 2, 1, 3, primary_line=2)
+    editor.insert_text('_')
+    # Columns 1 to 3 of every line
+    assert document.get_text() == 'a_ha\nb_a\ng_ma\n'
+    assert len(changes) == 1
+
+    editor.cursor = editor._cursor_of(1)
+    editor.clear_carets()
+    editor.extend_column(1)
+    editor.extend_column(1)
+    assert editor._column == [0, 2, 1, 1]
+    assert sorted(offset for anchor, offset in editor.carets) == [1, 6]
+    assert editor.cursor_index() == 10
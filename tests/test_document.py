@@ -0,0 +1,131 @@
+import random
+
+import pytest
+
+from document import Document, PieceTable, _merge
+
+ALPHABET = 'ab \n'
+
+
+def _pieces(node, out):
+    """Check the treap invariants of a subtree and collect its pieces in order."""
+    if node is None:
+        return 0, 0
+    for child in (node.left, node.right):
+        assert child is None or child.priority <= node.priority
+    left_size, left_lines = _pieces(node.left, out)
+    assert node.length > 0
+    out.append(node)
+    right_size, right_lines = _pieces(node.right, out)
+    assert node.size == left_size + node.length + right_size
+    assert node.lines == left_lines + node.newlines + right_lines
+    return node.size, node.lines
+
+
+def _check(table, model):
+    pieces = []
+    _pieces(table._root, pieces)
+    for piece in pieces:
+        text = table._read(piece.buf, piece.start, piece.length)
+        assert piece.newlines == text.count('\n')
+    assert table.get_text() == model
+    assert len(table) == len(model)
+    newlines = [index for index, char in enumerate(model) if char == '\n']
+    assert table.line_count() == len(newlines) + 1
+    starts = [0] + [index + 1 for index in newlines]
+    assert [table.line_start(line) for line in range(len(starts))] == starts
+    assert table.line_start(len(starts)) == len(model)
+    for offset in range(len(model) + 1):
+        assert table.line_of_offset(offset) == model.count('\n', 0, offset)
+    return pieces
+
+
+def _text(rng, limit):
+    return ''.join(rng.choice(ALPHABET) for _ in range(rng.randint(1, limit)))
+
+
+@pytest.mark.parametrize('seed', range(20))
+def test_piece_table_matches_str(seed):
+    rng = random.Random(seed)
+    model = _text(rng, 40)
+    table = PieceTable(model)
+    for step in range(200):
+        action = rng.random()
+        if action < 0.3 and table._append_offset >= 0:
+            # Keep typing where the last insertion ended
+            offset = table._append_offset
+            text = _text(rng, 3)
+            table.insert(offset, text)
+            model = model[:offset] + text + model[offset:]
+        elif action < 0.7:
+            offset = rng.randint(0, len(model))
+            text = _text(rng, 8)
+            table.insert(offset, text)
+            model = model[:offset] + text + model[offset:]
+        else:
+            offset = rng.randint(0, len(model))
+            length = rng.randint(0, 10)
+            assert table.delete(offset, length) == model[offset:offset + length]
+            model = model[:offset] + model[offset + length:]
+        start = rng.randint(0, len(model))
+        end = rng.randint(start, len(model))
+        assert table.get_text(start, end) == model[start:end]
+        if step % 10 == 0:
+            _check(table, model)
+    _check(table, model)
+
+
+def test_typing_grows_one_piece():
+    table = PieceTable('first\nsecond\n')
+    table.insert(6, 'x')
+    for offset, char in enumerate('yz\nw', 7):
+        table.insert(offset, char)
+    pieces = _check(table, 'first\nxyz\nwsecond\n')
+    assert len(pieces) == 3
+    assert pieces[1].length == 5 and pieces[1].newlines == 1
+
+    # Typing somewhere else starts a new piece
+    table.insert(0, '>')
+    assert len(_check(table, '>first\nxyz\nwsecond\n')) == 4
+
+
+def test_split_and_merge_round_trip():
+    rng = random.Random(7)
+    model = ''
+    table = PieceTable()
+    for _ in range(50):
+        offset = rng.randint(0, len(model))
+        text = _text(rng, 5)
+        table.insert(offset, text)
+        model = model[:offset] + text + model[offset:]
+    for offset in range(len(model) + 1):
+        left, right = table._split(table._root, offset)
+        assert (left.size if left else 0) == offset
+        assert (left.lines if left else 0) == model.count('\n', 0, offset)
+        table._root = _merge(left, right)
+        _check(table, model)
+
+
+@pytest.mark.parametrize('seed', range(5))
+def test_document_deltas_replay_to_the_text(seed):
+    rng = random.Random(seed)
+    model = _text(rng, 30)
+    document = Document(model)
+    replayed = [model]
+
+    def replay(delta):
+        text = replayed[0]
+        assert text[delta.offset:delta.offset + len(delta.removed)] == delta.removed
+        replayed[0] = text[:delta.offset] + delta.inserted + text[delta.offset + len(delta.removed):]
+
+    document.bind(replay)
+    for _ in range(100):
+        offset = rng.randint(0, len(model))
+        length = rng.randint(0, 6)
+        text = _text(rng, 6) if rng.random() < 0.7 else ''
+        document.replace(offset, length, text)
+        model = model[:offset] + text + model[offset + length:]
+        assert replayed[0] == model
+        line = rng.randrange(document.line_count())
+        assert document.get_line(line) == model.split('\n')[line]
+    assert document.get_text() == model
@@ -0,0 +1,101 @@
+import json
+import time
+
+import pytest
+
+pytest.importorskip('kivy')
+
+from kivy.clock import Clock
+
+from document import Document
+from extension_host import ExtensionHost
+
+TOY = '''\
+import time
+
+log = []
+
+def on_open(document):
+    log.append(('open', document.get_text()))
+    # Slow enough for the edits sent meanwhile to queue up
+    time.sleep(0.5)
+
+def on_change(document, deltas):
+    log.append(('change', document.get_text(), [tuple(delta) for delta in deltas]))
+
+def on_close(document):
+    log.append(('close', document.get_text()))
+
+def on_command(name, args):
+    events = list(log)
+    log.clear()
+    return events
+'''
+
+
+def _wait(results):
+    deadline = time.monotonic() + 30
+    while not results:
+        assert time.monotonic() < deadline, "no reply from the extension host"
+        Clock.tick()
+        time.sleep(0.01)
+    return results.pop(0)
+
+
+@pytest.fixture
+def host(tmp_path):
+    directory = tmp_path / 'extensions' / 'toy'
+    directory.mkdir(parents=True)
+    (directory / 'extension.json').write_text(json.dumps(
+        {'name': 'toy', 'main': 'main.py', 'activation': ['onOpen:*.py', 'onCommand:toy.log']}))
+    (directory / 'main.py').write_text(TOY)
+    host = ExtensionHost(str(tmp_path / 'extensions'))
+    yield host
+    host.close()
+
+
+def test_attach_edit_execute_close(host):
+    document = Document('hello', 'toy.py')
+    host.attach(document)
+    assert host.running and host.activated == {'toy'}
+
+    # Continuous typing is one delta, sent while the worker is busy
+    for offset, character in enumerate(' world', 5):
+        document.insert(offset, character)
+    assert host._pending[id(document)] == [(5, 0, ' world')]
+    host._flush(0)
+    document.replace(0, 5, 'HELLO')
+    host._flush(0)
+
+    results = []
+    host.execute('toy.log', callback=results.append)
+    # Both batches queued during on_open reach the extension as one call
+    assert _wait(results) == [
+        ('open', 'hello'),
+        ('change', 'HELLO world', [(5, 0, ' world'), (0, 5, 'HELLO')]),
+    ]
+
+    # A restarted worker is sent the current text again
+    host._process.kill()
+    while host.running:
+        Clock.tick()
+    document.insert(0, '> ')
+    host.execute('toy.log', callback=results.append)
+    assert host.running
+    assert _wait(results) == [('open', '> HELLO world')]
+
+    # Edits still waiting for the batch interval are sent before close
+    document.insert(len(document.get_text()), '!')
+    host.detach(document)
+    host.execute('toy.log', callback=results.append)
+    assert _wait(results) == [
+        ('change', '> HELLO world!', [(13, 0, '!')]),
+        ('close', '> HELLO world!'),
+    ]
+
+    process = host._process
+    started = time.monotonic()
+    host.close()
+    assert time.monotonic() - started < 0.1
+    process.join(5)
+    assert not process.is_alive()
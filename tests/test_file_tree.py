@@ -0,0 +1,67 @@
+import os
+
+from file_tree import COMPACT_AFTER, NodeTable
+
+
+def _paths(table):
+    return [os.path.relpath(table.path(index), table.root_path) for index in table.rows]
+
+
+def _tree(tmp_path):
+    table = NodeTable(str(tmp_path))
+    table.set_children(0, [('a', True), ('top.txt', False)])
+    a = table.find(str(tmp_path / 'a'))
+    table.set_children(a, [('b', True), ('x.txt', False)])
+    table.expand(a)
+    b = table.find(str(tmp_path / 'a' / 'b'))
+    table.set_children(b, [('deep.txt', False)])
+    table.expand(b)
+    return table
+
+
+def test_relist_keeps_expanded_subtree(tmp_path):
+    table = _tree(tmp_path)
+    before = _paths(table)
+    assert before == ['a', os.path.join('a', 'b'), os.path.join('a', 'b', 'deep.txt'),
+                      os.path.join('a', 'x.txt'), 'top.txt']
+    a = table.find(str(tmp_path / 'a'))
+    # An unchanged listing is a no-op
+    assert table.set_children(a, [('x.txt', False), ('b', True)]) is None
+    assert _paths(table) == before
+
+    row, removed, inserted = table.set_children(a, [('b', True), ('x.txt', False),
+                                                    ('y.txt', False)])
+    assert (row, removed, inserted) == (0, 3, 4)
+    assert _paths(table) == before[:4] + [os.path.join('a', 'y.txt'), 'top.txt']
+    b = table.find(str(tmp_path / 'a' / 'b'))
+    assert table.is_expanded(b)
+    assert table.parent[table.find(str(tmp_path / 'a' / 'b' / 'deep.txt'))] == b
+
+
+def test_removed_entries_drop_their_subtree(tmp_path):
+    table = _tree(tmp_path)
+    a = table.find(str(tmp_path / 'a'))
+    table.set_children(a, [('x.txt', False)])
+    assert _paths(table) == ['a', os.path.join('a', 'x.txt'), 'top.txt']
+    assert table.find(str(tmp_path / 'a' / 'b')) == -1
+    # A directory that comes back is a fresh, collapsed node
+    table.set_children(a, [('b', True), ('x.txt', False)])
+    assert not table.is_loaded(table.find(str(tmp_path / 'a' / 'b')))
+
+
+def test_relists_are_reclaimed(tmp_path):
+    table = _tree(tmp_path)
+    a = table.find(str(tmp_path / 'a'))
+    view = _paths(table)
+    sizes = set()
+    for number in range(3 * COMPACT_AFTER):
+        entries = [('b', True), ('x.txt', False), (f"tmp{number % 2}.txt", False)]
+        change = table.set_children(a, entries)
+        a = table.find(str(tmp_path / 'a'))
+        row, removed, inserted = change
+        # Mirror the change the way the explorer view does
+        view[row + 1:row + 1 + removed] = _paths(table)[row + 1:row + 1 + inserted]
+        assert view == _paths(table)
+        sizes.add(len(table))
+    assert max(sizes) < 2 * COMPACT_AFTER + 20
+    assert table.is_expanded(table.find(str(tmp_path / 'a' / 'b')))
@@ -0,0 +1,39 @@
+import pytest
+
+pytest.importorskip('kivy')
+
+from kivy.config import Config
+
+from governor import PerformanceGovernor
+
+
+class FakeFrames:
+    def __init__(self):
+        self.windows = []
+
+    def percentiles(self, *points, window=None):
+        self.windows.append(window)
+        return [10.0]
+
+
+class FakeStats:
+    def __init__(self):
+        self.frames = FakeFrames()
+
+
+@pytest.fixture
+def maxfps():
+    previous = Config.get('graphics', 'maxfps')
+    yield lambda fps: Config.set('graphics', 'maxfps', str(fps))
+    Config.set('graphics', 'maxfps', previous)
+
+
+def test_window_follows_configured_rate(maxfps):
+    stats = FakeStats()
+    governor = PerformanceGovernor(stats, [])
+    maxfps(60)
+    governor.check(1.0)
+    maxfps(30)
+    governor.check(1.0)
+    governor.check(0.5)
+    assert stats.frames.windows == [60, 30, 15]
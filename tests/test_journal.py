@@ -0,0 +1,76 @@
+import os
+import subprocess
+import sys
+import time
+
+import pytest
+
+pytest.importorskip('kivy')
+
+from document import Document
+from journal import Journal, recover
+
+
+def _dead_pid():
+    process = subprocess.Popen([sys.executable, '-c', ''])
+    process.wait()
+    return process.pid
+
+
+def _wait_for(path, size=1):
+    deadline = time.monotonic() + 5
+    while not (os.path.exists(path) and os.path.getsize(path) >= size):
+        assert time.monotonic() < deadline, f"{path} was never written"
+        time.sleep(0.01)
+
+
+def _crash(journal):
+    """Leave the journal behind as if its process had died."""
+    journal.flush()
+    _wait_for(journal.path)
+    # Let the writer finish the last batch before the file is moved
+    time.sleep(0.1)
+    directory, name = os.path.split(journal.path)
+    os.rename(journal.path, os.path.join(directory, f"{_dead_pid()}-{name.partition('-')[2]}"))
+
+
+def test_crash_recovers_unsaved_edits(tmp_path):
+    document = Document('hello')
+    journal = Journal(document, str(tmp_path))
+    document.insert(5, ' world')
+    document.delete(0, 1)
+    _crash(journal)
+    recovered = recover(str(tmp_path))
+    assert [document.get_text() for document in recovered] == ['ello world']
+    assert recovered[0].modified
+    assert os.listdir(tmp_path) == []
+
+
+def test_clean_close_removes_journal(tmp_path):
+    document = Document('hello')
+    journal = Journal(document, str(tmp_path))
+    document.insert(0, 'x')
+    journal.flush()
+    _wait_for(journal.path)
+    journal.close()
+    assert not os.path.exists(journal.path)
+    time.sleep(0.3)
+    assert os.listdir(tmp_path) == []
+    assert recover(str(tmp_path)) == []
+
+
+def test_untouched_buffer_is_not_recovered(tmp_path):
+    journal = Journal(Document(''), str(tmp_path))
+    _crash(journal)
+    assert recover(str(tmp_path)) == []
+
+
+def test_recovered_buffer_survives_another_crash(tmp_path):
+    document = Document('')
+    journal = Journal(document, str(tmp_path))
+    document.insert(0, 'draft')
+    _crash(journal)
+    recovered, = recover(str(tmp_path))
+    journal = Journal(recovered, str(tmp_path))
+    _crash(journal)
+    assert [document.get_text() for document in recover(str(tmp_path))] == ['draft']
@@ -0,0 +1,61 @@
+import time
+
+import pytest
+
+pytest.importorskip('kivy')
+
+from large_file import CHUNK_SIZE, MappedFile
+
+LINE = b'x' * 99 + b'\n'
+
+
+def _indexed(mapped):
+    deadline = time.monotonic() + 10
+    while not mapped.indexed:
+        assert time.monotonic() < deadline, "the line index was never finished"
+        time.sleep(0.01)
+    return mapped
+
+
+@pytest.fixture
+def path(tmp_path):
+    path = tmp_path / 'big.log'
+    path.write_bytes(LINE * (4 * CHUNK_SIZE // len(LINE)))
+    return path
+
+
+def test_truncated_file_is_remapped(path):
+    mapped = _indexed(MappedFile(str(path)))
+    lines = mapped.line_count()
+    assert mapped.get_line(lines - 2) == 'x' * 99
+
+    with open(path, 'r+b') as target:
+        target.truncate(10 * len(LINE))
+    # Read before the watcher saw the change: remapped, no SIGBUS
+    mapped.get_line(lines - 2)
+    assert mapped.size == 10 * len(LINE)
+    mapped._on_file_changed(str(path))
+    _indexed(mapped)
+    assert mapped.line_count() == 11
+    assert mapped.get_line(9) == 'x' * 99
+    mapped.close()
+
+
+def test_grown_file_is_remapped_on_change(path):
+    mapped = _indexed(MappedFile(str(path)))
+    lines = mapped.line_count()
+    changes = []
+    mapped.bind(changes.append)
+    with open(path, 'ab') as target:
+        target.write(b'tail\n')
+    mapped._on_file_changed(str(path))
+    assert changes == [mapped]
+    _indexed(mapped)
+    assert mapped.line_count() == lines + 1
+    assert mapped.get_line(lines - 1) == 'tail'
+
+    # Unchanged on disk: nothing is mapped again
+    mapped._on_file_changed(str(path))
+    assert changes == [mapped]
+    mapped.close()
+    assert mapped.get_line(0) == ''
@@ -0,0 +1,154 @@
+import pytest
+
+pytest.importorskip('kivy')
+
+from kivy.uix.textinput import FL_IS_LINEBREAK
+
+from document import Document
+from editor import EditorInput
+from line_layout import LineNumberGutter
+
+TEXT = ''.join(f"{number} " + 'wrapped words ' * (number % 7) + '\n' for number in range(400))
+
+
+def _expected(editor):
+    """Line numbers by counting every row, as a reference."""
+    flags = editor._lines_flags
+    first, end = editor._visible_lines_range
+    numbers = []
+    line = 0
+    for row, flag in enumerate(flags[:end]):
+        if row and flag & FL_IS_LINEBREAK:
+            line += 1
+        elif row:
+            continue
+        if row >= first:
+            numbers.append((row, line + 1))
+    return numbers
+
+
+def _show_row(editor, gutter, row):
+    editor.scroll_y = row * (editor.line_height + editor.line_spacing)
+    editor._update_graphics()
+    gutter.redraw()
+    return gutter.visible_numbers()
+
+
+@pytest.fixture
+def editor():
+    editor = EditorInput(document=Document(TEXT), do_wrap=True, size=(300, 400))
+    editor._update_text_options()
+    editor._update_graphics()
+    return editor
+
+
+def test_wrapped_rows_are_numbered_once(editor):
+    gutter = LineNumberGutter(editor)
+    assert len(editor._lines_flags) > editor.document.line_count()
+    continuations = 0
+    # Scroll down row by row, jump back, then forward again
+    for row in [*range(145, 160), 3, 600, 599]:
+        assert _show_row(editor, gutter, row) == _expected(editor)
+        first = editor._visible_lines_range[0]
+        continuations += not editor._lines_flags[first] & FL_IS_LINEBREAK
+    assert continuations
+
+
+def test_edit_before_anchor_renumbers(editor):
+    gutter = LineNumberGutter(editor)
+    _show_row(editor, gutter, 300)
+    editor.apply_edits([(0, 0, 'new\nlines\n')])
+    editor._update_graphics()
+    assert _show_row(editor, gutter, 300) == _expected(editor)
+
+
+def test_unwrapped_rows_are_lines():
+    editor = EditorInput(document=Document(TEXT), do_wrap=False, size=(300, 400))
+    editor._update_text_options()
+    gutter = LineNumberGutter(editor)
+    numbers = _show_row(editor, gutter, 200)
+    assert numbers == _expected(editor)
+    assert all(number == row + 1 for row, number in numbers)
+
+
+def _exact_rows(editor):
+    return editor._split_smart(editor.document.get_text())
+
+
+def _finish_rewrap(editor):
+    steps = 0
+    while editor._rewrap_event is not None:
+        editor._rewrap_step(0)
+        steps += 1
+    return steps
+
+
+def test_resize_wraps_the_view_first_and_the_rest_later():
+    text = TEXT * 5
+    editor = EditorInput(document=Document(text), do_wrap=True, size=(300, 400))
+    editor._update_text_options()
+    _finish_rewrap(editor)
+    editor.cursor = editor.get_cursor_from_index(len(text) // 2)
+    offset = editor.cursor_index()
+
+    editor.size = (220, 400)
+    editor._update_text_options()
+    editor._refresh_text(text)
+    assert editor._rewrap_event is not None
+    exact_lines, exact_flags = _exact_rows(editor)
+    # The rows on screen and around the cursor are already exact
+    first, end = 0, 30
+    assert editor._lines[first:end] == exact_lines[first:end]
+    assert editor.cursor_index() == offset
+    row = editor.cursor_row
+    start = row
+    while start and not editor._lines_flags[start] & FL_IS_LINEBREAK:
+        start -= 1
+    assert ''.join(editor._lines[start:row + 20]) in ''.join(exact_lines)
+
+    assert _finish_rewrap(editor) > 1
+    assert editor._lines == exact_lines
+    assert editor._lines_flags == exact_flags
+    assert editor.cursor_index() == offset
+    assert len(editor._lines_labels) == len(editor._lines_rects) == len(exact_lines)
+
+
+def test_scrolled_rows_are_wrapped_before_drawing():
+    text = TEXT * 5
+    editor = EditorInput(document=Document(text), do_wrap=True, size=(300, 400))
+    editor._update_text_options()
+    _finish_rewrap(editor)
+    editor.size = (220, 400)
+    editor._update_text_options()
+    editor._refresh_text(text)
+    exact_lines, exact_flags = _exact_rows(editor)
+    dy = editor.line_height + editor.line_spacing
+    editor.scroll_y = 1500 * dy
+    editor._update_graphics()
+    first, end = editor._visible_lines_range
+    visible = ''.join(editor._lines[first:end])
+    assert visible in ''.join(exact_lines)
+    start = first
+    while not editor._lines_flags[start] & FL_IS_LINEBREAK:
+        start -= 1
+    # The visible rows match the exact wrap of their logical lines
+    line = editor._lines_flags[:start + 1].count(FL_IS_LINEBREAK)
+    exact_start = [row for row, flag in enumerate(exact_flags) if flag & FL_IS_LINEBREAK][line - 1]
+    assert editor._lines[start:end] == exact_lines[exact_start:exact_start + end - start]
+
+
+def test_wrap_cache_keeps_previous_widths():
+    from line_layout import LineLayoutCache
+    cache = LineLayoutCache()
+
+    def measure(text):
+        return len(text) * 10.0
+
+    def tokenize(line):
+        return line.split(' ')
+
+    for width in (100, 200, 100, 300, 200):
+        cache.wrap('font', width, 'some words here', measure, tokenize)
+    assert cache.cached_wrap('font', 100, 'some words here') is not None
+    assert cache.cached_wrap('font', 200, 'some words here') is not None
+    assert cache.cached_wrap('font', 400, 'some words here') is None
@@ -0,0 +1,45 @@
+import os
+
+import pytest
+
+pytest.importorskip('kivy')
+
+from kivy.clock import Clock
+
+from quick_open import FuzzyFinder
+
+
+def _paths(finder):
+    return sorted(path for path in finder.index.paths if path is not None)
+
+
+def test_relisting_drops_removed_subtrees_and_reports_new_ones():
+    new = []
+    finder = FuzzyFinder(on_new_directory=new.append)
+    # Applied directly rather than through the worker thread
+    finder._update([
+        (os.curdir, [('top.py', False), ('pkg', True)]),
+        ('pkg', [('a.py', False), ('sub', True)]),
+        (os.path.join('pkg', 'sub'), [('b.py', False), ('deep', True)]),
+        (os.path.join('pkg', 'sub', 'deep'), [('c.py', False)]),
+    ])
+    assert _paths(finder) == [os.path.join('pkg', 'a.py'),
+                              os.path.join('pkg', 'sub', 'b.py'),
+                              os.path.join('pkg', 'sub', 'deep', 'c.py'),
+                              'top.py']
+    Clock.tick()
+    assert new == []
+
+    # pkg/sub was renamed to pkg/moved
+    finder._update([('pkg', [('a.py', False), ('moved', True)])])
+    assert _paths(finder) == [os.path.join('pkg', 'a.py'), 'top.py']
+    Clock.tick()
+    assert new == [os.path.join('pkg', 'moved')]
+
+    finder._update([(os.path.join('pkg', 'moved'), [('b.py', False)])])
+    assert _paths(finder) == [os.path.join('pkg', 'a.py'),
+                              os.path.join('pkg', 'moved', 'b.py'), 'top.py']
+
+    # The whole of pkg went away
+    finder._update([('pkg', None)])
+    assert _paths(finder) == ['top.py']
@@ -0,0 +1,43 @@
+import os
+
+import pytest
+
+pytest.importorskip('kivy')
+
+from settings import Settings
+
+
+def _write_keeping_stamp(path, text):
+    """Rewrite `path` as an edit within the mtime granularity would."""
+    info = os.stat(path)
+    with open(path, 'w') as target:
+        target.write(text)
+    os.utime(path, ns=(info.st_atime_ns, info.st_mtime_ns))
+
+
+def test_forced_load_sees_same_size_edit(tmp_path):
+    path = str(tmp_path / 'app.conf')
+    with open(path, 'w') as target:
+        target.write('[Settings]\nundo_budget_mb = 16\n')
+    settings = Settings(path)
+    changes = []
+    settings.bind(changes.append)
+    settings.load()
+
+    _write_keeping_stamp(path, '[Settings]\nundo_budget_mb = 32\n')
+    # Polling trusts the stamp; the watcher event does not
+    assert settings.load() == {}
+    assert settings.load(force=True) == {'undo_budget_mb': 32}
+    assert changes == [{'undo_budget_mb': 32}]
+
+
+def test_forced_load_skips_unchanged_content(tmp_path):
+    path = str(tmp_path / 'app.conf')
+    settings = Settings(path)
+    settings.load()
+    changes = []
+    settings.bind(changes.append)
+    with open(path, 'a') as target:
+        target.write('')
+    assert settings.load(force=True) == {}
+    assert changes == []
@@ -0,0 +1,186 @@
+import ast
+import os
+import shutil
+import time
+from array import array
+from pathlib import Path
+
+import pytest
+
+pytest.importorskip('kivy')
+
+from kivy.clock import Clock
+
+from symbols import CLASS, FUNCTION, METHOD, VARIABLE, SymbolIndex, _Collector
+
+SOURCE = '''\
+import os
+LIMIT = 3
+first, second = 1, 2
+
+class Parser:
+    depth: int = 0
+
+    def parse(self, text):
+        local = os.path.join(text)
+        return self.depth
+
+def parse_all():
+    pass
+'''
+
+
+def _collect(source):
+    collector = _Collector()
+    collector.visit(ast.parse(source))
+    return collector
+
+
+def _wait(results):
+    deadline = time.monotonic() + 30
+    while not results:
+        assert time.monotonic() < deadline, "no result from the symbol index"
+        Clock.tick()
+        time.sleep(0.01)
+    return results.pop(0)
+
+
+@pytest.fixture
+def index(tmp_path):
+    root = tmp_path / 'root'
+    root.mkdir()
+    indexed = []
+    index = SymbolIndex(str(root), path=str(tmp_path / 'symbols.sqlite'), processes=1,
+                        on_indexed=indexed.append)
+    index.indexed = indexed
+    yield index
+    index.close()
+
+
+def _write(path, text):
+    path.write_text(text)
+    # Make sure the stat changes even within the filesystem's granularity
+    info = os.stat(path)
+    os.utime(path, ns=(info.st_atime_ns, info.st_mtime_ns + 1000000000))
+
+
+def test_collector_definitions():
+    definitions = {(name, scope): (kind, line, column)
+                   for name, kind, line, column, scope in _collect(SOURCE).definitions}
+    assert definitions == {
+        ('LIMIT', ''): (VARIABLE, 2, 0),
+        ('first', ''): (VARIABLE, 3, 0),
+        ('second', ''): (VARIABLE, 3, 7),
+        ('Parser', ''): (CLASS, 5, 0),
+        ('depth', 'Parser'): (VARIABLE, 6, 4),
+        ('parse', 'Parser'): (METHOD, 8, 4),
+        ('parse_all', ''): (FUNCTION, 12, 0),
+    }
+
+
+def test_collector_references():
+    references = {name: list(zip(positions[::2], positions[1::2]))
+                  for name, positions in _collect(SOURCE).references.items()}
+    assert references['os'] == [(9, 16)]
+    assert references['join'] == [(9, 24)]
+    assert references['depth'] == [(10, 20)]
+    # Stored names are definitions, not references
+    assert 'local' not in references
+    assert isinstance(_collect(SOURCE).references['os'], array)
+
+
+def test_sync_indexes_only_changed_files(index):
+    root = index.root_path
+    a = os.path.join(root, 'a.py')
+    b = os.path.join(root, 'b.py')
+    with open(a, 'w') as out:
+        out.write('def alpha(): pass\n')
+    with open(b, 'w') as out:
+        out.write('def beta(): pass\n')
+    index.sync()
+    assert sorted(_wait(index.indexed)) == [a, b]
+
+    index.sync()
+    assert _wait(index.indexed) == []
+
+    _write(Path(a), 'def alpha2(): pass\n')
+    os.remove(b)
+    index.sync()
+    assert sorted(_wait(index.indexed)) == [a, b]
+
+    results = []
+    index.find_definitions('alpha2', results.append)
+    assert [(symbol.path, symbol.line) for symbol in _wait(results)] == [(a, 1)]
+    index.find_definitions('beta', results.append)
+    assert _wait(results) == []
+
+
+def test_update_directory_checks_only_that_directory(index, tmp_path):
+    root = tmp_path / 'root'
+    (root / 'pkg').mkdir()
+    (root / 'top.py').write_text('TOP = 1\n')
+    (root / 'pkg' / 'mod.py').write_text('MOD = 1\n')
+    index.sync()
+    _wait(index.indexed)
+
+    _write(root / 'top.py', 'TOP = 2\n')
+    _write(root / 'pkg' / 'mod.py', 'MOD = 22\n')
+    (root / 'pkg' / 'new.py').write_text('NEW = 1\n')
+    index.update_directory(str(root / 'pkg'))
+    assert sorted(_wait(index.indexed)) == [str(root / 'pkg' / 'mod.py'),
+                                            str(root / 'pkg' / 'new.py')]
+
+
+def test_workspace_symbols_prefix_matches_first(index, tmp_path):
+    (tmp_path / 'root' / 'names.py').write_text(
+        'def unparse(): pass\n'
+        'def parse(): pass\n'
+        'class Parser: pass\n'
+        'def reparse_tree(): pass\n'
+    )
+    index.sync()
+    _wait(index.indexed)
+    results = []
+    index.workspace_symbols('PARSE', results.append)
+    names = [symbol.name for symbol in _wait(results)]
+    assert names[:2] == ['parse', 'Parser']
+    assert sorted(names[2:]) == ['reparse_tree', 'unparse']
+
+    index.workspace_symbols('tree', results.append)
+    assert [symbol.name for symbol in _wait(results)] == ['reparse_tree']
+
+
+def test_close_during_indexing(tmp_path):
+    root = tmp_path / 'root'
+    root.mkdir()
+    for number in range(300):
+        (root / f'm{number}.py').write_text(SOURCE * 20)
+    index = SymbolIndex(str(root), path=str(tmp_path / 'symbols.sqlite'), processes=1)
+    index.sync()
+    time.sleep(0.3)
+    started = time.monotonic()
+    index.close()
+    assert time.monotonic() - started < 5
+    assert not any(thread.is_alive() for thread in index._threads)
+
+
+def test_update_directory_follows_removed_and_new_subtrees(index, tmp_path):
+    root = tmp_path / 'root'
+    (root / 'pkg' / 'sub').mkdir(parents=True)
+    (root / 'pkg' / 'sub' / 'm.py').write_text('def gone(): pass\n')
+    index.sync()
+    _wait(index.indexed)
+
+    shutil.rmtree(root / 'pkg' / 'sub')
+    (root / 'pkg' / 'moved' / 'deep').mkdir(parents=True)
+    (root / 'pkg' / 'moved' / 'deep' / 'n.py').write_text('def arrived(): pass\n')
+    index.update_directory(str(root / 'pkg'))
+    assert sorted(_wait(index.indexed)) == [str(root / 'pkg' / 'moved' / 'deep' / 'n.py'),
+                                            str(root / 'pkg' / 'sub' / 'm.py')]
+
+    results = []
+    index.find_definitions('gone', results.append)
+    assert _wait(results) == []
+    index.find_definitions('arrived', results.append)
+    assert [symbol.path for symbol in _wait(results)] == [
+        str(root / 'pkg' / 'moved' / 'deep' / 'n.py')]
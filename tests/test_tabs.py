@@ -0,0 +1,45 @@
+import pytest
+
+pytest.importorskip('kivy')
+
+from document import Document
+from editor import EditorInput
+from tabs import TabManager
+
+
+@pytest.fixture
+def manager(tmp_path, monkeypatch):
+    monkeypatch.setenv('XDG_CACHE_HOME', str(tmp_path))
+    editor = EditorInput(text='scratch')
+    manager = TabManager(editor)
+    yield manager
+    manager.close_all()
+
+
+def test_first_tab_edits_are_recorded_once(manager):
+    editor = manager.editor
+    initial = editor.history
+    manager.add(editor.document)
+    assert initial.document is None
+    editor.document.insert(0, 'x')
+    assert editor.history.position == 1
+    assert len(initial.texts) == 0
+
+
+def test_suspend_keeps_the_unsaved_marker(manager, tmp_path):
+    editor = manager.editor
+    saved = manager.add(Document('saved'))
+    edited = manager.add(Document('edited'))
+    edited.document.insert(0, 'un')
+    manager.activate(saved)
+    assert edited.history is not None
+    edited.suspend(str(tmp_path))
+    saved.document.insert(0, 'x')
+    saved.document.mark_saved()
+    manager.activate(edited)
+    assert editor.document.get_text() == 'unedited'
+    assert editor.document.modified
+    saved.suspend(str(tmp_path))
+    manager.activate(saved)
+    assert editor.document.get_text() == 'xsaved'
+    assert not editor.document.modified
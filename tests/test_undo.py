@@ -0,0 +1,130 @@
+import random
+import sys
+
+import pytest
+
+import undo
+from document import Document
+from undo import ENTRY_OVERHEAD, UndoHistory
+
+# Size of one history entry holding four chars
+ENTRY = sys.getsizeof('abcd') + ENTRY_OVERHEAD
+
+
+@pytest.fixture
+def unmerged(monkeypatch):
+    # Every edit is its own step, whatever the time between them
+    monkeypatch.setattr(undo, 'MERGE_SECONDS', -1.0)
+
+
+def _edit(rng, document):
+    size = len(document)
+    offset = rng.randint(0, size)
+    choice = rng.random()
+    text = ''.join(rng.choice('xy\n') for _ in range(rng.randint(1, 4)))
+    if choice < 0.4:
+        document.insert(offset, text)
+    elif choice < 0.6:
+        document.delete(offset, rng.randint(1, 4))
+    elif choice < 0.8:
+        document.replace(offset, rng.randint(0, 4), text)
+    else:
+        # A transaction of edits spread over the text
+        edits = []
+        for _ in range(rng.randint(2, 4)):
+            edits.append((rng.randint(0, size), rng.randint(0, 2), text))
+            size += len(text) - min(edits[-1][1], size - edits[-1][0])
+        document.apply(edits)
+
+
+@pytest.mark.parametrize('seed', range(10))
+def test_undo_redo_round_trip(unmerged, seed):
+    rng = random.Random(seed)
+    document = Document('some\ntext\n')
+    history = UndoHistory(document)
+    snapshots = [document.get_text()]
+    for _ in range(100):
+        _edit(rng, document)
+        if document.get_text() != snapshots[-1]:
+            snapshots.append(document.get_text())
+
+    undone = [document.get_text()]
+    while history.undo(document.apply):
+        undone.append(document.get_text())
+    assert undone == snapshots[::-1]
+    redone = [document.get_text()]
+    while history.redo(document.apply):
+        redone.append(document.get_text())
+    assert redone == snapshots
+
+    # An edit after undoing drops the steps that could be redone
+    history.undo(document.apply)
+    history.undo(document.apply)
+    document.insert(0, 'new ')
+    assert not history.redo(document.apply)
+    assert history.undo(document.apply)
+    assert document.get_text() == snapshots[-3]
+
+
+def test_typing_merges_until_a_newline():
+    document = Document()
+    history = UndoHistory(document)
+    for offset, char in enumerate('one\ntwo'):
+        document.insert(offset, char)
+    document.delete(6, 1)
+    document.delete(5, 1)
+    # A newline is a step of its own, backspaces merge into one
+    assert history.texts == ['one', '\n', 'two', 'wo']
+    assert history.removed_lengths.tolist() == [0, 0, 0, 2]
+    texts = []
+    while history.undo(document.apply):
+        texts.append(document.get_text())
+    assert texts == ['one\ntwo', 'one\n', 'one', '']
+
+
+def test_trim_at_the_budget_boundary(unmerged):
+    document = Document()
+    history = UndoHistory(document, budget=4 * ENTRY)
+    snapshots = [document.get_text()]
+    for _ in range(4):
+        document.insert(len(document), 'abcd')
+        snapshots.append(document.get_text())
+    # Exactly at the budget nothing is dropped
+    assert history.size == 4 * ENTRY
+    assert history.evicted == 0
+
+    document.insert(len(document), 'abcd')
+    snapshots.append(document.get_text())
+    # Past it, the oldest steps go until the size is down to EVICT_TO
+    assert history.size <= 4 * ENTRY * undo.EVICT_TO
+    assert history.evicted == 2
+    assert len(history.texts) == history.position == 3
+
+    while history.undo(document.apply):
+        pass
+    assert document.get_text() == snapshots[history.evicted]
+    while history.redo(document.apply):
+        pass
+    assert document.get_text() == snapshots[-1]
+
+
+def test_trim_keeps_transactions_whole(unmerged):
+    document = Document('0123456789')
+    history = UndoHistory(document, budget=6 * ENTRY)
+    document.insert(0, 'abcd')
+    document.apply([(0, 0, 'abcd'), (10, 0, 'abcd'), (20, 0, 'abcd')])
+    after_transaction = document.get_text()
+    history.mark_saved()
+    for _ in range(2):
+        document.insert(0, 'abcd')
+    assert history.evicted == 0
+    document.insert(0, 'abcd')
+
+    # Eviction would have stopped inside the transaction, it takes all of it
+    assert history.evicted == 4
+    assert history.linked[0] == 0
+    assert history.saved_points == [4]
+    while history.undo(document.apply):
+        pass
+    assert document.get_text() == after_transaction
+    assert history.is_saved()
@@ -0,0 +1,92 @@
+from collections import namedtuple
+from functools import lru_cache
+
+from kivy.graphics import Color, Rectangle
+
+# Colors derived from one background color; computed once per color
+Palette = namedtuple('Palette', 'background foreground brightness')
+
+
+@lru_cache(maxsize=64)
+def hex_to_rgb(hex_color):
+    """Convert a hex color string to an RGB tuple (0-1 floats)."""
+    hex_color = hex_color.lstrip('#')
+    if len(hex_color) == 6:
+        r, g, b = hex_color[0:2], hex_color[2:4], hex_color[4:6]
+    elif len(hex_color) == 3:
+        r, g, b = hex_color[0] * 2, hex_color[1] * 2, hex_color[2] * 2
+    else:
+        raise ValueError("Invalid hex color format")
+    return (int(r, 16) / 255, int(g, 16) / 255, int(b, 16) / 255)
+
+
+@lru_cache(maxsize=64)
+def get_brightness(hex_color):
+    """Brightness of a hex color, from 0 (dark) to 1 (bright)."""
+    r, g, b = hex_to_rgb(hex_color)
+    return r * 0.299 + g * 0.587 + b * 0.114
+
+
+@lru_cache(maxsize=64)
+def palette_for(background_color):
+    brightness = get_brightness(background_color)
+    # Light text on dark backgrounds, dark text on light ones
+    foreground = (1, 1, 1, 1) if brightness < 0.5 else (0, 0, 0, 1)
+    return Palette(hex_to_rgb(background_color) + (1,), foreground, brightness)
+
+
+class Theme:
+    """Owns a fixed set of named canvas instructions and recolors them.
+
+    Each `add_rect` creates one Color and one Rectangle, once; geometry
+    follows the widget through bindings and `apply` only changes the
+    `rgba` of the existing Color. The number of instructions therefore
+    stays the same however often the theme is applied.
+    """
+
+    def __init__(self):
+        self._colors = {}
+        self._rects = {}
+        # Names whose color follows the palette background
+        self._themed = []
+        self._listeners = []
+        self.palette = None
+
+    def add_rect(self, name, widget, rgba=None):
+        """Fill `widget` with a rectangle; `rgba` None follows the palette."""
+        with widget.canvas.before:
+            color = Color(*(rgba or (1, 1, 1, 1)))
+            rect = Rectangle(pos=widget.pos, size=widget.size)
+        self._colors[name] = color
+        self._rects[name] = rect
+        widget.bind(pos=self._update_geometry(rect, 'pos'),
+                    size=self._update_geometry(rect, 'size'))
+        if rgba is None:
+            self._themed.append(name)
+            if self.palette is not None:
+                color.rgba = self.palette.background
+
+    @staticmethod
+    def _update_geometry(rect, attribute):
+        def update(instance, value):
+            setattr(rect, attribute, value)
+        return update
+
+    def set_rgba(self, name, rgba):
+        self._colors[name].rgba = rgba
+
+    def bind(self, callback):
+        """Call `callback(palette)` whenever a different palette is applied."""
+        self._listeners.append(callback)
+        if self.palette is not None:
+            callback(self.palette)
+
+    def apply(self, background_color):
+        palette = palette_for(background_color)
+        if palette is self.palette:
+            return
+        self.palette = palette
+        for name in self._themed:
+            self._colors[name].rgba = palette.background
+        for callback in self._listeners:
+            callback(palette)
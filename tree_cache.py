@@ -0,0 +1,121 @@
+import hashlib
+import os
+import struct
+
+from paths import cache_dir
+
+MAGIC = b'CSTC'
+FORMAT_VERSION = 2
+
+_header = struct.Struct('<4sHI')
+_record = struct.Struct('<qQI')
+_length = struct.Struct('<H')
+
+
+class TreeCache:
+    """On-disk index of a directory tree for instant explorer startup.
+
+    Records map a directory path (relative to the root) to
+    (mtime_ns, inode, entries). Entries are a list of (name, is_dir)
+    tuples, or still-packed bytes for records loaded from disk that have
+    not been looked at yet; `unpack_entries` turns either into a list.
+    The file is a flat length-prefixed binary format:
+
+        header:  magic, format version, record count
+        record:  path, mtime_ns, inode, entry block length, entry block
+
+    where the path is a u16 length plus UTF-8 bytes and the entry block is
+    the UTF-8 encoding of 'd' or 'f' prefixed names joined by NUL, so a
+    warm start only has to index paths and decodes blocks on demand.
+    """
+
+    def __init__(self, root_path, path=None):
+        self.root_path = root_path
+        if path is None:
+            key = hashlib.sha1(os.path.abspath(root_path).encode('utf-8', 'surrogateescape')).hexdigest()
+            path = os.path.join(cache_dir(), f'tree-{key[:16]}.bin')
+        self.path = path
+
+    def load(self):
+        """Return the cached records, or an empty dict if there is no valid cache."""
+        try:
+            with open(self.path, 'rb') as cache_file:
+                data = cache_file.read()
+        except OSError:
+            return {}
+        try:
+            return self._parse(data)
+        except (struct.error, UnicodeDecodeError, ValueError):
+            print(f"Ignoring corrupt tree cache {self.path}")
+            return {}
+
+    def _parse(self, data):
+        magic, version, count = _header.unpack_from(data, 0)
+        if magic != MAGIC or version != FORMAT_VERSION:
+            return {}
+        offset = _header.size
+        records = {}
+        for _ in range(count):
+            path, offset = _read_string(data, offset)
+            mtime, inode, block_length = _record.unpack_from(data, offset)
+            offset += _record.size
+            records[path] = (mtime, inode, data[offset:offset + block_length])
+            offset += block_length
+        return records
+
+    def save(self, records):
+        """Write `records` atomically next to the old cache file."""
+        chunks = [_header.pack(MAGIC, FORMAT_VERSION, len(records))]
+        for path, (mtime, inode, entries) in records.items():
+            block = pack_entries(entries)
+            chunks.append(_pack_string(path))
+            chunks.append(_record.pack(mtime, inode, len(block)))
+            chunks.append(block)
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        temp_path = self.path + '.tmp'
+        with open(temp_path, 'wb') as cache_file:
+            cache_file.write(b''.join(chunks))
+        os.replace(temp_path, self.path)
+
+    def stale_paths(self, records):
+        """Return the cached directories whose mtime or inode changed on disk.
+
+        Only the directories themselves are stat'ed, never their files.
+        """
+        stale = []
+        for path, (mtime, inode, entries) in records.items():
+            try:
+                info = os.stat(os.path.join(self.root_path, path))
+            except OSError:
+                stale.append(path)
+                continue
+            if info.st_mtime_ns != mtime or info.st_ino != inode:
+                stale.append(path)
+        return stale
+
+
+def pack_entries(entries):
+    if isinstance(entries, bytes):
+        return entries
+    return '\0'.join(('d' if is_dir else 'f') + name for name, is_dir in entries).encode(
+        'utf-8', 'surrogateescape')
+
+
+def unpack_entries(entries):
+    if not isinstance(entries, bytes):
+        return entries
+    if not entries:
+        return []
+    return [(item[1:], item[0] == 'd')
+            for item in entries.decode('utf-8', 'surrogateescape').split('\0')]
+
+
+def _pack_string(text):
+    data = text.encode('utf-8', 'surrogateescape')
+    return _length.pack(len(data)) + data
+
+
+def _read_string(data, offset):
+    (size,) = _length.unpack_from(data, offset)
+    offset += _length.size
+    return data[offset:offset + size].decode('utf-8', 'surrogateescape'), offset + size
@@ -0,0 +1,258 @@
+import sys
+import time
+from array import array
+
+# Edits this close together and next to each other are one undo step
+MERGE_SECONDS = 1.0
+DEFAULT_BUDGET = 16 * 1024 * 1024
+# Array slots per entry, on top of the size of its text
+ENTRY_OVERHEAD = 2 * 8 + 1 + 8
+# Eviction frees down to this share of the budget so it runs rarely
+EVICT_TO = 0.75
+
+
+def _trim(offset, removed, inserted):
+    """Drop the text a replace left unchanged at both ends."""
+    # Binary searches over slice comparisons, so a whole-text replace
+    # costs a few memcmp calls instead of a loop over every char
+    low, high = 0, min(len(removed), len(inserted))
+    while low < high:
+        middle = (low + high + 1) // 2
+        if removed.startswith(inserted[low:middle], low):
+            low = middle
+        else:
+            high = middle - 1
+    start = low
+    low, high = 0, min(len(removed), len(inserted)) - start
+    while low < high:
+        middle = (low + high + 1) // 2
+        if removed.endswith(inserted[len(inserted) - middle:len(inserted) - low],
+                            0, len(removed) - low):
+            low = middle
+        else:
+            high = middle - 1
+    end = low
+    return (offset + start, removed[start:len(removed) - end],
+            inserted[start:len(inserted) - end])
+
+
+class UndoHistory:
+    """Undo and redo steps of a document as compact delta records.
+
+    Entry i is `offsets[i]`, `removed_lengths[i]` and `texts[i]`, the
+    removed text followed by the inserted text. Entries before `position`
+    can be undone, the ones after it redone. Runs of typing, backspace or
+    delete merge into one entry; the deltas of one document transaction
+    are one step, entries with `linked[i]` set belong to the step of the
+    entry before them. Once the estimated size passes `budget` bytes the
+    oldest steps are dropped; `evicted` counts their entries so saved
+    points, kept as absolute positions, stay valid.
+    """
+
+    def __init__(self, document, budget=DEFAULT_BUDGET):
+        self.document = None
+        self.budget = budget
+        self.offsets = array('q')
+        self.removed_lengths = array('q')
+        self.linked = array('b')
+        self.texts = []
+        self.position = 0
+        self.size = 0
+        self.evicted = 0
+        self.saved_points = []
+        self._applying = False
+        self._sealed = False
+        self._last_time = 0.0
+        self.attach(document)
+
+    def attach(self, document):
+        if self.document is not None:
+            self.document.unbind_changes(self.on_changes)
+        self.document = document
+        document.bind_changes(self.on_changes)
+
+    def detach(self):
+        if self.document is not None:
+            self.document.unbind_changes(self.on_changes)
+            self.document = None
+
+    def clear(self):
+        self.offsets = array('q')
+        self.removed_lengths = array('q')
+        self.linked = array('b')
+        self.texts = []
+        self.position = 0
+        self.size = 0
+        self.evicted = 0
+        self.saved_points = []
+
+    def mark_saved(self):
+        """Remember the current position as a point `jump` can return to."""
+        position = self.evicted + self.position
+        if position not in self.saved_points:
+            self.saved_points.append(position)
+        self._sealed = True
+
+    def is_saved(self):
+        return self.evicted + self.position in self.saved_points
+
+    def _entry_size(self, text):
+        return sys.getsizeof(text) + ENTRY_OVERHEAD
+
+    def on_changes(self, deltas):
+        if self._applying:
+            return
+        if len(deltas) == 1:
+            self.on_delta(deltas[0])
+            return
+        # A transaction: one step, never merged with its neighbours
+        linked = 0
+        for delta in deltas:
+            offset, removed, inserted = delta
+            if removed and inserted:
+                offset, removed, inserted = _trim(offset, removed, inserted)
+                if not removed and not inserted:
+                    continue
+            if self.position < len(self.texts):
+                self._drop_redo()
+            self._append(offset, removed, inserted, linked)
+            linked = 1
+        self._sealed = True
+        if self.size > self.budget:
+            self._evict()
+
+    def on_delta(self, delta):
+        offset, removed, inserted = delta
+        if removed and inserted:
+            offset, removed, inserted = _trim(offset, removed, inserted)
+            if not removed and not inserted:
+                return
+        if self.position < len(self.texts):
+            self._drop_redo()
+        now = time.monotonic()
+        if not self._merge(offset, removed, inserted, now):
+            self._append(offset, removed, inserted, 0)
+        self._sealed = False
+        self._last_time = now
+        if self.size > self.budget:
+            self._evict()
+
+    def _append(self, offset, removed, inserted, linked):
+        text = removed + inserted
+        self.offsets.append(offset)
+        self.removed_lengths.append(len(removed))
+        self.linked.append(linked)
+        self.texts.append(text)
+        self.position += 1
+        self.size += self._entry_size(text)
+
+    def _merge(self, offset, removed, inserted, now):
+        if (self._sealed or not self.texts or now - self._last_time > MERGE_SECONDS
+                or self.is_saved()):
+            return False
+        last = len(self.texts) - 1
+        text = self.texts[last]
+        last_offset = self.offsets[last]
+        last_removed = self.removed_lengths[last]
+        if not removed and not last_removed:
+            # Typing: continue the insertion, but start a new step per line
+            if offset != last_offset + len(text) or '\n' in inserted or text.endswith('\n'):
+                return False
+            merged = text + inserted
+        elif not inserted and len(text) == last_removed:
+            if offset + len(removed) == last_offset:
+                # Backspace: the removed text grows to the left
+                merged = removed + text
+                self.offsets[last] = offset
+            elif offset == last_offset:
+                # Delete: it grows to the right
+                merged = text + removed
+            else:
+                return False
+            self.removed_lengths[last] = last_removed + len(removed)
+        else:
+            return False
+        self.size += self._entry_size(merged) - self._entry_size(text)
+        self.texts[last] = merged
+        return True
+
+    def _drop_redo(self):
+        for text in self.texts[self.position:]:
+            self.size -= self._entry_size(text)
+        del self.offsets[self.position:]
+        del self.removed_lengths[self.position:]
+        del self.linked[self.position:]
+        del self.texts[self.position:]
+        # Saved points past here can no longer be reached
+        end = self.evicted + self.position
+        self.saved_points = [point for point in self.saved_points if point <= end]
+
+    def _evict(self):
+        target = self.budget * EVICT_TO
+        count = 0
+        # Whole steps only: never leave a linked entry at the start
+        while count < self.position and (self.size > target or self.linked[count]):
+            self.size -= self._entry_size(self.texts[count])
+            count += 1
+        if count:
+            del self.offsets[:count]
+            del self.removed_lengths[:count]
+            del self.linked[:count]
+            del self.texts[:count]
+            self.position -= count
+            self.evicted += count
+            self.saved_points = [point for point in self.saved_points if point >= self.evicted]
+
+    def undo(self, apply):
+        """Undo one step with `apply(edits)`; False at the start.
+
+        `edits` are `(offset, length, text)` replacements to make in order,
+        as taken by `Document.apply`.
+        """
+        if not self.position:
+            return False
+        edits = []
+        while True:
+            self.position -= 1
+            index = self.position
+            removed_length = self.removed_lengths[index]
+            text = self.texts[index]
+            edits.append((self.offsets[index], len(text) - removed_length,
+                          text[:removed_length]))
+            if not self.linked[index]:
+                break
+        self._apply(apply, edits)
+        return True
+
+    def redo(self, apply):
+        if self.position >= len(self.texts):
+            return False
+        edits = []
+        while True:
+            index = self.position
+            self.position += 1
+            removed_length = self.removed_lengths[index]
+            text = self.texts[index]
+            edits.append((self.offsets[index], removed_length, text[removed_length:]))
+            if self.position >= len(self.texts) or not self.linked[self.position]:
+                break
+        self._apply(apply, edits)
+        return True
+
+    def _apply(self, apply, edits):
+        self._applying = True
+        try:
+            apply(edits)
+        finally:
+            self._applying = False
+            self._sealed = True
+        if self.is_saved() and self.document is not None:
+            self.document.mark_saved()
+
+    def jump(self, point, apply):
+        """Undo or redo to the absolute position `point`, e.g. a saved point."""
+        point = max(self.evicted, min(point, self.evicted + len(self.texts)))
+        while self.evicted + self.position > point:
+            self.undo(apply)
+        while self.evicted + self.position < point:
+            self.redo(apply)
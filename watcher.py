@@ -0,0 +1,217 @@
+import ctypes
+import ctypes.util
+import os
+import select
+import struct
+import sys
+import threading
+
+from kivy.clock import Clock
+
+# inotify event bits (see inotify(7))
+IN_MODIFY = 0x00000002
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_IGNORED = 0x00008000
+IN_CLOEXEC = 0o2000000
+IN_NONBLOCK = 0o4000
+
+WATCH_MASK = (IN_MODIFY | IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO
+              | IN_CREATE | IN_DELETE | IN_DELETE_SELF | IN_MOVE_SELF)
+
+_event = struct.Struct('iIII')
+
+
+class _Inotify:
+    """Thin ctypes wrapper around the Linux inotify calls."""
+
+    def __init__(self):
+        libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+        self._add_watch = libc.inotify_add_watch
+        self._add_watch.argtypes = (ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32)
+        self._rm_watch = libc.inotify_rm_watch
+        self._rm_watch.argtypes = (ctypes.c_int, ctypes.c_int)
+        self.fd = libc.inotify_init1(IN_CLOEXEC | IN_NONBLOCK)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), 'inotify_init1 failed')
+
+    def add_watch(self, path):
+        wd = self._add_watch(self.fd, os.fsencode(path), WATCH_MASK)
+        if wd < 0:
+            raise OSError(ctypes.get_errno(), f'inotify_add_watch failed for {path}')
+        return wd
+
+    def rm_watch(self, wd):
+        self._rm_watch(self.fd, wd)
+
+    def read_events(self):
+        """Yield (wd, mask, name) for every pending event."""
+        try:
+            data = os.read(self.fd, 64 * 1024)
+        except BlockingIOError:
+            return
+        offset = 0
+        while offset < len(data):
+            wd, mask, cookie, length = _event.unpack_from(data, offset)
+            offset += _event.size
+            name = data[offset:offset + length].rstrip(b'\0')
+            offset += length
+            yield wd, mask, os.fsdecode(name)
+
+
+class FileWatcher:
+    """Delivers file system changes to subscribers on the main thread.
+
+    Subscribers call `watch(path, callback)` for a file or a directory.
+    Changes are coalesced for `delay` seconds and each callback is then
+    called once with the watched path. On Linux the watcher blocks on
+    inotify, so it never wakes up while nothing changes; elsewhere it
+    falls back to stat polling every `poll_interval` seconds.
+    """
+
+    def __init__(self, delay=0.05, poll_interval=1.0):
+        self.delay = delay
+        self.poll_interval = poll_interval
+        # watched path -> list of callbacks
+        self._subscribers = {}
+        # directory -> inotify watch descriptor, and the reverse
+        self._dir_watches = {}
+        self._wd_dirs = {}
+        self._pending = set()
+        self._lock = threading.Lock()
+        self._flush_event = None
+        self._poll_event = None
+        self._poll_state = {}
+        self._inotify = None
+        if sys.platform.startswith('linux'):
+            try:
+                self._inotify = _Inotify()
+            except (OSError, AttributeError) as error:
+                print(f"inotify unavailable, polling for changes instead: {error}")
+        if self._inotify is not None:
+            self._stop_read, self._stop_write = os.pipe()
+            threading.Thread(target=self._read_loop, daemon=True).start()
+
+    def watch(self, path, callback):
+        path = os.path.abspath(path)
+        callbacks = self._subscribers.setdefault(path, [])
+        if callback in callbacks:
+            return
+        callbacks.append(callback)
+        if self._inotify is None:
+            self._poll_state[path] = _stat_key(path)
+            if self._poll_event is None:
+                self._poll_event = Clock.schedule_interval(self._poll, self.poll_interval)
+            return
+        # Files are watched through their directory so that editors which
+        # save by renaming a temp file over the original are still seen
+        directory = path if os.path.isdir(path) else os.path.dirname(path)
+        if directory not in self._dir_watches:
+            try:
+                wd = self._inotify.add_watch(directory)
+            except OSError as error:
+                print(f"Cannot watch {directory}: {error}")
+                return
+            with self._lock:
+                self._dir_watches[directory] = wd
+                self._wd_dirs[wd] = directory
+
+    def unwatch(self, path, callback):
+        path = os.path.abspath(path)
+        callbacks = self._subscribers.get(path)
+        if not callbacks or callback not in callbacks:
+            return
+        callbacks.remove(callback)
+        if callbacks:
+            return
+        del self._subscribers[path]
+        self._poll_state.pop(path, None)
+        if self._inotify is None:
+            return
+        directory = path if path in self._dir_watches else os.path.dirname(path)
+        still_used = any(p == directory or os.path.dirname(p) == directory
+                         for p in self._subscribers)
+        if not still_used and directory in self._dir_watches:
+            with self._lock:
+                wd = self._dir_watches.pop(directory)
+                self._wd_dirs.pop(wd, None)
+            self._inotify.rm_watch(wd)
+
+    def stop(self):
+        if self._inotify is not None:
+            os.write(self._stop_write, b'x')
+        if self._poll_event is not None:
+            self._poll_event.cancel()
+            self._poll_event = None
+
+    def _read_loop(self):
+        fd = self._inotify.fd
+        while True:
+            ready, _, _ = select.select([fd, self._stop_read], [], [])
+            if self._stop_read in ready:
+                return
+            changed = []
+            with self._lock:
+                for wd, mask, name in self._inotify.read_events():
+                    directory = self._wd_dirs.get(wd)
+                    if directory is None:
+                        continue
+                    if mask & IN_IGNORED:
+                        # The directory itself went away
+                        self._dir_watches.pop(directory, None)
+                        self._wd_dirs.pop(wd, None)
+                    changed.append(directory)
+                    if name:
+                        changed.append(os.path.join(directory, name))
+            if changed:
+                self._queue(changed)
+
+    def _queue(self, paths):
+        # Coalesce a burst of events into one delivery per watched path
+        with self._lock:
+            first = not self._pending
+            self._pending.update(paths)
+        if first:
+            Clock.schedule_once(self._flush, self.delay)
+
+    def _flush(self, dt):
+        with self._lock:
+            pending, self._pending = self._pending, set()
+        for path in pending:
+            for callback in list(self._subscribers.get(path, ())):
+                callback(path)
+
+    def _poll(self, dt):
+        changed = []
+        for path, key in self._poll_state.items():
+            new_key = _stat_key(path)
+            if new_key != key:
+                self._poll_state[path] = new_key
+                changed.append(path)
+        if changed:
+            self._queue(changed)
+
+
+def _stat_key(path):
+    try:
+        info = os.stat(path)
+    except OSError:
+        return None
+    return info.st_mtime_ns, info.st_size, info.st_ino
+
+
+_watcher = None
+
+
+def get_watcher():
+    """Return the process-wide watcher, creating it on first use."""
+    global _watcher
+    if _watcher is None:
+        _watcher = FileWatcher()
+    return _watcher
@@ -0,0 +1,46 @@
+"""Process context for worker pools and processes.
+
+Workers are started through a fork server instead of being forked from
+the UI process: the watcher, scanner, journal and Clock threads may hold
+a lock at the moment of a fork, and the child would wait on it forever.
+The server is a fresh single-threaded interpreter, so starting a worker
+from it is still a cheap fork.
+"""
+import multiprocessing
+import os
+from multiprocessing import forkserver
+
+# Environment of the fork server and so of every worker. multiprocessing
+# imports the main script again in each worker; with KIVY_DOC set, Kivy
+# then loads without creating a window or any other provider, the way it
+# is imported to build its documentation.
+WORKER_ENVIRONMENT = {
+    'KIVY_DOC': '1',
+    'KIVY_NO_ARGS': '1',
+    'KIVY_NO_CONSOLELOG': '1',
+    'KIVY_NO_FILELOG': '1',
+}
+
+_context = None
+
+
+def get_context():
+    """The forkserver context, starting the server on first use."""
+    global _context
+    if _context is None:
+        context = multiprocessing.get_context('forkserver')
+        context.set_forkserver_preload([])
+        # Set only while the server starts: Kivy modules the editor
+        # imports later must not see them
+        saved = {name: os.environ.get(name) for name in WORKER_ENVIRONMENT}
+        os.environ.update(WORKER_ENVIRONMENT)
+        try:
+            forkserver.ensure_running()
+        finally:
+            for name, value in saved.items():
+                if value is None:
+                    del os.environ[name]
+                else:
+                    os.environ[name] = value
+        _context = context
+    return _context